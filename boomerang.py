@@ -1,136 +1,166 @@
-import json
-import geoip2.database
-from collections import defaultdict
-from tqdm import tqdm
-import psutil
-
-# File paths (adjust as needed)
-TRACEROUTE_PATH = r'E:\internet-graph-master\dataset\traceroute-2024-10-01T0000'
-GEOIP2_PATH = r'E:\internet-graph-master\dataset\GeoIP2-City.mmdb'
-
-# Constants
-MAX_RAM_USAGE_RATIO = 0.75  # Use max 75% of available RAM
-
-# Data Privacy Laws Mapping
-LEGAL_FRAMEWORKS = {
-    "GDPR": ["AT", "BE", "BG", "HR", "CY", "CZ", "DK", "EE", "FI", "FR", "DE", "GR", "HU", "IS", "IE", "IT", 
-             "LV", "LI", "LT", "LU", "MT", "NL", "NO", "PL", "PT", "RO", "SK", "SI", "ES", "SE", "CH"],
-    "CCPA": ["US"],  # USA, focused primarily on California
-    "PIPEDA": ["CA"],  # Canada
-    "LGPD": ["BR"],  # Brazil
-    "APPI": ["JP"],  # Japan
-    "PDPA": ["SG", "TH", "MY"],  # Singapore, Thailand, Malaysia
-    "Other": []  # Placeholder for countries not covered by specific laws
-}
-
-# Function to check current memory usage and halt processing if memory exceeds limit
-def check_memory():
-    mem = psutil.virtual_memory()
-    return mem.percent / 100 < MAX_RAM_USAGE_RATIO
-
-# GeoIP reader
-geoip_reader = geoip2.database.Reader(GEOIP2_PATH)
-
-# Initialize statistics storage per legal framework
-framework_stats = defaultdict(lambda: defaultdict(int))
-
-# 1. Helper function to get country and its legal framework from IP address
-def get_country_and_framework(ip_address):
-    try:
-        response = geoip_reader.city(ip_address)
-        country = response.country.iso_code
-        for framework, countries in LEGAL_FRAMEWORKS.items():
-            if country in countries:
-                return framework, country
-        return "Other", country  # If no framework matches, label as "Other"
-    except Exception:
-        return None, None
-
-# 2. Traceroute Data Parsing with variable structure handling and progress display
-def parse_traceroute_data(file_path):
-    # Get total lines with latin-1 encoding to handle mixed characters
-    total_lines = sum(1 for _ in open(file_path, 'r', encoding='latin-1'))
-
-    with open(file_path, 'r', encoding='latin-1') as file, tqdm(total=total_lines, desc="Processing traceroute data") as pbar:
-        for line in file:
-            if not check_memory():
-                break  # Stop if RAM usage exceeds limit
-
-            try:
-                record = json.loads(line)
-
-                # Check if the necessary fields are present before processing
-                if 'src_addr' not in record or 'dst_addr' not in record or 'af' not in record:
-                    pbar.update(1)
-                    continue  # Skip this line if critical data is missing
-
-                src_ip = record['src_addr']
-                dst_ip = record['dst_addr']
-                af = 'IPv4' if record['af'] == 4 else 'IPv6'
-
-                # Determine the legal framework and country for source and destination IPs
-                src_framework, src_country = get_country_and_framework(src_ip)
-                dst_framework, dst_country = get_country_and_framework(dst_ip)
-
-                # If either source or destination is not associated with a legal framework, skip this line
-                if src_framework is None or dst_framework is None:
-                    pbar.update(1)
-                    continue
-                
-                # Update IP counts by legal framework and type
-                framework_stats[src_framework][f"Unique_{af}_as_source"] += 1
-                framework_stats[dst_framework][f"Unique_{af}_as_destination"] += 1
-
-                # Analyze hops if they are available
-                foreign_hop = False
-                if 'result' in record:
-                    for hop in record['result']:
-                        if 'result' not in hop:
-                            continue  # Skip this hop if no 'result' field is present
-                        
-                        for result in hop['result']:
-                            hop_ip = result.get('from')
-                            if hop_ip:
-                                hop_framework, hop_country = get_country_and_framework(hop_ip)
-                                if hop_framework != src_framework:
-                                    foreign_hop = True  # Foreign hop detected
-                                framework_stats[src_framework][f"Unique_{af}_in_hops"] += 1
-
-                # Path classification for boomerang and non-boomerang paths
-                framework_stats[src_framework]["Total_paths"] += 1
-                if src_framework == dst_framework:
-                    framework_stats[src_framework]["Intra-framework_paths"] += 1
-                    if foreign_hop:
-                        framework_stats[src_framework]["Boomerang_paths"] += 1
-                    else:
-                        framework_stats[src_framework]["No_foreign_hop_paths"] += 1
-
-            except (json.JSONDecodeError, TypeError):
-                continue  # Skip lines that are invalid JSON or have incompatible types
-
-            pbar.update(1)  # Update progress bar
-
-
-# Execute function to parse traceroute data
-parse_traceroute_data(TRACEROUTE_PATH)
-
-# Close GeoIP reader
-geoip_reader.close()
-
-# 3. Format and display results
-def display_statistics(framework_stats):
-    for framework, stats in framework_stats.items():
-        print(f"Legal Framework: {framework}")
-        print(f"  Unique IPv4 as source: {stats['Unique_IPv4_as_source']}")
-        print(f"  Unique IPv6 as source: {stats['Unique_IPv6_as_source']}")
-        print(f"  Total unique IP addresses as source: {stats['Unique_IPv4_as_source'] + stats['Unique_IPv6_as_source']}")
-        print(f"  Unique IPv4 in hops: {stats['Unique_IPv4_in_hops']}")
-        print(f"  Unique IPv6 in hops: {stats['Unique_IPv6_in_hops']}")
-        print(f"  Unique IPv4 as destination: {stats['Unique_IPv4_as_destination']}")
-        print(f"  Unique IPv6 as destination: {stats['Unique_IPv6_as_destination']}")
-        print(f"  Unique paths with same source and destination framework: {stats['Intra-framework_paths']}")
-        print(f"  Unique paths with same source and destination framework but at least one foreign hop: {stats['Boomerang_paths']}")
-        print(f"  Unique paths with same source and destination framework and no foreign hops: {stats['No_foreign_hop_paths']}")
-
-# Run display
-display_statistics(framework_stats)
+from collections import defaultdict
+import logging
+import numpy as np
+from tqdm import tqdm
+import psutil
+from traceroute_index import count_lines
+from geolocation import GeoLocator
+from location_table import LocationKeys, load_location_table
+from probe_table import ProbeTable
+from jurisdictions import UNKNOWN, has_foreign, load_jurisdictions
+from traceroute_reader import read_traceroutes
+
+# File paths (adjust as needed)
+TRACEROUTE_PATH = r'E:\internet-graph-master\dataset\traceroute-2024-10-01T0000'
+GEOIP2_PATH = r'E:\internet-graph-master\dataset\GeoIP2-City.mmdb'
+PROBE_ARCHIVE_PATH = None  # Optional RIPE Atlas probe archive (see probe_table.py)
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+# Constants
+MAX_RAM_USAGE_RATIO = 0.75  # Use max 75% of available RAM
+PATH_BATCH_SIZE = 100000  # Paths classified at once
+
+# Data privacy laws mapping (see jurisdictions.json); countries covered by no specific law are "Other"
+jurisdiction_model = load_jurisdictions()
+
+# Function to check current memory usage and halt processing if memory exceeds limit
+def check_memory():
+    mem = psutil.virtual_memory()
+    return mem.percent / 100 < MAX_RAM_USAGE_RATIO
+
+# GeoIP reader, cached per network block
+geoip_reader = GeoLocator(GEOIP2_PATH)
+
+# Initialize statistics storage per legal framework (keyed by framework id, see framework_ids)
+framework_stats = defaultdict(lambda: defaultdict(int))
+
+# 1. Helper function to get country and its legal framework from IP address
+def get_framework(country):
+    # Locations without a country are "Other" as well
+    return jurisdiction_model.framework(country) or jurisdiction_model.default_framework
+
+# First pass: resolve every distinct IP of the dump once; frameworks are then handled as integer ids
+location_table = load_location_table(TRACEROUTE_PATH, GEOIP2_PATH, locator=geoip_reader)
+framework_ids = LocationKeys(location_table, lambda place: get_framework(place.country))
+
+def get_country_and_framework(ip_address):
+    location_id = location_table.location_id(ip_address)
+    if location_id is None:
+        return None, None
+    return framework_ids.of_location(location_id), location_table.places[location_id].country
+
+# Framework and country of the source of every probe, resolved once per (prb_id, af)
+source_probes = ProbeTable(get_country_and_framework, PROBE_ARCHIVE_PATH)
+
+def count_paths(sources, destinations, hop_masks):
+    """
+    Classify a batch of paths at once and add them to framework_stats.
+
+    Args:
+        sources, destinations: Framework ids of the source and destination of every path.
+        hop_masks: Bitmask of the frameworks of the hops of every path (bit 0: a hop with unknown location).
+    """
+    sources = np.asarray(sources, dtype=np.intp)
+    intra = sources == np.asarray(destinations, dtype=np.intp)
+    foreign = has_foreign(hop_masks, sources)
+    for name, selected in (("Total_paths", sources),
+                           ("Intra-framework_paths", sources[intra]),
+                           ("Boomerang_paths", sources[intra & foreign]),
+                           ("No_foreign_hop_paths", sources[intra & ~foreign])):
+        for framework, count in enumerate(np.bincount(selected).tolist()):
+            if count:
+                framework_stats[framework][name] += count
+
+# 2. Traceroute Data Parsing with variable structure handling and progress display
+def parse_traceroute_data(file_path):
+    # Get total lines for the progress bar from the line index
+    total_lines = count_lines(file_path)
+    # Paths waiting to be classified by count_paths
+    path_sources, path_destinations, path_hop_masks = [], [], []
+
+    records = read_traceroutes(file_path, fields=("src_addr", "dst_addr", "af", "prb_id", "result"), hop_fields=("from",))
+    with tqdm(total=total_lines, desc="Processing traceroute data") as pbar:
+        for record in records:
+            if not check_memory():
+                break  # Stop if RAM usage exceeds limit
+
+            try:
+                # Check if the necessary fields are present before processing
+                if 'src_addr' not in record or 'dst_addr' not in record or 'af' not in record:
+                    pbar.update(1)
+                    continue  # Skip this line if critical data is missing
+
+                src_ip = record['src_addr']
+                dst_ip = record['dst_addr']
+                af = 'IPv4' if record['af'] == 4 else 'IPv6'
+
+                # Determine the legal framework and country for source and destination IPs
+                src_framework, src_country = source_probes.lookup(record.get('prb_id'), record['af'], src_ip)
+                dst_framework, dst_country = get_country_and_framework(dst_ip)
+
+                # If either source or destination is not associated with a legal framework, skip this line
+                if src_framework is None or dst_framework is None:
+                    pbar.update(1)
+                    continue
+                
+                # Update IP counts by legal framework and type
+                framework_stats[src_framework][f"Unique_{af}_as_source"] += 1
+                framework_stats[dst_framework][f"Unique_{af}_as_destination"] += 1
+
+                # Analyze hops if they are available, collecting the frameworks they are in as a bitmask
+                hop_mask = 0
+                if 'result' in record:
+                    for hop in record['result']:
+                        if 'result' not in hop:
+                            continue  # Skip this hop if no 'result' field is present
+                        
+                        for result in hop['result']:
+                            hop_ip = result.get('from')
+                            if hop_ip:
+                                hop_framework, hop_country = get_country_and_framework(hop_ip)
+                                hop_mask |= 1 << (hop_framework or UNKNOWN)
+                                framework_stats[src_framework][f"Unique_{af}_in_hops"] += 1
+
+                # Path classification for boomerang and non-boomerang paths, in batches
+                path_sources.append(src_framework)
+                path_destinations.append(dst_framework)
+                path_hop_masks.append(hop_mask)
+                if len(path_sources) >= PATH_BATCH_SIZE:
+                    count_paths(path_sources, path_destinations, path_hop_masks)
+                    path_sources, path_destinations, path_hop_masks = [], [], []
+
+            except TypeError:
+                continue  # Skip lines that have incompatible types
+
+            pbar.update(1)  # Update progress bar
+
+    if path_sources:
+        count_paths(path_sources, path_destinations, path_hop_masks)
+
+
+# Execute function to parse traceroute data
+parse_traceroute_data(TRACEROUTE_PATH)
+
+# Close GeoIP reader
+logging.info(f"GeoIP cache: {geoip_reader.stats()}")
+logging.info(f"Probe table: {source_probes.stats()}")
+geoip_reader.close()
+
+# 3. Format and display results
+def display_statistics(framework_stats):
+    for framework, stats in framework_stats.items():
+        print(f"Legal Framework: {framework_ids.values[framework]}")
+        print(f"  Unique IPv4 as source: {stats['Unique_IPv4_as_source']}")
+        print(f"  Unique IPv6 as source: {stats['Unique_IPv6_as_source']}")
+        print(f"  Total unique IP addresses as source: {stats['Unique_IPv4_as_source'] + stats['Unique_IPv6_as_source']}")
+        print(f"  Unique IPv4 in hops: {stats['Unique_IPv4_in_hops']}")
+        print(f"  Unique IPv6 in hops: {stats['Unique_IPv6_in_hops']}")
+        print(f"  Unique IPv4 as destination: {stats['Unique_IPv4_as_destination']}")
+        print(f"  Unique IPv6 as destination: {stats['Unique_IPv6_as_destination']}")
+        print(f"  Unique paths with same source and destination framework: {stats['Intra-framework_paths']}")
+        print(f"  Unique paths with same source and destination framework but at least one foreign hop: {stats['Boomerang_paths']}")
+        print(f"  Unique paths with same source and destination framework and no foreign hops: {stats['No_foreign_hop_paths']}")
+
+# Run display
+display_statistics(framework_stats)
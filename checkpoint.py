@@ -0,0 +1,117 @@
+"""
+Append-only checkpoint log for long sequential runs over a traceroute dump.
+
+Instead of rewriting the whole aggregator state at every checkpoint, a run
+appends only what changed since the previous checkpoint (a "delta" state, as
+produced by an aggregator's `to_state`) together with the byte offset reached
+in the dump. Resuming merges the deltas back in order and continues reading
+at the last offset, so the cost of a checkpoint does not grow with the run.
+
+Each record is framed as: payload length (uint32), CRC32 of the payload
+(uint32), then the payload itself, a zlib-compressed pickle. A record torn by
+a crash mid-write fails the length or CRC check and is dropped on resume.
+
+Every record also holds the signature (size, mtime) of the dump when it was
+written, so a log is not resumed against a dump that was replaced or
+rewritten since.
+"""
+import logging
+import os
+import pickle
+import struct
+import zlib
+
+from traceroute_index import file_signature
+
+_FRAME = struct.Struct("<II")
+
+# zlib level 1 keeps checkpoints fast; the states are very repetitive anyway
+COMPRESSION_LEVEL = 1
+
+
+class CheckpointLog:
+    """Checkpoint records of one run, stored in a single append-only file."""
+
+    def __init__(self, path, file_path, growing=False):
+        """
+        Args:
+            path (str): Checkpoint file.
+            file_path (str): Traceroute dump being processed; a log written for
+                another dump, or for another version of it, is not resumed.
+            growing (bool): The dump is still being appended to (follow mode),
+                so it only has to be at least as large as when a record was written.
+        """
+        self.path = path
+        self.file_path = os.path.abspath(file_path)
+        self.growing = growing
+
+    def _matches(self, signature):
+        if signature is None:
+            return False
+        size, mtime_ns = file_signature(self.file_path)
+        if self.growing:
+            return size >= signature[0]
+        return (size, mtime_ns) == tuple(signature)
+
+    def append(self, offset, lines, state):
+        """
+        Append one checkpoint and flush it to disk.
+
+        Args:
+            offset (int): Byte offset in the dump up to which `state` is complete.
+            lines (int): Number of lines processed up to `offset`.
+            state (dict): Aggregator state accumulated since the previous checkpoint.
+        """
+        record = {"file": self.file_path, "signature": file_signature(self.file_path), "offset": offset, "lines": lines, "state": state}
+        payload = zlib.compress(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL), COMPRESSION_LEVEL)
+        with open(self.path, "ab") as log_file:
+            log_file.write(_FRAME.pack(len(payload), zlib.crc32(payload)))
+            log_file.write(payload)
+            log_file.flush()
+            os.fsync(log_file.fileno())
+
+    def records(self):
+        """
+        Yield the complete records of the log in order. A torn record at the end
+        is cut off so that later appends start on a clean boundary.
+        """
+        if not os.path.exists(self.path):
+            return
+        valid_end = 0
+        with open(self.path, "rb") as log_file:
+            while True:
+                frame = log_file.read(_FRAME.size)
+                if len(frame) < _FRAME.size:
+                    break
+                length, crc = _FRAME.unpack(frame)
+                payload = log_file.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                record = pickle.loads(zlib.decompress(payload))
+                if record["file"] != self.file_path:
+                    raise ValueError(f"Checkpoint {self.path} was written for {record['file']}, not {self.file_path}")
+                if not self._matches(record.get("signature")):
+                    raise ValueError(f"Checkpoint {self.path} was written for another version of {self.file_path}")
+                valid_end = log_file.tell()
+                yield record
+        if valid_end < os.path.getsize(self.path):
+            logging.warning(f"Dropping incomplete checkpoint record at the end of {self.path}")
+            with open(self.path, "r+b") as log_file:
+                log_file.truncate(valid_end)
+
+    def restore(self, aggregator):
+        """
+        Merge every checkpointed delta into `aggregator`.
+
+        Returns:
+            tuple: (offset, lines) to resume from; (0, 0) if there is no checkpoint.
+        """
+        offset, lines = 0, 0
+        for record in self.records():
+            aggregator.merge(record["state"])
+            offset, lines = record["offset"], record["lines"]
+        return offset, lines
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
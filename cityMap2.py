@@ -1,51 +1,88 @@
-import csv
-import json
-from statistics import median
-import math
-
-def calculate_95th_percentile(latencies):
-    """
-    Calculate the 95th percentile of a list of latencies.
-    """
-    if not latencies:
-        return None
-    sorted_latencies = sorted(latencies)
-    index = math.ceil(0.95 * len(sorted_latencies)) - 1
-    return sorted_latencies[index]
-
-def process_json_to_csv(json_file_path, csv_file_path):
-    """
-    Process the JSON file and write latency metrics to a CSV file.
-    Args:
-        json_file_path (str): Path to the JSON file containing latency data.
-        csv_file_path (str): Path to the output CSV file.
-        max_lines (int): Maximum number of lines to write to the CSV file.
-    """
-    # Open the JSON file
-    with open(json_file_path, "r", encoding="utf-8") as json_file:
-        latency_data = json.load(json_file)
-
-    # Open the CSV file for writing
-    with open(csv_file_path, "w", newline="", encoding="utf-8") as csv_file:
-        csv_writer = csv.writer(csv_file, quoting=csv.QUOTE_NONNUMERIC)
-
-        # Write the header row
-        csv_writer.writerow(["City1_ID", "City2_ID", "Min_Latency", "Median_Latency", "95th_Percentile_Latency"])
-        # Iterate over city pairs and calculate metrics
-        for city1_id, connections in latency_data.items():
-            for city2_id, stats in connections.items():
-                latencies = stats.get("latencies", [])
-                if latencies:
-                    min_latency = round(min(latencies), 4)
-                    median_latency = round(median(latencies), 4)
-                    percentile_95 = round(calculate_95th_percentile(latencies), 4)
-
-                    # Write the row to the CSV file without pre-applying quotes
-                    csv_writer.writerow([city1_id, city2_id, min_latency, median_latency, percentile_95])
-
-# Paths to input JSON file and output CSV file
-json_file_path = "E:/latency_data3.json"  # Replace with your actual JSON file path
-csv_file_path = "E:/cityMap.csv"  # Replace with your desired output CSV file path
-
-# Process the JSON file and write the CSV output
-process_json_to_csv(json_file_path, csv_file_path)
+import csv
+import json
+from latency_stats import LatencySketch, finalize_groups, flatten_groups, load_latencies, percentile_name
+
+def combine_latencies(current, latencies):
+    """
+    Combine the latencies of a city pair from two files: lists of samples are
+    concatenated, sketches are merged (samples are added to a sketch).
+    """
+    if isinstance(current, LatencySketch):
+        current.merge(latencies)
+        return current
+    if isinstance(latencies, LatencySketch):
+        latencies.merge(current)
+        return latencies
+    return current + latencies
+
+def load_latency_data(json_file_paths):
+    """
+    Load one or more latency JSON files (e.g. of several days) with the
+    latencies of every city pair combined; serialized sketches are loaded
+    as `LatencySketch` objects.
+    """
+    if isinstance(json_file_paths, str):
+        json_file_paths = [json_file_paths]
+    latency_data = {}
+    for json_file_path in json_file_paths:
+        with open(json_file_path, "r", encoding="utf-8") as json_file:
+            for city1_id, connections in json.load(json_file).items():
+                destinations = latency_data.setdefault(city1_id, {})
+                for city2_id, stats in connections.items():
+                    latencies = load_latencies(stats.get("latencies", []))
+                    if city2_id in destinations:
+                        latencies = combine_latencies(destinations[city2_id]["latencies"], latencies)
+                    destinations[city2_id] = {"latencies": latencies}
+    return latency_data
+
+def process_json_to_csv(json_file_path, csv_file_path):
+    """
+    Process the JSON file and write latency metrics to a CSV file.
+    Args:
+        json_file_path (str | list): Path to the JSON file containing latency data, or a list of
+            such files whose latencies are combined per city pair.
+        csv_file_path (str): Path to the output CSV file.
+    """
+    latency_data = load_latency_data(json_file_path)
+
+    # Exact statistics of all pairs with samples in one vectorized pass
+    sample_pairs = [stats["latencies"] for connections in latency_data.values() for stats in connections.values()
+                    if stats["latencies"] and not isinstance(stats["latencies"], LatencySketch)]
+    values, offsets = flatten_groups(sample_pairs)
+    pair_statistics = finalize_groups(values, offsets, statistics=("min", "median"), percentiles=(0.95,))
+    min_latencies = [float(value) for value in pair_statistics["min"]]
+    median_latencies = [float(value) for value in pair_statistics["median"]]
+    percentiles_95 = [float(value) for value in pair_statistics[percentile_name(0.95)]]
+    sample_pair_index = 0
+
+    # Open the CSV file for writing
+    with open(csv_file_path, "w", newline="", encoding="utf-8") as csv_file:
+        csv_writer = csv.writer(csv_file, quoting=csv.QUOTE_NONNUMERIC)
+
+        # Write the header row
+        csv_writer.writerow(["City1_ID", "City2_ID", "Min_Latency", "Median_Latency", "95th_Percentile_Latency"])
+        # Iterate over city pairs and calculate metrics
+        for city1_id, connections in latency_data.items():
+            for city2_id, stats in connections.items():
+                latencies = stats.get("latencies", [])
+                if isinstance(latencies, LatencySketch) and latencies:
+                    # Approximate quantiles, within the relative accuracy of the sketch
+                    min_latency = round(latencies.minimum, 4)
+                    median_latency = round(latencies.quantile(0.5), 4)
+                    percentile_95 = round(latencies.quantile(0.95), 4)
+                    csv_writer.writerow([city1_id, city2_id, min_latency, median_latency, percentile_95])
+                elif latencies:
+                    min_latency = round(min_latencies[sample_pair_index], 4)
+                    median_latency = round(median_latencies[sample_pair_index], 4)
+                    percentile_95 = round(percentiles_95[sample_pair_index], 4)
+                    sample_pair_index += 1
+
+                    # Write the row to the CSV file without pre-applying quotes
+                    csv_writer.writerow([city1_id, city2_id, min_latency, median_latency, percentile_95])
+
+# Paths to input JSON file and output CSV file
+json_file_path = "E:/latency_data3.json"  # Replace with your actual JSON file path
+csv_file_path = "E:/cityMap.csv"  # Replace with your desired output CSV file path
+
+# Process the JSON file and write the CSV output
+process_json_to_csv(json_file_path, csv_file_path)
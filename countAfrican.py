@@ -1,116 +1,128 @@
-import geoip2.database
-import json
-from collections import defaultdict
-from tqdm import tqdm
-
-# File paths
-geoip_db_path = 'E:/internet-graph-master/dataset/GeoIP2-City.mmdb'
-traceroute_file_path = "E:/internet-graph-master/dataset/traceroute-2024-10-01T0000"
-output_txt_path = "E:/traceroute_africa_country_counts.txt"
-
-# List of African countries (ISO Alpha-2 codes)
-AFRICAN_COUNTRIES = {
-    "DZ", "AO", "BJ", "BW", "BF", "BI", "CM", "CV", "CF", "TD", "KM", "CG", "CD", 
-    "DJ", "EG", "GQ", "ER", "SZ", "ET", "GA", "GM", "GH", "GN", "GW", "CI", "KE", 
-    "LS", "LR", "LY", "MG", "MW", "ML", "MR", "MU", "MA", "MZ", "NA", "NE", "NG", 
-    "RW", "ST", "SN", "SC", "SL", "SO", "ZA", "SS", "SD", "TZ", "TG", "TN", "UG", 
-    "ZM", "ZW"
-}
-
-# GDPR countries (ISO Alpha-2 codes)
-GDPR_COUNTRIES = {
-    "AT", "BE", "BG", "HR", "CY", "CZ", "DK", "EE", "FI", "FR", "DE", "GR", "HU", 
-    "IE", "IT", "LV", "LT", "LU", "MT", "NL", "PL", "PT", "RO", "SK", "SI", "ES", "SE"
-}
-
-# Initialize GeoIP reader
-geoip_reader = geoip2.database.Reader(geoip_db_path)
-
-def get_country_from_ip(ip):
-    """
-    Get the country code for an IP address using the GeoIP2 database.
-    """
-    try:
-        response = geoip_reader.city(ip)
-        country_code = response.country.iso_code
-        # Map GDPR countries to a single "GDPR" label
-        if country_code in GDPR_COUNTRIES:
-            return "GDPR"
-        return country_code
-    except geoip2.errors.AddressNotFoundError:
-        return None
-
-def process_traceroute_file(traceroute_file_path, output_txt_path, african_countries):
-    """
-    Process the traceroute dataset for specified African countries, separating path and destination country counts.
-    """
-    country_counts = {
-        country: {
-            "path_countries": defaultdict(int),
-            "destination_countries": defaultdict(int)
-        }
-        for country in african_countries
-    }
-
-    # Read and process the traceroute file line by line
-    with open(traceroute_file_path, 'r', encoding='utf-8') as file:
-        for i, line in enumerate(tqdm(file, total=10000, desc="Processing traceroutes", unit="lines")):
-            if i >= 10000:  # Limit to first 10,000 lines for testing
-                break
-            try:
-                # Parse the line as JSON
-                data = json.loads(line.strip())
-                src_addr = data.get("src_addr")
-                
-                # Get the source country
-                src_country = get_country_from_ip(src_addr) if src_addr else None
-                if src_country in african_countries:
-                    # Process hops
-                    results = data.get("result", [])
-                    for hop in results:
-                        hop_results = hop.get("result", [])
-                        for hop_data in hop_results:
-                            ip = hop_data.get("from")
-                            if ip:
-                                country = get_country_from_ip(ip)
-                                if country:
-                                    country_counts[src_country]["path_countries"][country] += 1
-
-                    # Process destination
-                    dst_addr = data.get("dst_addr")
-                    if dst_addr:
-                        country = get_country_from_ip(dst_addr)
-                        if country:
-                            country_counts[src_country]["destination_countries"][country] += 1
-            except Exception as e:
-                print(f"Error processing line: {e}")
-
-    # Write all results to a single text file
-    with open(output_txt_path, 'w', encoding='utf-8') as txt_file:
-        for src_country, counts in country_counts.items():
-            txt_file.write(f"Country Counts for Source Country: {src_country}\n\n")
-            
-            # Write path countries sorted by count
-            txt_file.write(f"Path Countries (Sorted):\n")
-            txt_file.write(f"{'Country':<20}{'Count':<10}\n")
-            txt_file.write(f"{'-'*30}\n")
-            sorted_path_countries = sorted(counts["path_countries"].items(), key=lambda x: x[1], reverse=True)
-            for country, count in sorted_path_countries:
-                txt_file.write(f"{country:<20}{count:<10}\n")
-            
-            txt_file.write("\n")
-            
-            # Write destination countries sorted by count
-            txt_file.write(f"Destination Countries (Sorted):\n")
-            txt_file.write(f"{'Country':<20}{'Count':<10}\n")
-            txt_file.write(f"{'-'*30}\n")
-            sorted_destination_countries = sorted(counts["destination_countries"].items(), key=lambda x: x[1], reverse=True)
-            for country, count in sorted_destination_countries:
-                txt_file.write(f"{country:<20}{count:<10}\n")
-            
-            txt_file.write("\n" + "="*50 + "\n\n")
-    print(f"Results written to {output_txt_path}")
-
-if __name__ == "__main__":
-    process_traceroute_file(traceroute_file_path, output_txt_path, AFRICAN_COUNTRIES)
-    print("Processing completed.")
+from collections import defaultdict
+from functools import lru_cache
+from itertools import islice
+from tqdm import tqdm
+from traceroute_reader import iter_raw_lines, parse_traceroutes, peek_field
+from traceroute_model import Traceroute
+from geolocation import GeoLocator
+from location_table import LocationKeys, LocationTable
+from jurisdictions import load_jurisdictions
+
+# File paths
+geoip_db_path = 'E:/internet-graph-master/dataset/GeoIP2-City.mmdb'
+traceroute_file_path = "E:/internet-graph-master/dataset/traceroute-2024-10-01T0000"
+output_txt_path = "E:/traceroute_africa_country_counts.txt"
+
+# List of African countries (ISO Alpha-2 codes)
+AFRICAN_COUNTRIES = {
+    "DZ", "AO", "BJ", "BW", "BF", "BI", "CM", "CV", "CF", "TD", "KM", "CG", "CD", 
+    "DJ", "EG", "GQ", "ER", "SZ", "ET", "GA", "GM", "GH", "GN", "GW", "CI", "KE", 
+    "LS", "LR", "LY", "MG", "MW", "ML", "MR", "MU", "MA", "MZ", "NA", "NE", "NG", 
+    "RW", "ST", "SN", "SC", "SL", "SO", "ZA", "SS", "SD", "TZ", "TG", "TN", "UG", 
+    "ZM", "ZW"
+}
+
+# GDPR and the other legal frameworks (see jurisdictions.json)
+jurisdiction_model = load_jurisdictions()
+
+# Initialize GeoIP reader, cached per network block
+geoip_reader = GeoLocator(geoip_db_path)
+
+def get_country_label(country_code):
+    """
+    Map GDPR countries to a single "GDPR" label.
+    """
+    return jurisdiction_model.label(country_code)
+
+# Location ids of the IPs seen so far, each resolved on first use. Only the first lines of
+# the dump from African sources are analysed, so no table of the whole dump is built up front.
+location_table = LocationTable(locator=geoip_reader)
+country_ids = LocationKeys(location_table, lambda place: get_country_label(place.country))
+
+def get_country_from_ip(ip):
+    """
+    Get the country code for an IP address using the GeoIP2 database.
+    """
+    country_id = country_ids.of_ip(ip)
+    return None if country_id is None else country_ids.values[country_id]
+
+@lru_cache(maxsize=None)
+def get_source_country(src_addr):
+    """
+    Cached `get_country_from_ip` for source addresses, which repeat for every traceroute of a probe.
+    """
+    return get_country_from_ip(src_addr)
+
+def process_traceroute_file(traceroute_file_path, output_txt_path, african_countries):
+    """
+    Process the traceroute dataset for specified African countries, separating path and destination country counts.
+    """
+    country_counts = {
+        country: {
+            "path_countries": defaultdict(int),
+            "destination_countries": defaultdict(int)
+        }
+        for country in african_countries
+    }
+
+    def is_from_african_country(line):
+        # Read src_addr from the raw bytes so that other traceroutes are never JSON-decoded
+        src_addr = peek_field(line, "src_addr")
+        return bool(src_addr) and get_source_country(src_addr) in african_countries
+
+    # Read and process the traceroute file record by record
+    lines = islice(iter_raw_lines(traceroute_file_path), 10000)  # Limit to first 10,000 lines for testing
+    records = parse_traceroutes(lines, fields=("src_addr", "dst_addr", "result"), hop_fields=("from",),
+                                line_filter=is_from_african_country)
+    for data in tqdm(records, desc="Processing traceroutes", unit="lines"):
+        try:
+            src_addr = data.get("src_addr")
+            
+            # Get the source country
+            src_country = get_source_country(src_addr) if src_addr else None
+            if src_country in african_countries:
+                # Process hops, looking up each responding IP once and counting all of its replies
+                for hop in Traceroute.from_record(data).hops:
+                    for ip, count in zip(hop.ips, hop.counts):
+                        country = country_ids.of_ip(ip)
+                        if country:
+                            country_counts[src_country]["path_countries"][country] += count
+
+                # Process destination
+                dst_addr = data.get("dst_addr")
+                if dst_addr:
+                    country = country_ids.of_ip(dst_addr)
+                    if country:
+                        country_counts[src_country]["destination_countries"][country] += 1
+        except Exception as e:
+            print(f"Error processing line: {e}")
+
+    # Write all results to a single text file
+    with open(output_txt_path, 'w', encoding='utf-8') as txt_file:
+        for src_country, counts in country_counts.items():
+            txt_file.write(f"Country Counts for Source Country: {src_country}\n\n")
+            
+            # Write path countries sorted by count
+            txt_file.write(f"Path Countries (Sorted):\n")
+            txt_file.write(f"{'Country':<20}{'Count':<10}\n")
+            txt_file.write(f"{'-'*30}\n")
+            sorted_path_countries = sorted(counts["path_countries"].items(), key=lambda x: x[1], reverse=True)
+            for country, count in sorted_path_countries:
+                txt_file.write(f"{country_ids.values[country]:<20}{count:<10}\n")
+            
+            txt_file.write("\n")
+            
+            # Write destination countries sorted by count
+            txt_file.write(f"Destination Countries (Sorted):\n")
+            txt_file.write(f"{'Country':<20}{'Count':<10}\n")
+            txt_file.write(f"{'-'*30}\n")
+            sorted_destination_countries = sorted(counts["destination_countries"].items(), key=lambda x: x[1], reverse=True)
+            for country, count in sorted_destination_countries:
+                txt_file.write(f"{country_ids.values[country]:<20}{count:<10}\n")
+            
+            txt_file.write("\n" + "="*50 + "\n\n")
+    print(f"Results written to {output_txt_path}")
+
+if __name__ == "__main__":
+    process_traceroute_file(traceroute_file_path, output_txt_path, AFRICAN_COUNTRIES)
+    print("Processing completed.")
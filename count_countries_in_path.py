@@ -1,114 +1,186 @@
-import geoip2.database
-import json
-from collections import defaultdict
-from tqdm import tqdm
-
-# File paths
-geoip_db_path = 'E:/internet-graph-master/dataset/GeoIP2-City.mmdb'
-traceroute_file_path = "E:/internet-graph-master/dataset/traceroute-2024-10-01T0000"
-output_txt_path = "E:/traceroute_country_counts.txt"
-
-# GDPR countries
-GDPR_COUNTRIES = {
-    "AT", "BE", "BG", "CY", "CZ", "DE", "DK", "EE", "ES", "FI", "FR", "GR", "HR",
-    "HU", "IE", "IT", "LT", "LU", "LV", "MT", "NL", "PL", "PT", "RO", "SE", "SI", "SK"
-}
-
-# List of source countries to analyze
-source_countries = ["BR", "CA", "GDPR", "AU", "JP", "ZA"]
-
-# Initialize GeoIP reader
-geoip_reader = geoip2.database.Reader(geoip_db_path)
-
-def get_country_label(country_code):
-    """
-    Return 'GDPR' if the country code is part of the GDPR countries; otherwise, return the country code.
-    """
-    return "GDPR" if country_code in GDPR_COUNTRIES else country_code
-
-def get_country_from_ip(ip):
-    """
-    Get the country code for an IP address using the GeoIP2 database and normalize GDPR countries.
-    """
-    try:
-        response = geoip_reader.city(ip)
-        country_code = response.country.iso_code
-        return get_country_label(country_code)
-    except geoip2.errors.AddressNotFoundError:
-        return None
-
-def process_traceroute_file(traceroute_file_path, output_txt_path, source_countries):
-    """
-    Process the traceroute dataset for specified source countries, separating path and destination country counts.
-    Treat GDPR countries as a single entity.
-    """
-    country_counts = {
-        country: {
-            "path_countries": defaultdict(int),
-            "destination_countries": defaultdict(int)
-        }
-        for country in source_countries
-    }
-
-    # Read and process the traceroute file line by line
-    with open(traceroute_file_path, 'r', encoding='utf-8') as file:
-        for i, line in enumerate(tqdm(file, total=10000, desc="Processing traceroutes", unit="lines")):
-            if i >= 10000:  # Limit to first 10,000 lines
-                break
-            try:
-                # Parse the line as JSON
-                data = json.loads(line.strip())
-                src_addr = data.get("src_addr")
-                
-                # Get the source country
-                src_country = get_country_from_ip(src_addr) if src_addr else None
-                if src_country in source_countries:
-                    # Process hops
-                    results = data.get("result", [])
-                    for hop in results:
-                        hop_results = hop.get("result", [])
-                        for hop_data in hop_results:
-                            ip = hop_data.get("from")
-                            if ip:
-                                country = get_country_from_ip(ip)
-                                if country:
-                                    country_counts[src_country]["path_countries"][country] += 1
-
-                    # Process destination
-                    dst_addr = data.get("dst_addr")
-                    if dst_addr:
-                        country = get_country_from_ip(dst_addr)
-                        if country:
-                            country_counts[src_country]["destination_countries"][country] += 1
-            except Exception as e:
-                print(f"Error processing line: {e}")
-
-    # Write all results to a single text file
-    with open(output_txt_path, 'w', encoding='utf-8') as txt_file:
-        for src_country, counts in country_counts.items():
-            txt_file.write(f"Country Counts for Source Country: {src_country}\n\n")
-            
-            # Write path countries sorted by count
-            txt_file.write(f"Path Countries (Sorted):\n")
-            txt_file.write(f"{'Country':<20}{'Count':<10}\n")
-            txt_file.write(f"{'-'*30}\n")
-            sorted_path_countries = sorted(counts["path_countries"].items(), key=lambda x: x[1], reverse=True)
-            for country, count in sorted_path_countries:
-                txt_file.write(f"{country:<20}{count:<10}\n")
-            
-            txt_file.write("\n")
-            
-            # Write destination countries sorted by count
-            txt_file.write(f"Destination Countries (Sorted):\n")
-            txt_file.write(f"{'Country':<20}{'Count':<10}\n")
-            txt_file.write(f"{'-'*30}\n")
-            sorted_destination_countries = sorted(counts["destination_countries"].items(), key=lambda x: x[1], reverse=True)
-            for country, count in sorted_destination_countries:
-                txt_file.write(f"{country:<20}{count:<10}\n")
-            
-            txt_file.write("\n" + "="*50 + "\n\n")
-    print(f"Results written to {output_txt_path}")
-
-if __name__ == "__main__":
-    process_traceroute_file(traceroute_file_path, output_txt_path, source_countries)
-    print("Processing completed.")
+from collections import defaultdict
+from tqdm import tqdm
+from traceroute_reader import peek_field, read_traceroutes
+from traceroute_index import read_source_traceroutes
+from geolocation import GeoLocator
+from location_table import LocationKeys, LocationTable
+from probe_table import ProbeTable
+from jurisdictions import load_jurisdictions
+from traceroute_model import Traceroute
+from sharding import to_plain
+
+# File paths
+geoip_db_path = 'E:/internet-graph-master/dataset/GeoIP2-City.mmdb'
+traceroute_file_path = "E:/internet-graph-master/dataset/traceroute-2024-10-01T0000"
+output_txt_path = "E:/traceroute_country_counts.txt"
+# Optional RIPE Atlas probe archive (see probe_table.py); None builds the probe table on first sight
+probe_archive_path = None
+
+# GDPR and the other legal frameworks (see jurisdictions.json)
+jurisdiction_model = load_jurisdictions()
+
+# Fields read from each traceroute
+TRACEROUTE_FIELDS = ("src_addr", "dst_addr", "af", "prb_id", "result")
+
+# List of source countries to analyze
+source_countries = ["BR", "CA", "GDPR", "AU", "JP", "ZA"]
+
+# Initialize GeoIP reader, cached per network block
+geoip_reader = GeoLocator(geoip_db_path)
+
+def get_country_label(country_code):
+    """
+    Return 'GDPR' if the country code is part of the GDPR countries; otherwise, return the country code.
+    """
+    return jurisdiction_model.label(country_code)
+
+# Location ids of the IPs seen so far, each resolved on first use. Only the traceroutes of the
+# source countries (within `max_lines`) are analysed, so no table of the whole dump is built up front.
+location_table = LocationTable(locator=geoip_reader)
+country_ids = LocationKeys(location_table, lambda place: get_country_label(place.country))
+
+def get_country_from_ip(ip):
+    """
+    Get the country code for an IP address using the GeoIP2 database and normalize GDPR countries.
+    """
+    country_id = country_ids.of_ip(ip)
+    return None if country_id is None else country_ids.values[country_id]
+
+# Source country label of every probe, resolved once per (prb_id, af)
+source_probes = ProbeTable(get_country_from_ip)
+
+def source_filter(source_countries):
+    """
+    Build a raw-line pre-filter that keeps only traceroutes whose source is in `source_countries`.
+    The source fields are read from the raw bytes, so rejected lines are never JSON-decoded.
+    """
+    def is_from_source_country(line):
+        src_addr = peek_field(line, "src_addr")
+        return bool(src_addr) and source_probes.lookup(peek_field(line, "prb_id"), peek_field(line, "af"),
+                                                       src_addr) in source_countries
+    return is_from_source_country
+
+def new_country_counts(source_countries):
+    """
+    Create the empty path and destination country counters for every source country.
+    """
+    return {
+        country: {
+            "path_countries": defaultdict(int),
+            "destination_countries": defaultdict(int)
+        }
+        for country in source_countries
+    }
+
+def count_traceroute(country_counts, data, source_countries):
+    """
+    Add the path and destination countries of one parsed traceroute to `country_counts`.
+    Path and destination countries are counted by their ids in `country_ids`; see `labelled_counts`.
+    """
+    try:
+        src_addr = data.get("src_addr")
+        
+        # Get the source country
+        src_country = source_probes.lookup(data.get("prb_id"), data.get("af"), src_addr) if src_addr else None
+        if src_country in source_countries:
+            # Process hops, looking up each responding IP once and counting all of its replies
+            for hop in Traceroute.from_record(data).hops:
+                for ip, count in zip(hop.ips, hop.counts):
+                    country = country_ids.of_ip(ip)
+                    if country:
+                        country_counts[src_country]["path_countries"][country] += count
+
+            # Process destination
+            dst_addr = data.get("dst_addr")
+            if dst_addr:
+                country = country_ids.of_ip(dst_addr)
+                if country:
+                    country_counts[src_country]["destination_countries"][country] += 1
+    except Exception as e:
+        print(f"Error processing line: {e}")
+
+def count_shard(shard):
+    """
+    Worker entry point: count the traceroutes that start inside one (file_path, start, end, source_countries) byte range.
+    Returns the counts as plain dicts so they can be pickled and merged.
+    """
+    file_path, start, end, source_countries = shard
+    country_counts = new_country_counts(source_countries)
+    records = read_traceroutes(file_path, fields=TRACEROUTE_FIELDS, hop_fields=("from",), start=start, end=end,
+                               line_filter=source_filter(source_countries))
+    for data in records:
+        count_traceroute(country_counts, data, source_countries)
+    return labelled_counts(country_counts)
+
+def labelled_counts(country_counts):
+    """
+    Return `country_counts` as plain dicts keyed by country labels instead of country ids.
+    """
+    countries = country_ids.values
+    return {
+        src_country: {kind: {countries[country]: count for country, count in counts[kind].items()}
+                      for kind in ("path_countries", "destination_countries")}
+        for src_country, counts in to_plain(country_counts).items()
+    }
+
+def write_country_counts(country_counts, output_txt_path):
+    """
+    Write the path and destination country counts of every source country to a text file.
+    """
+    with open(output_txt_path, 'w', encoding='utf-8') as txt_file:
+        for src_country, counts in country_counts.items():
+            txt_file.write(f"Country Counts for Source Country: {src_country}\n\n")
+            
+            # Write path countries sorted by count
+            txt_file.write(f"Path Countries (Sorted):\n")
+            txt_file.write(f"{'Country':<20}{'Count':<10}\n")
+            txt_file.write(f"{'-'*30}\n")
+            sorted_path_countries = sorted(counts["path_countries"].items(), key=lambda x: x[1], reverse=True)
+            for country, count in sorted_path_countries:
+                txt_file.write(f"{country:<20}{count:<10}\n")
+            
+            txt_file.write("\n")
+            
+            # Write destination countries sorted by count
+            txt_file.write(f"Destination Countries (Sorted):\n")
+            txt_file.write(f"{'Country':<20}{'Count':<10}\n")
+            txt_file.write(f"{'-'*30}\n")
+            sorted_destination_countries = sorted(counts["destination_countries"].items(), key=lambda x: x[1], reverse=True)
+            for country, count in sorted_destination_countries:
+                txt_file.write(f"{country:<20}{count:<10}\n")
+            
+            txt_file.write("\n" + "="*50 + "\n\n")
+    print(f"Results written to {output_txt_path}")
+
+def source_country_codes(source_countries):
+    """
+    Expand the source country labels into ISO country codes ('GDPR' becomes its member states).
+    """
+    codes = set()
+    for country in source_countries:
+        codes.update(jurisdiction_model.members(country))
+    return codes
+
+def process_traceroute_file(traceroute_file_path, output_txt_path, source_countries, max_lines=10000):
+    """
+    Process the traceroute dataset for specified source countries, separating path and destination country counts.
+    Treat GDPR countries as a single entity.
+    """
+    if probe_archive_path:
+        source_probes.load_archive(probe_archive_path)
+    country_counts = new_country_counts(source_countries)
+
+    # Read only the traceroutes from the source countries (within the first max_lines lines) using the source index
+    records = read_source_traceroutes(traceroute_file_path, source_country_codes(source_countries),
+                                      geoip_reader.country, geoip_db_path,
+                                      fields=TRACEROUTE_FIELDS, hop_fields=("from",), max_lines=max_lines,
+                                      line_filter=source_filter(source_countries))
+    for data in tqdm(records, desc="Processing traceroutes", unit="lines"):
+        count_traceroute(country_counts, data, source_countries)
+
+    # Write all results to a single text file
+    write_country_counts(labelled_counts(country_counts), output_txt_path)
+
+if __name__ == "__main__":
+    process_traceroute_file(traceroute_file_path, output_txt_path, source_countries)
+    print("Processing completed.")
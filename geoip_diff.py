@@ -0,0 +1,238 @@
+"""
+Range-sweep comparison of two GeoIP City databases (e.g. GeoIP2 vs GeoLite2).
+
+Each database is read as a sorted stream of (start, end, `Place`) address
+ranges, either by walking the tree of an .mmdb file or from the Blocks CSVs
+of a MaxMind CSV export directory. The two streams of one address family are
+swept together: every stretch of addresses where neither side changes is one
+segment, so the whole IPv4 and IPv6 space is compared network by network
+instead of sampling individual addresses, in memory that does not grow with
+the size of the databases.
+
+For every segment covered by both databases the country, subdivision and
+city are compared and the segment's number of addresses is added to the
+"same", "different" or "missing" (no value on at least one side) count of
+each level. Segments that disagree at some level can be exported to a CSV
+file, with adjacent segments of the same pair of places merged.
+"""
+import argparse
+import csv
+import glob
+import ipaddress
+import logging
+import os
+
+import maxminddb
+
+from geolocation import location_from_record
+from location_table import place_of
+from range_table import iter_blocks, read_locations
+
+# Default inputs: an mmdb file or a CSV export directory each
+geoip2_path = 'E:/internet-graph-master/dataset/GeoIP2-City.mmdb'
+geolite2_path = 'E:/internet-graph-master/dataset/GeoLite2-City.mmdb'
+
+LEVELS = ("country", "subdivision", "city")
+
+EXPORT_HEADER = ["start", "end", "addresses", "level",
+                 "city_a", "subdivision_a", "country_a", "city_b", "subdivision_b", "country_b"]
+
+
+def mmdb_ranges(db_path, version):
+    """Yield the (start, end, `Place`) of every network of one address family of an mmdb file, in address order."""
+    with maxminddb.open_database(db_path) as reader:
+        # Iteration skips the aliases of the IPv4 space (::ffff:0:0/96, 2002::/16) in IPv6 databases
+        for network, record in reader:
+            if network.version == version:
+                yield (int(network.network_address), int(network.broadcast_address),
+                       place_of(location_from_record(record)))
+
+
+def csv_ranges(blocks_path, place_of_geoname):
+    """Yield the (start, end, `Place`) of every network of a Blocks CSV, in file order."""
+    for network, place in iter_blocks(blocks_path, place_of_geoname):
+        yield int(network.network_address), int(network.broadcast_address), place
+
+
+def _csv_file(directory, suffix):
+    matches = glob.glob(os.path.join(directory, f"*{suffix}"))
+    if len(matches) != 1:
+        raise FileNotFoundError(f"Expected one *{suffix} file in {directory}, found {len(matches)}")
+    return matches[0]
+
+
+def dataset_ranges(path, version):
+    """
+    Address ranges of one family of a database given as an .mmdb file or as a
+    CSV export directory (with *-Blocks-IPv4.csv, *-Blocks-IPv6.csv and
+    *-Locations-en.csv).
+    """
+    if os.path.isdir(path):
+        place_of_geoname = read_locations(_csv_file(path, "-Locations-en.csv"))
+        return csv_ranges(_csv_file(path, f"-Blocks-IPv{version}.csv"), place_of_geoname)
+    return mmdb_ranges(path, version)
+
+
+def _checked(ranges, name):
+    """Pass the ranges through as mutable [start, end, place] lists, checking that they are sorted and disjoint."""
+    previous_end = -1
+    for start, end, place in ranges:
+        if start <= previous_end:
+            raise ValueError(f"Ranges of {name} are not sorted and disjoint at {start}")
+        previous_end = end
+        yield [start, end, place]
+
+
+def sweep(ranges_a, ranges_b):
+    """
+    Merge two sorted streams of disjoint (start, end, place) ranges into
+    segments (start, end, place_a, place_b), where a place is None when its
+    side does not cover the segment. Stretches covered by neither side are skipped.
+    """
+    ranges_a, ranges_b = _checked(ranges_a, "a"), _checked(ranges_b, "b")
+    a, b = next(ranges_a, None), next(ranges_b, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[1] < b[0]):
+            yield a[0], a[1], a[2], None
+            a = next(ranges_a, None)
+        elif a is None or b[1] < a[0]:
+            yield b[0], b[1], None, b[2]
+            b = next(ranges_b, None)
+        elif a[0] < b[0]:
+            yield a[0], b[0] - 1, a[2], None
+            a[0] = b[0]
+        elif b[0] < a[0]:
+            yield b[0], a[0] - 1, None, b[2]
+            b[0] = a[0]
+        else:
+            end = min(a[1], b[1])
+            yield a[0], end, a[2], b[2]
+            if a[1] == end:
+                a = next(ranges_a, None)
+            else:
+                a[0] = end + 1
+            if b[1] == end:
+                b = next(ranges_b, None)
+            else:
+                b[0] = end + 1
+
+
+def new_counts():
+    return {
+        "only_a": 0,
+        "only_b": 0,
+        "both": 0,
+        **{level: {"same": 0, "different": 0, "missing": 0} for level in LEVELS},
+    }
+
+
+def compare_ranges(ranges_a, ranges_b, version, writer=None):
+    """
+    Sweep the ranges of one address family of two databases and count the
+    addresses by agreement at each level.
+
+    Args:
+        version (int): Address family, 4 or 6 (used to format exported ranges).
+        writer (csv.writer, optional): Receives the ranges that disagree at some
+            level, as rows of `EXPORT_HEADER`.
+
+    Returns:
+        dict: Address counts, see `new_counts`.
+    """
+    address = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+    counts = new_counts()
+    pending = None
+
+    def flush():
+        start, end, place_a, place_b, level = pending
+        writer.writerow([address(start), address(end), end - start + 1, level, *place_a, *place_b])
+
+    for start, end, place_a, place_b in sweep(ranges_a, ranges_b):
+        size = end - start + 1
+        if place_b is None:
+            counts["only_a"] += size
+            continue
+        if place_a is None:
+            counts["only_b"] += size
+            continue
+        counts["both"] += size
+        differing_level = None
+        for level in LEVELS:
+            value_a, value_b = getattr(place_a, level), getattr(place_b, level)
+            if value_a is None or value_b is None:
+                counts[level]["missing"] += size
+            elif value_a == value_b:
+                counts[level]["same"] += size
+            else:
+                counts[level]["different"] += size
+                differing_level = differing_level or level
+
+        if writer is not None and differing_level:
+            if (pending is not None and pending[1] + 1 == start
+                    and pending[2] == place_a and pending[3] == place_b):
+                pending[1] = end
+            else:
+                if pending is not None:
+                    flush()
+                pending = [start, end, place_a, place_b, differing_level]
+    if pending is not None:
+        flush()
+    return counts
+
+
+def agreement(counts):
+    """Share of the addresses covered by both databases on which they agree, per level."""
+    both = counts["both"]
+    return {level: counts[level]["same"] / both if both else 0.0 for level in LEVELS}
+
+
+def compare_datasets(path_a, path_b, export_path=None):
+    """
+    Compare two GeoIP City databases over the whole IPv4 and IPv6 space.
+
+    Args:
+        path_a, path_b (str): .mmdb files or CSV export directories.
+        export_path (str, optional): CSV file for the disagreeing ranges.
+
+    Returns:
+        dict: "IPv4" and "IPv6" address counts (see `new_counts`), each with
+        an added "agreement" entry (see `agreement`).
+    """
+    results = {}
+    export_file = open(export_path, "w", newline="", encoding="utf-8") if export_path else None
+    try:
+        writer = None
+        if export_file is not None:
+            writer = csv.writer(export_file)
+            writer.writerow(EXPORT_HEADER)
+        for version in (4, 6):
+            counts = compare_ranges(dataset_ranges(path_a, version), dataset_ranges(path_b, version), version, writer)
+            counts["agreement"] = agreement(counts)
+            results[f"IPv{version}"] = counts
+            logging.info(f"IPv{version}: {counts['both']:,} addresses in both databases, agreement {counts['agreement']}")
+    finally:
+        if export_file is not None:
+            export_file.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two GeoIP City databases range by range.")
+    parser.add_argument("--a", default=geoip2_path, help="First database: .mmdb file or CSV export directory.")
+    parser.add_argument("--b", default=geolite2_path, help="Second database: .mmdb file or CSV export directory.")
+    parser.add_argument("--export", help="CSV file for the ranges on which the databases disagree.")
+    args = parser.parse_args()
+    results = compare_datasets(args.a, args.b, args.export)
+    for family, counts in results.items():
+        print(f"{family}: {counts['both']:,} addresses in both, {counts['only_a']:,} only in a, "
+              f"{counts['only_b']:,} only in b")
+        for level in LEVELS:
+            level_counts = counts[level]
+            print(f"  {level}: {counts['agreement'][level]:.2%} agree "
+                  f"(same {level_counts['same']:,}, different {level_counts['different']:,}, "
+                  f"missing {level_counts['missing']:,})")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    main()
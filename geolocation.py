@@ -0,0 +1,202 @@
+"""
+Shared GeoIP lookups for the analysis scripts.
+
+`GeoLocator` reads the raw MaxMind DB record of an address (without building
+geoip2 model objects) together with the prefix length of the network the
+record belongs to. When that network covers the whole /24 (IPv4) or /48
+(IPv6) block of the address, the result is cached for the block, so every
+later address in it is answered from a dict without touching the database.
+Addresses in smaller networks are cached individually.
+
+The cache is also kept on disk, in an SQLite file next to the database
+(`<db>.cache.sqlite`). It is loaded when a `GeoLocator` is created and new
+entries are appended in batches, so a rerun over the same addresses hardly
+touches the database. The file records the type and build epoch of the
+database it was filled from and is emptied when the database changes.
+"""
+import atexit
+import ipaddress
+import json
+import logging
+import os
+import sqlite3
+from collections import namedtuple
+
+import maxminddb
+
+# Size of the blocks used as cache keys
+IPV4_BLOCK_PREFIX = 24
+IPV6_BLOCK_PREFIX = 48
+
+CACHE_SUFFIX = ".cache.sqlite"
+# New persistent cache entries written per transaction
+CACHE_FLUSH_SIZE = 10000
+
+# The fields of a GeoIP2 City record used by the analyses; missing values are None
+Location = namedtuple("Location", ["city", "subdivision", "country", "latitude", "longitude", "accuracy_radius", "asn"])
+
+
+def location_from_record(record):
+    """Convert a raw GeoIP2 City record (as returned by maxminddb) into a `Location`."""
+    subdivisions = record.get("subdivisions")
+    location = record.get("location", {})
+    return Location(
+        city=record.get("city", {}).get("names", {}).get("en"),
+        subdivision=subdivisions[-1].get("names", {}).get("en") if subdivisions else None,
+        country=record.get("country", {}).get("iso_code"),
+        latitude=location.get("latitude"),
+        longitude=location.get("longitude"),
+        accuracy_radius=location.get("accuracy_radius"),
+        asn=record.get("traits", {}).get("autonomous_system_number"),
+    )
+
+
+class GeoLocator:
+    """
+    GeoIP2 City lookups with a per-network-block cache.
+
+    Attributes:
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that had to search the database.
+        loaded (int): Cache entries loaded from the persistent cache.
+    """
+
+    def __init__(self, db_path, mode=maxminddb.MODE_AUTO, persistent=True, cache_path=None):
+        """
+        Args:
+            db_path (str): GeoIP2 City mmdb file.
+            mode (int): maxminddb open mode.
+            persistent (bool): Keep the cache on disk across runs.
+            cache_path (str, optional): Persistent cache file; defaults to `db_path` + ".cache.sqlite".
+        """
+        self.db_path = db_path
+        self.reader = maxminddb.open_database(db_path, mode)
+        self._block_cache = {}
+        self._ip_cache = {}
+        self.hits = 0
+        self.misses = 0
+        self.loaded = 0
+
+        self.cache_path = (cache_path or db_path + CACHE_SUFFIX) if persistent else None
+        self._connection = None
+        self._connection_pid = None
+        self._pending = []
+        if self.cache_path:
+            self._load_cache()
+            atexit.register(self.flush)
+
+    @staticmethod
+    def _block_key(ip):
+        """Cache key of the /24 or /48 block of an address; raises ValueError for invalid addresses."""
+        if ":" in ip:
+            return ipaddress.IPv6Address(ip).packed[:IPV6_BLOCK_PREFIX // 8].hex(), IPV6_BLOCK_PREFIX
+        # Validate the whole address, so that e.g. 1.2.3.999 is not answered from the cached 1.2.3.0/24
+        ipaddress.IPv4Address(ip)
+        return ip.rpartition(".")[0], IPV4_BLOCK_PREFIX
+
+    def _connect(self):
+        """SQLite connection of this process; connections are not shared with forked workers."""
+        if self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.cache_path, timeout=60)
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _load_cache(self):
+        """Load the persistent cache, emptying it first if it was filled from another database build."""
+        metadata = self.reader.metadata()
+        build = json.dumps([metadata.database_type, metadata.build_epoch])
+        try:
+            connection = self._connect()
+            with connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+                connection.execute("CREATE TABLE IF NOT EXISTS locations "
+                                   "(is_block INTEGER, key TEXT, location TEXT, PRIMARY KEY (is_block, key))")
+                row = connection.execute("SELECT value FROM meta WHERE key = 'build'").fetchone()
+                if row is None or row[0] != build:
+                    connection.execute("DELETE FROM locations")
+                    connection.execute("INSERT OR REPLACE INTO meta VALUES ('build', ?)", (build,))
+            for is_block, key, location in connection.execute("SELECT is_block, key, location FROM locations"):
+                location = json.loads(location)
+                cache = self._block_cache if is_block else self._ip_cache
+                cache[key] = None if location is None else Location(*location)
+                self.loaded += 1
+        except sqlite3.Error as e:
+            logging.warning(f"Persistent GeoIP cache {self.cache_path} is not usable, continuing without it: {e}")
+            self.cache_path = None
+
+    def _remember(self, is_block, key, location):
+        if self.cache_path:
+            self._pending.append((is_block, key, json.dumps(location)))
+            if len(self._pending) >= CACHE_FLUSH_SIZE:
+                self.flush()
+
+    def flush(self):
+        """Write the new cache entries to the persistent cache."""
+        if not self.cache_path or not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            with self._connect() as connection:
+                connection.executemany("INSERT OR REPLACE INTO locations VALUES (?, ?, ?)", pending)
+        except sqlite3.Error as e:
+            logging.warning(f"Could not update the persistent GeoIP cache {self.cache_path}: {e}")
+
+    def lookup(self, ip):
+        """
+        Return the `Location` of an IP address, or None if the address is not
+        in the database or is not a valid IP address.
+        """
+        try:
+            block, block_prefix = self._block_key(ip)
+        except ValueError:
+            return None
+        if block in self._block_cache:
+            self.hits += 1
+            return self._block_cache[block]
+        if ip in self._ip_cache:
+            self.hits += 1
+            return self._ip_cache[ip]
+
+        self.misses += 1
+        try:
+            record, prefix_len = self.reader.get_with_prefix_len(ip)
+        except ValueError:
+            return None
+        location = location_from_record(record) if record else None
+        if prefix_len <= block_prefix:
+            self._block_cache[block] = location
+            self._remember(True, block, location)
+        else:
+            self._ip_cache[ip] = location
+            self._remember(False, ip, location)
+        return location
+
+    def country(self, ip):
+        """ISO country code of an IP address, or None."""
+        location = self.lookup(ip)
+        return location.country if location else None
+
+    def stats(self):
+        """Cache hit/miss counters, e.g. for logging at the end of a run."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "cached_blocks": len(self._block_cache),
+            "cached_ips": len(self._ip_cache),
+            "loaded": self.loaded,
+        }
+
+    def close(self):
+        self.flush()
+        if self._connection is not None and self._connection_pid == os.getpid():
+            self._connection.close()
+        self._connection = self._connection_pid = None
+        self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
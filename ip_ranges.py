@@ -0,0 +1,282 @@
+"""
+Sets of IP address ranges for fast membership tests.
+
+An `IntervalSet` holds a list of networks as collapsed, sorted
+[start, end] integer intervals, so testing an address is a binary search
+instead of a scan over every network. `contains_many` tests a whole batch of
+integer-encoded addresses at once (vectorized with NumPy when it is installed
+and the intervals fit in 64 bits, i.e. for IPv4).
+
+`load_interval_set` reads a text file with one network per line (such as the
+fullbogons lists) and caches the compiled intervals next to it
+(`<file>.intervals`), so later runs skip parsing the text.
+
+`classify_ip` sorts addresses into special-purpose categories (private,
+CGNAT, loopback, ...) with an `IntervalMap` over the integer-encoded address.
+"""
+import ipaddress
+import logging
+import os
+import pickle
+from bisect import bisect_right
+
+from traceroute_index import file_signature
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+INTERVALS_SUFFIX = ".intervals"
+
+
+class IntervalSet:
+    """
+    Disjoint, sorted, non-adjacent integer intervals [starts[i], ends[i]].
+
+    Supports `int in interval_set` for single integer-encoded addresses.
+    """
+
+    def __init__(self, starts=(), ends=()):
+        self.starts = list(starts)
+        self.ends = list(ends)
+        self._np_bounds = None
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """Build a set from (start, end) pairs, merging overlapping and adjacent ranges."""
+        starts, ends = [], []
+        for start, end in sorted(ranges):
+            if ends and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        return cls(starts, ends)
+
+    @classmethod
+    def from_networks(cls, networks):
+        """Build a set from `ipaddress` network objects (of one address family)."""
+        return cls.from_ranges((int(network.network_address), int(network.broadcast_address))
+                               for network in networks)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __contains__(self, value):
+        index = bisect_right(self.starts, value) - 1
+        return index >= 0 and value <= self.ends[index]
+
+    def contains_many(self, values):
+        """
+        Test a batch of integer-encoded addresses.
+
+        Returns:
+            A boolean NumPy array if NumPy is installed and the intervals fit in
+            64 bits, otherwise a list of bools.
+        """
+        if np is not None and (not self.ends or self.ends[-1] < 2 ** 64):
+            if self._np_bounds is None:
+                self._np_bounds = (np.array(self.starts, dtype=np.uint64), np.array(self.ends, dtype=np.uint64))
+            starts, ends = self._np_bounds
+            values = np.asarray(values, dtype=np.uint64)
+            if not len(starts):
+                return np.zeros(len(values), dtype=bool)
+            index = np.searchsorted(starts, values, side="right") - 1
+            return (index >= 0) & (values <= ends[np.maximum(index, 0)])
+        return [value in self for value in values]
+
+    def __getstate__(self):
+        return {"starts": self.starts, "ends": self.ends}
+
+    def __setstate__(self, state):
+        self.__init__(state["starts"], state["ends"])
+
+
+class IntervalMap:
+    """
+    Disjoint, sorted integer intervals with a value each; `get` returns the
+    value of the interval containing an integer, or `default`.
+    """
+
+    def __init__(self, starts, ends, values, default=None):
+        self.starts = list(starts)
+        self.ends = list(ends)
+        self.values = list(values)
+        self.default = default
+        self._np_arrays = None
+
+    @classmethod
+    def from_layers(cls, layers, default=None):
+        """
+        Build a map from (start, end, value) ranges that may overlap; where they
+        do, the range listed last wins. Adjacent ranges with the same value are merged.
+        """
+        layers = list(layers)
+        points = sorted({start for start, _, _ in layers} | {end + 1 for _, end, _ in layers})
+        starts, ends, values = [], [], []
+        for start, next_start in zip(points, points[1:]):
+            value = default
+            for layer_start, layer_end, layer_value in layers:
+                if layer_start <= start <= layer_end:
+                    value = layer_value
+            if value == default:
+                continue
+            if values and values[-1] == value and ends[-1] + 1 == start:
+                ends[-1] = next_start - 1
+            else:
+                starts.append(start)
+                ends.append(next_start - 1)
+                values.append(value)
+        return cls(starts, ends, values, default)
+
+    def get(self, value):
+        index = bisect_right(self.starts, value) - 1
+        if index >= 0 and value <= self.ends[index]:
+            return self.values[index]
+        return self.default
+
+    def get_many(self, values):
+        """
+        Look up a batch of integers; vectorized like `IntervalSet.contains_many`
+        (the values of the map must then be integers).
+        """
+        if np is not None and (not self.ends or self.ends[-1] < 2 ** 64):
+            if self._np_arrays is None:
+                self._np_arrays = (np.array(self.starts, dtype=np.uint64), np.array(self.ends, dtype=np.uint64),
+                                   np.array(self.values))
+            starts, ends, mapped = self._np_arrays
+            values = np.asarray(values, dtype=np.uint64)
+            if not len(starts):
+                return np.full(len(values), self.default)
+            index = np.searchsorted(starts, values, side="right") - 1
+            clipped = np.maximum(index, 0)
+            found = (index >= 0) & (values <= ends[clipped])
+            return np.where(found, mapped[clipped], self.default)
+        return [self.get(value) for value in values]
+
+    def __len__(self):
+        return len(self.starts)
+
+
+# --- Special-purpose addresses ---
+
+PUBLIC, PRIVATE, CGNAT, LOOPBACK, LINK_LOCAL, MULTICAST, DOCUMENTATION, RESERVED = range(8)
+CATEGORY_NAMES = ("public", "private", "cgnat", "loopback", "link-local", "multicast", "documentation", "reserved")
+
+# The categories matched by `ipaddress`'s is_private plus 100.64.0.0/10, i.e.
+# the addresses the latency scripts skip. Multicast is not among them.
+NON_PUBLIC = frozenset({PRIVATE, CGNAT, LOOPBACK, LINK_LOCAL, DOCUMENTATION, RESERVED})
+
+# Networks of each category; later entries override earlier ones. Together the
+# non-public categories cover exactly the is_private networks of `ipaddress`
+# (as of Python 3.11) plus CGNAT. IPv4-mapped IPv6 addresses are added by
+# `_special_layers`.
+_SPECIAL_NETWORKS = {
+    4: [
+        ("0.0.0.0/8", RESERVED), ("192.0.0.0/29", RESERVED), ("192.0.0.170/31", RESERVED),
+        ("198.18.0.0/15", RESERVED), ("240.0.0.0/4", RESERVED),
+        ("10.0.0.0/8", PRIVATE), ("172.16.0.0/12", PRIVATE), ("192.168.0.0/16", PRIVATE),
+        ("100.64.0.0/10", CGNAT),
+        ("127.0.0.0/8", LOOPBACK),
+        ("169.254.0.0/16", LINK_LOCAL),
+        ("192.0.2.0/24", DOCUMENTATION), ("198.51.100.0/24", DOCUMENTATION), ("203.0.113.0/24", DOCUMENTATION),
+        ("224.0.0.0/4", MULTICAST),
+    ],
+    6: [
+        ("::/128", RESERVED), ("100::/64", RESERVED), ("2001::/23", RESERVED),
+        ("fc00::/7", PRIVATE),
+        ("::1/128", LOOPBACK),
+        ("fe80::/10", LINK_LOCAL),
+        ("2001:db8::/32", DOCUMENTATION),
+        ("ff00::/8", MULTICAST),
+    ],
+}
+
+IPV4_MAPPED_NETWORK = ipaddress.ip_network("::ffff:0:0/96")
+
+
+def _special_layers(version):
+    """(start, end, category) of the special-purpose networks of one address family."""
+    for text, category in _SPECIAL_NETWORKS[version]:
+        network = ipaddress.ip_network(text)
+        yield int(network.network_address), int(network.broadcast_address), category
+    if version == 6:
+        # An IPv4-mapped address (::ffff:a.b.c.d) is private when its IPv4 address is, as
+        # for is_private; the CGNAT check only ever applied to IPv4 addresses.
+        offset = int(IPV4_MAPPED_NETWORK.network_address)
+        for start, end, category in _special_layers(4):
+            if category != CGNAT:
+                yield offset + start, offset + end, category
+
+
+SPECIAL_PURPOSE = {version: IntervalMap.from_layers(_special_layers(version), default=PUBLIC)
+                   for version in _SPECIAL_NETWORKS}
+
+
+def classify_int(value, version):
+    """Special-purpose category of an integer-encoded IPv4 (`version` 4) or IPv6 address."""
+    return SPECIAL_PURPOSE[version].get(value)
+
+
+def classify_ip(ip):
+    """Special-purpose category of an IP address string, or None if it is not a valid address."""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    return SPECIAL_PURPOSE[address.version].get(int(address))
+
+
+def classify_many(values, version):
+    """
+    Special-purpose categories of a batch of integer-encoded addresses of one
+    family; a NumPy array when NumPy is installed (vectorized for IPv4).
+    """
+    return SPECIAL_PURPOSE[version].get_many(values)
+
+
+def read_networks(file_path):
+    """
+    Read the networks of a text file with one network per line; blank lines and
+    lines starting with '#' are skipped and invalid lines are logged.
+    """
+    networks = []
+    with open(file_path, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                networks.append(ipaddress.ip_network(line))
+            except ValueError:
+                logging.error(f"Invalid IP range found in {file_path}: {line}")
+    return networks
+
+
+def load_interval_set(file_path):
+    """
+    Load the networks of a text file as an `IntervalSet`, using the compiled
+    cache next to the file when it is up to date and writing it otherwise.
+    All networks of the file must be of the same address family.
+    """
+    cache_path = file_path + INTERVALS_SUFFIX
+    signature = file_signature(file_path)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as cache_file:
+                state = pickle.load(cache_file)
+            if state["signature"] == signature:
+                return state["intervals"]
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable interval cache {cache_path}: {e}")
+
+    intervals = IntervalSet.from_networks(read_networks(file_path))
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as cache_file:
+            pickle.dump({"signature": signature, "intervals": intervals}, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Could not write interval cache {cache_path}: {e}")
+    return intervals
@@ -0,0 +1,172 @@
+"""
+Compiled jurisdiction model shared by the analysis scripts.
+
+`jurisdictions.json` is the single definition of the legal frameworks (GDPR,
+CCPA, ...) and of the country code aliases (e.g. the EU code EL for GR).
+`JurisdictionModel` compiles it into arrays indexed by integer country ids:
+
+    framework_of[country_id]      framework id (the default framework, "Other",
+                                  for countries not listed in any framework)
+    jurisdiction_of[country_id]   jurisdiction id: the framework id for the
+                                  "merged_frameworks" (reported as one entity,
+                                  like "GDPR"), otherwise an id of its own
+
+so mapping a country to its framework or jurisdiction is a list lookup rather
+than a scan over every framework list. Id 0 stands for an unknown location
+in all three id spaces.
+
+The set of frameworks or jurisdictions a path visits is a bitmask
+(`1 << id` per visited id, see `bit`). `path_masks`, `contains` and
+`has_foreign` evaluate such masks for many paths at once, vectorized with
+NumPy when it is installed; they need ids below 64, which holds for the
+frameworks.
+"""
+import json
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+JURISDICTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jurisdictions.json")
+
+UNKNOWN = 0
+
+
+def bit(jurisdiction_id):
+    """Mask bit of a framework or jurisdiction id (`UNKNOWN` has bit 0)."""
+    return 1 << jurisdiction_id
+
+
+class JurisdictionModel:
+    """
+    Countries, frameworks and jurisdictions with dense integer ids, compiled
+    from a jurisdiction config. Countries that are not in the config get
+    their ids (and jurisdiction ids) on first sight.
+    """
+
+    def __init__(self, config):
+        self.aliases = config.get("aliases", {})
+        self.default_framework = config["default_framework"]
+        self.framework_names = [None] + list(config["frameworks"]) + [self.default_framework]
+        self.default_framework_id = len(self.framework_names) - 1
+        self._framework_ids = {name: framework_id for framework_id, name in enumerate(self.framework_names)}
+
+        # Merged frameworks are jurisdictions of their own, with the same ids as frameworks
+        merged = set(config.get("merged_frameworks", ()))
+        self.jurisdiction_names = [name if name in merged else None for name in self.framework_names[:-1]]
+        self._jurisdiction_ids = {name: jurisdiction_id for jurisdiction_id, name in enumerate(self.jurisdiction_names)
+                                  if name is not None}
+
+        self.country_codes = [None]
+        self.framework_of = [UNKNOWN]
+        self.jurisdiction_of = [UNKNOWN]
+        self._country_ids = {}
+        for name, countries in config["frameworks"].items():
+            for country in countries:
+                self._add_country(self.canonical(country), self._framework_ids[name])
+
+    def canonical(self, country):
+        """The ISO code of a country code, resolving aliases such as EL -> GR."""
+        return self.aliases.get(country, country)
+
+    def _add_country(self, country, framework_id):
+        country_id = self._country_ids[country] = len(self.country_codes)
+        self.country_codes.append(country)
+        self.framework_of.append(framework_id)
+        name = self.framework_names[framework_id]
+        if name not in self._jurisdiction_ids:
+            # The country is a jurisdiction of its own
+            name = country
+            self._jurisdiction_ids[name] = len(self.jurisdiction_names)
+            self.jurisdiction_names.append(name)
+        self.jurisdiction_of.append(self._jurisdiction_ids[name])
+        return country_id
+
+    def country_id(self, country):
+        """Id of a country code (`UNKNOWN` for None or an empty code)."""
+        if not country:
+            return UNKNOWN
+        country_id = self._country_ids.get(country)
+        if country_id is None:
+            country = self.canonical(country)
+            country_id = self._country_ids.get(country)
+            if country_id is None:
+                country_id = self._add_country(country, self.default_framework_id)
+            self._country_ids[country] = country_id
+        return country_id
+
+    def framework_id(self, country):
+        return self.framework_of[self.country_id(country)]
+
+    def framework(self, country):
+        """Name of the legal framework of a country code, the default framework if it has none, None if unknown."""
+        return self.framework_names[self.framework_id(country)]
+
+    def jurisdiction_id(self, country):
+        """Jurisdiction id of a country code, or of a merged framework label such as "GDPR"."""
+        jurisdiction_id = self._jurisdiction_ids.get(country)
+        if jurisdiction_id is None:
+            jurisdiction_id = self.jurisdiction_of[self.country_id(country)]
+        return jurisdiction_id
+
+    def label(self, country):
+        """
+        Jurisdiction label of a country code: the merged framework it belongs to
+        (e.g. "GDPR"), otherwise its ISO code. None for an unknown country.
+        """
+        return self.jurisdiction_names[self.jurisdiction_id(country)]
+
+    def members(self, name):
+        """ISO codes of the countries of a framework or jurisdiction label (a country code is its own member)."""
+        framework_id = self._framework_ids.get(name)
+        if framework_id is None:
+            return {self.canonical(name)}
+        return {country for country, country_framework in zip(self.country_codes, self.framework_of)
+                if country_framework == framework_id and country is not None}
+
+
+def load_jurisdictions(path=JURISDICTIONS_PATH):
+    """Load and compile a jurisdiction config file."""
+    with open(path, encoding="utf-8") as config_file:
+        return JurisdictionModel(json.load(config_file))
+
+
+# --- Path bitmasks ---
+
+def path_masks(paths):
+    """
+    Masks of many paths, each given as an iterable of framework or jurisdiction
+    ids; a uint64 NumPy array when NumPy is installed, otherwise a list of ints.
+    """
+    masks = []
+    for ids in paths:
+        mask = 0
+        for jurisdiction_id in ids:
+            mask |= 1 << jurisdiction_id
+        masks.append(mask)
+    return np.array(masks, dtype=np.uint64) if np is not None else masks
+
+
+def _bits(ids):
+    if np is not None:
+        return np.left_shift(np.uint64(1), np.asarray(ids, dtype=np.uint64))
+    return [1 << jurisdiction_id for jurisdiction_id in ids]
+
+
+def contains(masks, jurisdiction_id):
+    """For each mask, whether the path visits `jurisdiction_id` (e.g. an avoided jurisdiction)."""
+    if np is not None:
+        return (np.asarray(masks, dtype=np.uint64) & np.uint64(1 << jurisdiction_id)) != 0
+    return [bool(mask & (1 << jurisdiction_id)) for mask in masks]
+
+
+def has_foreign(masks, own_ids):
+    """
+    For each mask, whether the path visits anything other than its own
+    framework or jurisdiction `own_ids[i]`, e.g. a foreign or unknown hop.
+    """
+    if np is not None:
+        return (np.asarray(masks, dtype=np.uint64) & ~_bits(own_ids)) != 0
+    return [bool(mask & ~own) for mask, own in zip(masks, _bits(own_ids))]
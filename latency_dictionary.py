@@ -1,304 +1,718 @@
-import geoip2.database
-import logging
-import json
-from collections import defaultdict
-from tqdm import tqdm
-import ipaddress
-import os
-
-# File paths
-statistics_file = "latency_statistics3.txt"
-latency_json_file = "latency_data3.json"
-geoip_db_path = 'E:/internet-graph-master/dataset/GeoIP2-City.mmdb'
-traceroute_file_path = "E:/internet-graph-master/dataset/traceroute-2024-10-01T0000"
-
-# List of GDPR countries
-gdpr_countries = {
-    "AT", "BE", "BG", "CY", "CZ", "DE", "DK", "EE", "ES", "FI", "FR", "GR", "HR", 
-    "HU", "IE", "IT", "LT", "LU", "LV", "MT", "NL", "PL", "PT", "RO", "SE", "SI", "SK"
-}
-
-# Remove output files if they exist
-if os.path.exists(statistics_file):
-    os.remove(statistics_file)
-if os.path.exists(latency_json_file):
-    os.remove(latency_json_file)
-
-# Initialize logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
-
-# GeoIP database reader
-geoip_reader = geoip2.database.Reader(geoip_db_path)
-
-# Initialize counters and sets for statistics
-total_ip_addresses = 0
-unique_ip_addresses = set()
-total_latencies = 0
-unique_cities = set()
-unique_countries = set()
-unique_subdivisions = set()
-missing_city_name_counter = 0
-missing_country_counter = 0
-private_or_cgnat_ip_counter = 0
-
-ipv4_count = 0
-ipv6_count = 0
-unique_ipv4 = set()
-unique_ipv6 = set()
-
-# Specific counters for source, hop, and destination IPs
-source_ipv4_count = 0
-source_ipv6_count = 0
-hop_ipv4_count = 0
-hop_ipv6_count = 0
-destination_ipv4_count = 0
-destination_ipv6_count = 0
-
-# Country-specific statistics, treating GDPR countries as one entity
-country_stats = defaultdict(lambda: {
-    "total": {"ipv4": 0, "ipv6": 0, "unique_ipv4": set(), "unique_ipv6": set()},
-    "source": {"ipv4": 0, "ipv6": 0, "unique_ipv4": set(), "unique_ipv6": set()},
-    "hop": {"ipv4": 0, "ipv6": 0, "unique_ipv4": set(), "unique_ipv6": set()},
-    "destination": {"ipv4": 0, "ipv6": 0, "unique_ipv4": set(), "unique_ipv6": set()},
-    "path_counts": {
-        "source_only": 0,
-        "source_destination": 0,
-        "source_all_hops_destination": 0,
-        "source_with_other_country": defaultdict(int),
-        "boomerang_paths": defaultdict(lambda: {"total": 0, "per_traceroute": defaultdict(int)})
-    }
-})
-
-# Dictionary to hold latencies for each city pair
-latency_data = defaultdict(lambda: defaultdict(lambda: {"latency_count": 0, "latencies": []}))
-
-def is_private_or_cgnat_ip(ip):
-    """Check if the IP address is within a private or CGNAT range."""
-    try:
-        ip_obj = ipaddress.ip_address(ip)
-        return ip_obj.is_private or ip_obj in ipaddress.ip_network("100.64.0.0/10")
-    except ValueError:
-        return False
-
-def get_country_label(country_code):
-    """Returns 'GDPR' if the country is in the GDPR list, otherwise returns the country code."""
-    return "GDPR" if country_code in gdpr_countries else country_code
-
-def city_id_from_ip(ip):
-    """Get city_id based on IP using the GeoIP database."""
-    global missing_city_name_counter, missing_country_counter, private_or_cgnat_ip_counter
-    if is_private_or_cgnat_ip(ip):
-        private_or_cgnat_ip_counter += 1
-        return None, None
-
-    try:
-        response = geoip_reader.city(ip)
-        city = response.city.name
-        subdivision = response.subdivisions.most_specific.name
-        country = response.country.iso_code
-
-        if not city:
-            missing_city_name_counter += 1
-        if not country:
-            missing_country_counter += 1
-
-        if city and country:
-            unique_cities.add(city)
-            country_label = get_country_label(country)
-            unique_countries.add(country_label)
-            if subdivision:
-                unique_subdivisions.add(subdivision)
-            return f"{city}#{subdivision}#{country_label}", country_label
-    except geoip2.errors.AddressNotFoundError:
-        pass
-    return None, None
-
-def update_ip_stats(ip, category, country=None):
-    """Classify and count IP addresses by type and track statistics."""
-    global total_ip_addresses, ipv4_count, ipv6_count
-    global source_ipv4_count, source_ipv6_count, hop_ipv4_count, hop_ipv6_count, destination_ipv4_count, destination_ipv6_count
-
-    try:
-        ip_obj = ipaddress.ip_address(ip)
-        total_ip_addresses += 1
-
-        if ip_obj.version == 4:
-            ipv4_count += 1
-            unique_ipv4.add(ip)
-            if country:
-                country_stats[country]["total"]["ipv4"] += 1
-                country_stats[country]["total"]["unique_ipv4"].add(ip)
-            if category == "source":
-                source_ipv4_count += 1
-                if country:
-                    country_stats[country]["source"]["ipv4"] += 1
-                    country_stats[country]["source"]["unique_ipv4"].add(ip)
-            elif category == "hop":
-                hop_ipv4_count += 1
-                if country:
-                    country_stats[country]["hop"]["ipv4"] += 1
-                    country_stats[country]["hop"]["unique_ipv4"].add(ip)
-            elif category == "destination":
-                destination_ipv4_count += 1
-                if country:
-                    country_stats[country]["destination"]["ipv4"] += 1
-                    country_stats[country]["destination"]["unique_ipv4"].add(ip)
-        elif ip_obj.version == 6:
-            ipv6_count += 1
-            unique_ipv6.add(ip)
-            if country:
-                country_stats[country]["total"]["ipv6"] += 1
-                country_stats[country]["total"]["unique_ipv6"].add(ip)
-            if category == "source":
-                source_ipv6_count += 1
-                if country:
-                    country_stats[country]["source"]["ipv6"] += 1
-                    country_stats[country]["source"]["unique_ipv6"].add(ip)
-            elif category == "hop":
-                hop_ipv6_count += 1
-                if country:
-                    country_stats[country]["hop"]["ipv6"] += 1
-                    country_stats[country]["hop"]["unique_ipv6"].add(ip)
-            elif category == "destination":
-                destination_ipv6_count += 1
-                if country:
-                    country_stats[country]["destination"]["ipv6"] += 1
-                    country_stats[country]["destination"]["unique_ipv6"].add(ip)
-
-        unique_ip_addresses.add(ip)
-    except ValueError:
-        logging.error(f"Invalid IP address encountered: {ip}")
-
-
-def calculate_latency(rtt):
-    """Calculate latency as half the round-trip time (RTT)."""
-    return rtt / 2.0
-
-def process_traceroute_line(line):
-    """Process each traceroute line to extract city-to-city latency data."""
-    global total_latencies
-
-    try:
-        data = json.loads(line)
-        src_addr = data.get("src_addr")
-        dst_addr = data.get("dst_addr")
-        results = data.get("result", [])
-
-        if src_addr:
-            city_a_id, src_country = city_id_from_ip(src_addr)
-            if city_a_id:
-                update_ip_stats(src_addr, "source", src_country)
-        else:
-            city_a_id, src_country = None, None
-
-        hop_countries = set()
-        path_countries = []
-        source_to_dest = False
-
-        for hop in results:
-            hop_results = hop.get("result", [])
-
-            for hop_data in hop_results:
-                from_ip = hop_data.get("from")
-                rtt = hop_data.get("rtt")
-
-                if from_ip and rtt is not None:
-                    city_b_id, hop_country = city_id_from_ip(from_ip)
-                    if city_b_id:
-                        update_ip_stats(from_ip, "hop", hop_country)
-                        if hop_country and hop_country != src_country:
-                            hop_countries.add(hop_country)
-                        path_countries.append(hop_country)
-
-                    if city_a_id and city_b_id and city_a_id != city_b_id:
-                        latency = calculate_latency(rtt)
-                        if latency != 0.0 :
-                            latency_data[city_a_id][city_b_id]["latencies"].append(latency)
-                            latency_data[city_a_id][city_b_id]["latency_count"] += 1
-                            total_latencies += 1
-                            city_a_id = city_b_id
-
-        if dst_addr:
-            dst_city_id, dst_country = city_id_from_ip(dst_addr)
-            if dst_city_id:
-                update_ip_stats(dst_addr, "destination", dst_country)
-            if city_a_id and dst_city_id and city_a_id != dst_city_id:
-                avg_rtt = sum(hop_data.get("rtt", 0) for hop_data in hop_results if hop_data.get("rtt") is not None) / max(len(hop_results), 1)
-                latency = calculate_latency(avg_rtt)
-                if latency != 0.0 :
-                    latency_data[city_a_id][dst_city_id]["latencies"].append(latency)
-                    latency_data[city_a_id][dst_city_id]["latency_count"] += 1
-                    total_latencies += 1
-
-            source_to_dest = src_country == dst_country
-            if src_country:
-                if source_to_dest:
-                    country_stats[src_country]["path_counts"]["source_destination"] += 1
-                if dst_country == src_country and hop_countries:
-                    for hop_country in hop_countries:
-                        country_stats[src_country]["path_counts"]["boomerang_paths"][hop_country]["total"] += 1
-                        country_stats[src_country]["path_counts"]["boomerang_paths"][hop_country]["per_traceroute"][line] += 1
-        if src_country:
-            if not hop_countries:
-                country_stats[src_country]["path_counts"]["source_only"] += 1
-            if hop_countries and dst_country:
-                for hop_country in hop_countries:
-                    if hop_country and hop_country != src_country:
-                        country_stats[src_country]["path_counts"]["source_with_other_country"][hop_country] += 1
-    except Exception as e:
-        logging.error(f"Error processing line: {e}")
-
-def main():
-    logging.info("Starting traceroute processing")
-
-    with open(traceroute_file_path, "r") as file:
-        for i, line in enumerate(tqdm(file, total=8706125, desc="Processing traceroute lines", unit=" lines")):
-            process_traceroute_line(line)
-
-    # Write statistics to the text file
-    with open(statistics_file, "w") as file:
-        file.write(f"Total IP addresses processed: {total_ip_addresses}\n")
-        file.write(f"Unique IP addresses: {len(unique_ip_addresses)}\n")
-        file.write(f"Total latencies recorded: {total_latencies}\n")
-        file.write(f"Unique cities: {len(unique_cities)}\n")
-        file.write(f"Unique countries: {len(unique_countries)}\n")
-        file.write(f"Unique subdivisions: {len(unique_subdivisions)}\n")
-        file.write(f"Missing city names: {missing_city_name_counter}\n")
-        file.write(f"Missing countries: {missing_country_counter}\n")
-        file.write(f"Private or CGNAT IP addresses skipped: {private_or_cgnat_ip_counter}\n")
-        file.write(f"Total IPv4 addresses: {ipv4_count}\n")
-        file.write(f"Total IPv6 addresses: {ipv6_count}\n")
-        file.write(f"Unique IPv4 addresses: {len(unique_ipv4)}\n")
-        file.write(f"Unique IPv6 addresses: {len(unique_ipv6)}\n")
-
-        for country, stats in country_stats.items():
-            file.write(f"\n--- Country: {country} ---\n")
-            file.write(f"  Total IPs:\n")
-            file.write(f"    IPv4: {stats['total']['ipv4']}, Unique IPv4: {len(stats['total']['unique_ipv4'])}\n")
-            file.write(f"    IPv6: {stats['total']['ipv6']}, Unique IPv6: {len(stats['total']['unique_ipv6'])}\n")
-            file.write(f"  Source IPs:\n")
-            file.write(f"    IPv4: {stats['source']['ipv4']}, Unique IPv4: {len(stats['source']['unique_ipv4'])}\n")
-            file.write(f"    IPv6: {stats['source']['ipv6']}, Unique IPv6: {len(stats['source']['unique_ipv6'])}\n")
-            file.write(f"  Hop IPs:\n")
-            file.write(f"    IPv4: {stats['hop']['ipv4']}, Unique IPv4: {len(stats['hop']['unique_ipv4'])}\n")
-            file.write(f"    IPv6: {stats['hop']['ipv6']}, Unique IPv6: {len(stats['hop']['unique_ipv6'])}\n")
-            file.write(f"  Destination IPs:\n")
-            file.write(f"    IPv4: {stats['destination']['ipv4']}, Unique IPv4: {len(stats['destination']['unique_ipv4'])}\n")
-            file.write(f"    IPv6: {stats['destination']['ipv6']}, Unique IPv6: {len(stats['destination']['unique_ipv6'])}\n")
-            
-            file.write("  Path Counts:\n")
-            file.write(f"    Source Only: {stats['path_counts']['source_only']}\n")
-            file.write(f"    Source and Destination: {stats['path_counts']['source_destination']}\n")
-            file.write(f"    Source with All Hops and Destination: {stats['path_counts']['source_all_hops_destination']}\n")
-            file.write("    Boomerang Paths:\n")
-            for hop_country, boomerang_stats in stats["path_counts"]["boomerang_paths"].items():
-                file.write(f"      Through {hop_country}: {boomerang_stats['total']} total\n")
-                file.write("      Per Traceroute:\n")
-                for traceroute, count in boomerang_stats["per_traceroute"].items():
-                    file.write(f"        Traceroute {traceroute}: {count}\n")
-
-    with open(latency_json_file, "w") as json_file:
-        json.dump(latency_data, json_file, indent=4)
-
-if __name__ == "__main__":
-    main()
+import argparse
+import logging
+import json
+from collections import defaultdict
+from tqdm import tqdm
+import ipaddress
+import os
+import time
+from traceroute_reader import (JSONDecodeError, follow_raw_lines, iter_raw_lines, iter_raw_lines_with_offsets, parse_line,
+                               project_record)
+from sharding import SHARDS_PER_WORKER, compute_shards, merge_nested, run_shards, to_plain
+from checkpoint import CheckpointLog
+from traceroute_model import Traceroute
+from geolocation import GeoLocator
+from location_table import LocationKeys, LocationTable, load_location_table
+from ip_ranges import CATEGORY_NAMES, NON_PUBLIC, classify_ip
+from jurisdictions import load_jurisdictions
+from latency_stats import DEFAULT_SAMPLE_ENCODING, SAMPLE_ENCODINGS, LatencySamples, LatencySketch, encode_latencies
+from latency_runs import DEFAULT_MEMORY_BUDGET, clear_runs, write_percentiles_csv, write_run
+
+# File paths
+statistics_file = "latency_statistics3.txt"
+latency_json_file = "latency_data3.json"
+latency_csv_file = "latency_percentiles3.csv"
+checkpoint_file = "latency_checkpoint3.bin"
+geoip_db_path = 'E:/internet-graph-master/dataset/GeoIP2-City.mmdb'
+traceroute_file_path = "E:/internet-graph-master/dataset/traceroute-2024-10-01T0000"
+
+# GDPR and the other legal frameworks (see jurisdictions.json)
+jurisdiction_model = load_jurisdictions()
+
+# Lines between two checkpoints of a sequential run
+CHECKPOINT_INTERVAL = 500000
+
+# Follow mode: seconds between published snapshots, and between polls for new lines
+SNAPSHOT_INTERVAL = 60
+POLL_INTERVAL = 1.0
+
+# Relative accuracy of the per-pair latency sketches; None keeps every sample (see `use_sketches`)
+sketch_accuracy = None
+# Encoding of the kept samples (see `use_sample_encoding`)
+sample_encoding = DEFAULT_SAMPLE_ENCODING
+# Out-of-core mode: directory of the sorted latency runs, memory budget of the buffered samples
+# and the number of samples that fits in it (see `use_spill`)
+spill_dir = None
+spill_budget = DEFAULT_MEMORY_BUDGET
+spill_samples = 0
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+# GeoIP lookups, cached per network block
+geo_locator = GeoLocator(geoip_db_path)
+
+# Location ids of the IPs of the dump; see `use_location_table`. Addresses the
+# table does not cover (e.g. in follow mode) are resolved on first use.
+location_table = LocationTable(locator=geo_locator)
+
+def new_country_stats():
+    """Country-specific statistics, treating GDPR countries as one entity."""
+    return defaultdict(lambda: {
+        "total": {"ipv4": 0, "ipv6": 0, "unique_ipv4": set(), "unique_ipv6": set()},
+        "source": {"ipv4": 0, "ipv6": 0, "unique_ipv4": set(), "unique_ipv6": set()},
+        "hop": {"ipv4": 0, "ipv6": 0, "unique_ipv4": set(), "unique_ipv6": set()},
+        "destination": {"ipv4": 0, "ipv6": 0, "unique_ipv4": set(), "unique_ipv6": set()},
+        "path_counts": {
+            "source_only": 0,
+            "source_destination": 0,
+            "source_all_hops_destination": 0,
+            "source_with_other_country": defaultdict(int),
+            "boomerang_paths": defaultdict(lambda: {"total": 0, "per_traceroute": defaultdict(int)})
+        }
+    })
+
+def new_latency_samples():
+    """Storage for the latencies of one city pair: a `LatencySamples` array, or a `LatencySketch` in sketch mode."""
+    return LatencySketch(sketch_accuracy) if sketch_accuracy else LatencySamples(sample_encoding)
+
+def new_latency_data():
+    """Dictionary to hold latencies for each city pair."""
+    return defaultdict(lambda: defaultdict(lambda: {"latency_count": 0, "latencies": new_latency_samples()}))
+
+def use_sketches(relative_accuracy):
+    """
+    Keep the latencies of every city pair in a `LatencySketch` with the given
+    relative accuracy instead of a list of all samples (None keeps the samples).
+    Call it before creating any aggregator, in every process.
+    """
+    global sketch_accuracy
+    sketch_accuracy = relative_accuracy
+
+def use_sample_encoding(encoding):
+    """
+    Store the kept latency samples with `encoding`, a key of
+    `latency_stats.SAMPLE_ENCODINGS` (e.g. "fixed32" for 4 bytes per sample).
+    Call it before creating any aggregator, in every process.
+    """
+    global sample_encoding
+    sample_encoding = encoding
+
+def use_spill(run_dir, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Out-of-core mode: whenever the buffered latency samples of an aggregator
+    reach `memory_budget` bytes, write them to a sorted run in `run_dir` (see
+    `latency_runs`) and free them. `latency_runs.write_percentiles_csv` then
+    computes the exact statistics from the runs. None disables it.
+    Call it before creating any aggregator, in every process, after `use_sample_encoding`.
+    """
+    global spill_dir, spill_budget, spill_samples
+    spill_dir = run_dir
+    spill_budget = memory_budget
+    spill_samples = max(memory_budget // LatencySamples(sample_encoding).values.itemsize, 1)
+
+def is_private_or_cgnat_ip(ip):
+    """Check if the IP address is within a private or CGNAT range (or another non-public special-purpose range)."""
+    return classify_ip(ip) in NON_PUBLIC
+
+def get_country_label(country_code):
+    """Returns 'GDPR' if the country is in the GDPR list, otherwise returns the country code."""
+    return jurisdiction_model.label(country_code)
+
+def calculate_latency(rtt):
+    """Calculate latency as half the round-trip time (RTT)."""
+    return rtt / 2.0
+
+def city_key(place):
+    """'City#Subdivision#Country' key of a location; None unless both city and country are known."""
+    if place.city and place.country:
+        return f"{place.city}#{place.subdivision}#{get_country_label(place.country)}"
+    return None
+
+def country_key(place):
+    """Country label of a location; None unless both city and country are known."""
+    if place.city and place.country:
+        return get_country_label(place.country)
+    return None
+
+# The aggregators key their dictionaries by these integer ids; `to_state` and the writers turn them back into labels
+city_ids = LocationKeys(location_table, city_key)
+country_ids = LocationKeys(location_table, country_key)
+
+def use_location_table(file_path, workers=1, range_table=None):
+    """
+    Resolve all distinct IPs of the dump once up front (in `workers` processes,
+    or with a compiled `range_table.RangeTable`, or load the stored table) and
+    use the table for the lookups of this process. Call it before creating any aggregator.
+    """
+    global location_table, city_ids, country_ids
+    location_table = load_location_table(file_path, geoip_db_path, workers, locator=geo_locator,
+                                         range_table=range_table)
+    city_ids = LocationKeys(location_table, city_key)
+    country_ids = LocationKeys(location_table, country_key)
+
+
+class LatencyAggregator:
+    """
+    Counters, unique sets, country statistics and city-pair latencies of one run.
+
+    A sequential run uses a single aggregator; in parallel mode every worker
+    fills its own and the partial states are merged with `merge`.
+    """
+
+    def __init__(self):
+        # Counters and sets for statistics
+        self.total_ip_addresses = 0
+        self.unique_ip_addresses = set()
+        self.total_latencies = 0
+        self.unique_cities = set()
+        self.unique_countries = set()
+        self.unique_subdivisions = set()
+        self.missing_city_name_counter = 0
+        self.missing_country_counter = 0
+        self.private_or_cgnat_ip_counter = 0
+        self.skipped_by_category = defaultdict(int)
+        self.failed_lines = 0
+        # Latencies written to sorted runs in out-of-core mode
+        self.spilled_latencies = 0
+
+        self.ipv4_count = 0
+        self.ipv6_count = 0
+        self.unique_ipv4 = set()
+        self.unique_ipv6 = set()
+
+        # Specific counters for source, hop, and destination IPs
+        self.source_ipv4_count = 0
+        self.source_ipv6_count = 0
+        self.hop_ipv4_count = 0
+        self.hop_ipv6_count = 0
+        self.destination_ipv4_count = 0
+        self.destination_ipv6_count = 0
+
+        self.country_stats = new_country_stats()
+        self.latency_data = new_latency_data()
+
+    def city_id_from_ip(self, ip, count=1):
+        """
+        Get the (city id, country id) of an IP from the location table; `count` weights the skip/missing counters.
+        The ids index `city_ids.values` and `country_ids.values`.
+        """
+        category = classify_ip(ip)
+        if category in NON_PUBLIC:
+            self.private_or_cgnat_ip_counter += count
+            self.skipped_by_category[CATEGORY_NAMES[category]] += count
+            return None, None
+
+        location_id = location_table.location_id(ip)
+        if location_id is None:
+            return None, None
+        place = location_table.places[location_id]
+
+        if not place.city:
+            self.missing_city_name_counter += count
+        if not place.country:
+            self.missing_country_counter += count
+
+        city_id = city_ids.of_location(location_id)
+        if city_id is None:
+            return None, None
+        country_id = country_ids.of_location(location_id)
+        self.unique_cities.add(place.city)
+        self.unique_countries.add(country_ids.values[country_id])
+        if place.subdivision:
+            self.unique_subdivisions.add(place.subdivision)
+        return city_id, country_id
+
+    def update_ip_stats(self, ip, category, country=None, count=1):
+        """Classify and count IP addresses by type and track statistics; `count` is the number of replies from the IP."""
+        country_stats = self.country_stats
+        try:
+            ip_obj = ipaddress.ip_address(ip)
+            self.total_ip_addresses += count
+
+            if ip_obj.version == 4:
+                self.ipv4_count += count
+                self.unique_ipv4.add(ip)
+                if country:
+                    country_stats[country]["total"]["ipv4"] += count
+                    country_stats[country]["total"]["unique_ipv4"].add(ip)
+                if category == "source":
+                    self.source_ipv4_count += count
+                    if country:
+                        country_stats[country]["source"]["ipv4"] += count
+                        country_stats[country]["source"]["unique_ipv4"].add(ip)
+                elif category == "hop":
+                    self.hop_ipv4_count += count
+                    if country:
+                        country_stats[country]["hop"]["ipv4"] += count
+                        country_stats[country]["hop"]["unique_ipv4"].add(ip)
+                elif category == "destination":
+                    self.destination_ipv4_count += count
+                    if country:
+                        country_stats[country]["destination"]["ipv4"] += count
+                        country_stats[country]["destination"]["unique_ipv4"].add(ip)
+            elif ip_obj.version == 6:
+                self.ipv6_count += count
+                self.unique_ipv6.add(ip)
+                if country:
+                    country_stats[country]["total"]["ipv6"] += count
+                    country_stats[country]["total"]["unique_ipv6"].add(ip)
+                if category == "source":
+                    self.source_ipv6_count += count
+                    if country:
+                        country_stats[country]["source"]["ipv6"] += count
+                        country_stats[country]["source"]["unique_ipv6"].add(ip)
+                elif category == "hop":
+                    self.hop_ipv6_count += count
+                    if country:
+                        country_stats[country]["hop"]["ipv6"] += count
+                        country_stats[country]["hop"]["unique_ipv6"].add(ip)
+                elif category == "destination":
+                    self.destination_ipv6_count += count
+                    if country:
+                        country_stats[country]["destination"]["ipv6"] += count
+                        country_stats[country]["destination"]["unique_ipv6"].add(ip)
+
+            self.unique_ip_addresses.add(ip)
+        except ValueError:
+            logging.error(f"Invalid IP address encountered: {ip}")
+
+    def process_traceroute_line(self, line, data=None):
+        """
+        Process each traceroute line to extract city-to-city latency data.
+        `data` is the record already parsed by traceroute_reader; when omitted the line is decoded here.
+        """
+        country_stats = self.country_stats
+        latency_data = self.latency_data
+
+        try:
+            if data is None:
+                data = json.loads(line)
+            if isinstance(line, bytes):
+                line = line.decode("utf-8", "replace")
+            traceroute = Traceroute.from_record(data)
+            src_addr = traceroute.src_addr
+            dst_addr = traceroute.dst_addr
+
+            if src_addr:
+                city_a_id, src_country = self.city_id_from_ip(src_addr)
+                if city_a_id:
+                    self.update_ip_stats(src_addr, "source", src_country)
+            else:
+                city_a_id, src_country = None, None
+
+            hop_countries = set()
+            path_countries = []
+            source_to_dest = False
+
+            # One lookup per responding IP of a hop, with the counters weighted by its replies;
+            # the latencies are still recorded reply by reply, in reply order
+            for hop in traceroute.hops:
+                locations = {}
+                for from_ip, rtt_count in zip(hop.ips, hop.rtt_counts):
+                    if rtt_count:
+                        city_b_id, hop_country = locations[from_ip] = self.city_id_from_ip(from_ip, rtt_count)
+                        if city_b_id:
+                            self.update_ip_stats(from_ip, "hop", hop_country, rtt_count)
+                            if hop_country and hop_country != src_country:
+                                hop_countries.add(hop_country)
+
+                for from_ip, rtt in hop.replies:
+                    city_b_id, hop_country = locations[from_ip]
+                    if city_b_id:
+                        path_countries.append(hop_country)
+
+                    if city_a_id and city_b_id and city_a_id != city_b_id:
+                        latency = calculate_latency(rtt)
+                        if latency != 0.0 :
+                            latency_data[city_a_id][city_b_id]["latencies"].append(latency)
+                            latency_data[city_a_id][city_b_id]["latency_count"] += 1
+                            self.total_latencies += 1
+                            city_a_id = city_b_id
+
+            # Country ids are assigned per process: order by label, so sharded runs count and write in the same order
+            hop_countries = sorted(hop_countries, key=country_ids.values.__getitem__)
+
+            if dst_addr:
+                dst_city_id, dst_country = self.city_id_from_ip(dst_addr)
+                if dst_city_id:
+                    self.update_ip_stats(dst_addr, "destination", dst_country)
+                if city_a_id and dst_city_id and city_a_id != dst_city_id:
+                    avg_rtt = traceroute.hops[-1].average_rtt() if traceroute.hops else 0
+                    latency = calculate_latency(avg_rtt)
+                    if latency != 0.0 :
+                        latency_data[city_a_id][dst_city_id]["latencies"].append(latency)
+                        latency_data[city_a_id][dst_city_id]["latency_count"] += 1
+                        self.total_latencies += 1
+
+                source_to_dest = src_country == dst_country
+                if src_country:
+                    if source_to_dest:
+                        country_stats[src_country]["path_counts"]["source_destination"] += 1
+                    if dst_country == src_country and hop_countries:
+                        for hop_country in hop_countries:
+                            country_stats[src_country]["path_counts"]["boomerang_paths"][hop_country]["total"] += 1
+                            country_stats[src_country]["path_counts"]["boomerang_paths"][hop_country]["per_traceroute"][line] += 1
+            if src_country:
+                if not hop_countries:
+                    country_stats[src_country]["path_counts"]["source_only"] += 1
+                if hop_countries and dst_country:
+                    for hop_country in hop_countries:
+                        if hop_country and hop_country != src_country:
+                            country_stats[src_country]["path_counts"]["source_with_other_country"][hop_country] += 1
+        except Exception as e:
+            self.failed_lines += 1
+            logging.error(f"Error processing line: {e}")
+
+    def process_raw_line(self, line):
+        """Decode and process one raw line of the dump; lines that are not valid JSON count as failed."""
+        try:
+            data = project_record(parse_line(line))
+        except JSONDecodeError:
+            self.failed_lines += 1
+            logging.debug("Skipping line that is not valid JSON.")
+            return
+        self.process_traceroute_line(line, data)
+        if spill_dir is not None:
+            self.spill_latencies()
+
+    def spill_latencies(self, force=False):
+        """
+        In out-of-core mode, write the buffered latency samples to a sorted run
+        once they reach the memory budget (or whenever `force`d) and free them;
+        the per-pair latency counts stay in memory.
+        """
+        if spill_dir is None:
+            return
+        buffered = self.total_latencies - self.spilled_latencies
+        if not buffered or (not force and buffered < spill_samples):
+            return
+        cities = city_ids.values
+        write_run(spill_dir, {(cities[city_a], cities[city_b]): pair["latencies"]
+                              for city_a, destinations in self.latency_data.items()
+                              for city_b, pair in destinations.items()})
+        for destinations in self.latency_data.values():
+            for pair in destinations.values():
+                pair["latencies"] = new_latency_samples()
+        self.spilled_latencies = self.total_latencies
+
+    def labelled_latency_data(self):
+        """`latency_data` keyed by 'City#Subdivision#Country' labels instead of city ids."""
+        cities = city_ids.values
+        return {cities[city_a]: {cities[city_b]: to_plain(pair) for city_b, pair in destinations.items()}
+                for city_a, destinations in self.latency_data.items()}
+
+    def labelled_country_stats(self):
+        """`country_stats` keyed by country labels instead of country ids."""
+        countries = country_ids.values
+        labelled = {}
+        for country, stats in self.country_stats.items():
+            stats = to_plain(stats)
+            path_counts = stats["path_counts"]
+            path_counts["source_with_other_country"] = {
+                countries[other]: count for other, count in path_counts["source_with_other_country"].items()}
+            path_counts["boomerang_paths"] = {
+                countries[other]: paths for other, paths in path_counts["boomerang_paths"].items()}
+            labelled[countries[country]] = stats
+        return labelled
+
+    def to_state(self):
+        """
+        Return the aggregator contents as plain, picklable Python objects.
+        City and country ids are replaced by their labels, since ids are only
+        meaningful inside one process.
+        """
+        state = {name: to_plain(value) for name, value in vars(self).items()}
+        state["latency_data"] = self.labelled_latency_data()
+        state["country_stats"] = self.labelled_country_stats()
+        return state
+
+    def merge(self, state):
+        """Merge a partial state produced by `to_state` into this aggregator."""
+        state = dict(state)
+        state["latency_data"] = {
+            city_ids.id(city_a): {city_ids.id(city_b): pair for city_b, pair in destinations.items()}
+            for city_a, destinations in state["latency_data"].items()}
+        country_stats = {}
+        for country, stats in state["country_stats"].items():
+            path_counts = dict(stats["path_counts"])
+            path_counts["source_with_other_country"] = {
+                country_ids.id(other): count for other, count in path_counts["source_with_other_country"].items()}
+            path_counts["boomerang_paths"] = {
+                country_ids.id(other): paths for other, paths in path_counts["boomerang_paths"].items()}
+            country_stats[country_ids.id(country)] = dict(stats, path_counts=path_counts)
+        state["country_stats"] = country_stats
+        merge_nested(vars(self), state)
+
+    def write_statistics(self, path):
+        """Write the summary and per-country statistics to a text file."""
+        with open(path, "w") as file:
+            file.write(f"Total IP addresses processed: {self.total_ip_addresses}\n")
+            file.write(f"Unique IP addresses: {len(self.unique_ip_addresses)}\n")
+            file.write(f"Total latencies recorded: {self.total_latencies}\n")
+            file.write(f"Unique cities: {len(self.unique_cities)}\n")
+            file.write(f"Unique countries: {len(self.unique_countries)}\n")
+            file.write(f"Unique subdivisions: {len(self.unique_subdivisions)}\n")
+            file.write(f"Missing city names: {self.missing_city_name_counter}\n")
+            file.write(f"Missing countries: {self.missing_country_counter}\n")
+            file.write(f"Private or CGNAT IP addresses skipped: {self.private_or_cgnat_ip_counter}\n")
+            for category, count in sorted(self.skipped_by_category.items()):
+                file.write(f"  {category}: {count}\n")
+            file.write(f"Failed lines: {self.failed_lines}\n")
+            file.write(f"Total IPv4 addresses: {self.ipv4_count}\n")
+            file.write(f"Total IPv6 addresses: {self.ipv6_count}\n")
+            file.write(f"Unique IPv4 addresses: {len(self.unique_ipv4)}\n")
+            file.write(f"Unique IPv6 addresses: {len(self.unique_ipv6)}\n")
+
+            for country, stats in self.labelled_country_stats().items():
+                file.write(f"\n--- Country: {country} ---\n")
+                file.write(f"  Total IPs:\n")
+                file.write(f"    IPv4: {stats['total']['ipv4']}, Unique IPv4: {len(stats['total']['unique_ipv4'])}\n")
+                file.write(f"    IPv6: {stats['total']['ipv6']}, Unique IPv6: {len(stats['total']['unique_ipv6'])}\n")
+                file.write(f"  Source IPs:\n")
+                file.write(f"    IPv4: {stats['source']['ipv4']}, Unique IPv4: {len(stats['source']['unique_ipv4'])}\n")
+                file.write(f"    IPv6: {stats['source']['ipv6']}, Unique IPv6: {len(stats['source']['unique_ipv6'])}\n")
+                file.write(f"  Hop IPs:\n")
+                file.write(f"    IPv4: {stats['hop']['ipv4']}, Unique IPv4: {len(stats['hop']['unique_ipv4'])}\n")
+                file.write(f"    IPv6: {stats['hop']['ipv6']}, Unique IPv6: {len(stats['hop']['unique_ipv6'])}\n")
+                file.write(f"  Destination IPs:\n")
+                file.write(f"    IPv4: {stats['destination']['ipv4']}, Unique IPv4: {len(stats['destination']['unique_ipv4'])}\n")
+                file.write(f"    IPv6: {stats['destination']['ipv6']}, Unique IPv6: {len(stats['destination']['unique_ipv6'])}\n")
+
+                file.write("  Path Counts:\n")
+                file.write(f"    Source Only: {stats['path_counts']['source_only']}\n")
+                file.write(f"    Source and Destination: {stats['path_counts']['source_destination']}\n")
+                file.write(f"    Source with All Hops and Destination: {stats['path_counts']['source_all_hops_destination']}\n")
+                file.write("    Boomerang Paths:\n")
+                for hop_country, boomerang_stats in stats["path_counts"]["boomerang_paths"].items():
+                    file.write(f"      Through {hop_country}: {boomerang_stats['total']} total\n")
+                    file.write("      Per Traceroute:\n")
+                    for traceroute, count in boomerang_stats["per_traceroute"].items():
+                        file.write(f"        Traceroute {traceroute}: {count}\n")
+
+    def write_latency_json(self, path):
+        """Write the city-pair latency dictionary to a JSON file."""
+        with open(path, "w") as json_file:
+            json.dump(self.labelled_latency_data(), json_file, indent=4, default=encode_latencies)
+
+def process_shard(shard):
+    """Worker entry point: aggregate one (file_path, start, end) byte range."""
+    file_path, start, end = shard
+    aggregator = LatencyAggregator()
+    for line in iter_raw_lines(file_path, start, end):
+        aggregator.process_raw_line(line)
+    aggregator.spill_latencies(force=True)
+    return aggregator.to_state()
+
+def init_worker(file_path, relative_accuracy=None, encoding=DEFAULT_SAMPLE_ENCODING, run_dir=None,
+                memory_budget=DEFAULT_MEMORY_BUDGET, range_table_dir=None):
+    """
+    Worker initializer: load the location table built by `use_location_table` and the latency storage mode.
+    `range_table_dir` is the range table the parent built the location table with, if any; the worker opens
+    it too so that the stored table matches its resolver and is loaded rather than rebuilt.
+    """
+    use_sketches(relative_accuracy)
+    use_sample_encoding(encoding)
+    use_spill(run_dir, memory_budget)
+    range_table = None
+    if range_table_dir:
+        from range_table import RangeTable
+        range_table = RangeTable(range_table_dir)
+    use_location_table(file_path, range_table=range_table)
+
+def run_parallel(file_path, workers, range_table_dir=None):
+    """
+    Process the file in newline-aligned shards on `workers` processes and merge the results in file order.
+    Every worker loads the location table built by `use_location_table` (with the range table in
+    `range_table_dir`, if it was built with one).
+    """
+    shards = compute_shards(file_path, workers * SHARDS_PER_WORKER)
+    tasks = [(file_path, start, end) for start, end in shards]
+    aggregator = LatencyAggregator()
+    # The workers share the memory budget of the out-of-core mode
+    initargs = (file_path, sketch_accuracy, sample_encoding, spill_dir, spill_budget // workers, range_table_dir)
+    for state in tqdm(run_shards(process_shard, tasks, workers, initializer=init_worker, initargs=initargs),
+                      total=len(tasks), desc="Processing shards", unit=" shards"):
+        aggregator.merge(state)
+    return aggregator
+
+def run_sequential(file_path, checkpoint_interval=CHECKPOINT_INTERVAL, resume=False):
+    """
+    Process the file in a single process, appending a checkpoint every `checkpoint_interval` lines.
+
+    Lines are processed into a small delta aggregator that is written to the
+    checkpoint log and then merged into the running total, so a checkpoint
+    costs the same at the end of the file as at the start.
+    """
+    checkpoints = CheckpointLog(checkpoint_file, file_path)
+    aggregator = LatencyAggregator()
+    start, lines = 0, 0
+    if resume:
+        start, lines = checkpoints.restore(aggregator)
+        logging.info(f"Resuming after {lines:,} lines (byte {start:,})")
+    else:
+        checkpoints.clear()
+
+    delta = LatencyAggregator()
+    position = start
+    for offset, line in tqdm(iter_raw_lines_with_offsets(file_path, start), initial=lines, total=8706125,
+                             desc="Processing traceroute lines", unit=" lines"):
+        delta.process_raw_line(line)
+        lines += 1
+        position = offset + len(line) + 1
+        if checkpoint_interval and lines % checkpoint_interval == 0:
+            state = delta.to_state()
+            checkpoints.append(position, lines, state)
+            aggregator.merge(state)
+            delta = LatencyAggregator()
+    delta.spill_latencies(force=True)
+    aggregator.merge(delta.to_state())
+    logging.info(f"GeoIP cache: {geo_locator.stats()}")
+    return aggregator
+
+def write_snapshot(aggregator):
+    """Publish the current results; readers never see a half-written file."""
+    aggregator.write_statistics(statistics_file + ".tmp")
+    aggregator.write_latency_json(latency_json_file + ".tmp")
+    os.replace(statistics_file + ".tmp", statistics_file)
+    os.replace(latency_json_file + ".tmp", latency_json_file)
+
+def run_follow(file_path, snapshot_interval=SNAPSHOT_INTERVAL, poll_interval=POLL_INTERVAL, resume=False,
+               idle_timeout=0):
+    """
+    Follow a traceroute file that is still being appended to, processing new
+    lines as they arrive and publishing the outputs every `snapshot_interval` seconds.
+
+    Every snapshot also appends a checkpoint, so a stopped follower can be
+    restarted with `resume`. Runs until interrupted (Ctrl+C) or, if
+    `idle_timeout` is set, until no new line has arrived for that many seconds.
+    """
+    checkpoints = CheckpointLog(checkpoint_file, file_path, growing=True)
+    aggregator = LatencyAggregator()
+    start, lines = 0, 0
+    if resume:
+        start, lines = checkpoints.restore(aggregator)
+        logging.info(f"Resuming after {lines:,} lines (byte {start:,})")
+    else:
+        checkpoints.clear()
+
+    delta = LatencyAggregator()
+    delta_lines = 0
+    position = start
+    last_snapshot = last_data = time.monotonic()
+
+    def publish():
+        nonlocal delta, delta_lines, last_snapshot
+        if delta_lines:
+            state = delta.to_state()
+            checkpoints.append(position, lines, state)
+            aggregator.merge(state)
+            delta, delta_lines = LatencyAggregator(), 0
+        write_snapshot(aggregator)
+        last_snapshot = time.monotonic()
+        logging.info(f"Snapshot published after {lines:,} lines")
+
+    try:
+        for item in follow_raw_lines(file_path, start, poll_interval):
+            now = time.monotonic()
+            if item is not None:
+                offset, line = item
+                delta.process_raw_line(line)
+                lines += 1
+                delta_lines += 1
+                position = offset + len(line) + 1
+                last_data = now
+            elif idle_timeout and now - last_data >= idle_timeout:
+                logging.info(f"No new lines for {idle_timeout} s, stopping.")
+                break
+            if now - last_snapshot >= snapshot_interval:
+                publish()
+    except KeyboardInterrupt:
+        logging.info("Interrupted, publishing the final snapshot.")
+    publish()
+    return aggregator
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the city-to-city latency dictionary from a traceroute dump.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (default: 1, process the file sequentially).")
+    parser.add_argument("--checkpoint-interval", type=int, default=CHECKPOINT_INTERVAL,
+                        help=f"Lines between checkpoints of a sequential run (default: {CHECKPOINT_INTERVAL}; 0 disables them).")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"Continue a sequential or follow run from the last checkpoint in {checkpoint_file}.")
+    parser.add_argument("--follow", action="store_true",
+                        help="Keep following the traceroute file as it is appended to and publish snapshots periodically.")
+    parser.add_argument("--snapshot-interval", type=float, default=SNAPSHOT_INTERVAL,
+                        help=f"Seconds between snapshots in follow mode (default: {SNAPSHOT_INTERVAL}).")
+    parser.add_argument("--idle-timeout", type=float, default=0,
+                        help="Stop following after this many seconds without new lines (default: 0, never).")
+    parser.add_argument("--range-table", metavar="DIR",
+                        help="Resolve the IPs with a range table compiled by range_table.py instead of the mmdb database.")
+    parser.add_argument("--sketch-accuracy", type=float, metavar="ALPHA",
+                        help="Keep a DDSketch with relative accuracy ALPHA (e.g. 0.01) per city pair instead of every "
+                             "latency sample; use the same value when resuming.")
+    parser.add_argument("--sample-encoding", choices=list(SAMPLE_ENCODINGS), default=DEFAULT_SAMPLE_ENCODING,
+                        help="Storage of the kept latency samples: float64 (exact, 8 bytes), float32 (4 bytes), "
+                             "fixed32 or fixed16 (0.01 ms steps, 4 or 2 bytes) (default: %(default)s).")
+    parser.add_argument("--spill-dir", metavar="DIR",
+                        help=f"Out-of-core mode: spill the latency samples to sorted runs in DIR whenever they reach "
+                             f"--memory-budget, and write the exact per-pair percentiles to {latency_csv_file} "
+                             f"instead of the latency JSON. Not available with --follow, --resume or --sketch-accuracy.")
+    parser.add_argument("--memory-budget", type=int, default=DEFAULT_MEMORY_BUDGET >> 20, metavar="MB",
+                        help="Memory for buffered latency samples and merge buffers in out-of-core mode "
+                             "(default: %(default)s MB).")
+    args = parser.parse_args()
+    if args.spill_dir and (args.follow or args.resume or args.sketch_accuracy):
+        parser.error("--spill-dir cannot be combined with --follow, --resume or --sketch-accuracy")
+    memory_budget = args.memory_budget << 20
+    use_sketches(args.sketch_accuracy)
+    use_sample_encoding(args.sample_encoding)
+    use_spill(args.spill_dir, memory_budget)
+
+    if args.follow:
+        logging.info(f"Following {traceroute_file_path}")
+        run_follow(traceroute_file_path, args.snapshot_interval, POLL_INTERVAL, args.resume, args.idle_timeout)
+        return
+
+    logging.info("Starting traceroute processing")
+
+    # Remove output files if they exist
+    if os.path.exists(statistics_file):
+        os.remove(statistics_file)
+    if os.path.exists(latency_json_file):
+        os.remove(latency_json_file)
+    if args.spill_dir:
+        clear_runs(args.spill_dir)
+
+    # First pass: resolve every distinct IP of the dump once
+    range_table = None
+    if args.range_table:
+        # Only imported when used, since it needs NumPy
+        from range_table import RangeTable
+        range_table = RangeTable(args.range_table)
+    use_location_table(traceroute_file_path, args.workers, range_table)
+
+    if args.workers > 1:
+        aggregator = run_parallel(traceroute_file_path, args.workers, args.range_table)
+    else:
+        # Spilled samples are not part of the checkpoints, so out-of-core runs do not write any
+        checkpoint_interval = 0 if args.spill_dir else args.checkpoint_interval
+        aggregator = run_sequential(traceroute_file_path, checkpoint_interval, args.resume)
+
+    if aggregator.failed_lines:
+        logging.warning(f"{aggregator.failed_lines:,} lines could not be processed")
+
+    # Write statistics to the text file
+    aggregator.write_statistics(statistics_file)
+    if args.spill_dir:
+        pairs = write_percentiles_csv(args.spill_dir, latency_csv_file, memory_budget)
+        logging.info(f"Exact percentiles of {pairs:,} city pairs written to {latency_csv_file}")
+    else:
+        aggregator.write_latency_json(latency_json_file)
+
+    # The outputs are complete, the checkpoints are no longer needed
+    if args.workers <= 1:
+        CheckpointLog(checkpoint_file, traceroute_file_path).clear()
+
+if __name__ == "__main__":
+    main()
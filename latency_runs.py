@@ -0,0 +1,249 @@
+"""
+Out-of-core exact latency percentiles with an external sort.
+
+For runs whose latency samples do not fit in memory, the aggregators spill
+their samples to disk whenever a memory budget is reached. `write_run`
+writes one sorted run: a file of float64 latencies ordered by city pair and
+latency, with a JSON table of its pairs and their sample counts
+(`<run>.pairs.json`). Pairs are ordered by their (city_a, city_b) labels, so
+the runs of different processes, which intern their cities independently,
+are sorted the same way.
+
+`iter_pair_statistics` merges all runs of a directory with `heapq.merge`,
+reading every run through a buffer sized from the memory budget, and streams
+the samples of each pair once, in ascending order. The sample counts from
+the pair tables locate the median and 95th percentile ranks up front, so
+the statistics of a pair take constant memory however many samples it has.
+When there are more runs than `MAX_MERGE_FAN_IN`, groups of runs are first
+merged into larger runs. `write_percentiles_csv` writes the result in the
+schema of `cityMap2.process_json_to_csv`.
+"""
+import csv
+import glob
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+import tempfile
+from array import array
+from operator import itemgetter
+
+RUN_SUFFIX = ".run"
+PAIRS_SUFFIX = ".pairs.json"
+
+# Memory for buffered samples and merge buffers unless configured otherwise (1 GiB)
+DEFAULT_MEMORY_BUDGET = 1 << 30
+
+SAMPLE_SIZE = array("d").itemsize
+
+# Runs merged at once; more runs are merged in several passes
+MAX_MERGE_FAN_IN = 128
+
+# Smallest read buffer per run, in samples
+MIN_READ_SAMPLES = 4096
+
+CSV_HEADER = ["City1_ID", "City2_ID", "Min_Latency", "Median_Latency", "95th_Percentile_Latency"]
+EXTENDED_CSV_HEADER = CSV_HEADER + ["Average_Latency", "Mode_Latency", "Sample_Count"]
+
+
+def pairs_path(run_path):
+    return run_path + PAIRS_SUFFIX
+
+
+def _new_run(run_dir):
+    os.makedirs(run_dir, exist_ok=True)
+    handle, run_path = tempfile.mkstemp(suffix=RUN_SUFFIX, prefix="run-", dir=run_dir)
+    return os.fdopen(handle, "wb"), run_path
+
+
+def _finish_run(run_path, table):
+    # The pair table is written last: a run without one is incomplete and ignored
+    temp_path = pairs_path(run_path) + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as pairs_file:
+        json.dump([[city_a, city_b, count] for (city_a, city_b), count in table], pairs_file)
+    os.replace(temp_path, pairs_path(run_path))
+
+
+def write_run(run_dir, samples_by_pair):
+    """
+    Write one sorted run.
+
+    Args:
+        run_dir (str): Directory of the runs.
+        samples_by_pair (dict): (city_a, city_b) labels -> iterable of latencies.
+
+    Returns:
+        str: Path of the run, or None if there were no samples.
+    """
+    pairs = sorted(pair for pair, samples in samples_by_pair.items() if len(samples))
+    if not pairs:
+        return None
+    run_file, run_path = _new_run(run_dir)
+    table = []
+    with run_file:
+        for pair in pairs:
+            samples = array("d", sorted(samples_by_pair[pair]))
+            samples.tofile(run_file)
+            table.append((pair, len(samples)))
+    _finish_run(run_path, table)
+    return run_path
+
+
+def list_runs(run_dir):
+    """Paths of the complete runs of a directory."""
+    return sorted(path for path in glob.glob(os.path.join(glob.escape(run_dir), "*" + RUN_SUFFIX))
+                  if os.path.exists(pairs_path(path)))
+
+
+def clear_runs(run_dir):
+    """Remove all runs, complete or not, from a directory."""
+    for path in glob.glob(os.path.join(glob.escape(run_dir), "run-*")):
+        os.remove(path)
+
+
+def read_pairs(run_path):
+    """The ((city_a, city_b), sample count) entries of a run, in run order."""
+    with open(pairs_path(run_path), encoding="utf-8") as pairs_file:
+        return [((city_a, city_b), count) for city_a, city_b, count in json.load(pairs_file)]
+
+
+def _read_run(run_path, table, pair_ids, buffer_samples):
+    """Yield the (pair id, latency) records of a run, with its pairs mapped through `pair_ids`."""
+    with open(run_path, "rb", buffering=buffer_samples * SAMPLE_SIZE) as run_file:
+        for pair, count in table:
+            pair_id = pair_ids[pair]
+            remaining = count
+            while remaining:
+                chunk = array("d")
+                chunk.frombytes(run_file.read(min(remaining, buffer_samples) * SAMPLE_SIZE))
+                if not chunk:
+                    raise ValueError(f"Run {run_path} is shorter than its pair table")
+                remaining -= len(chunk)
+                for latency in chunk:
+                    yield pair_id, latency
+
+
+def _merge(run_paths, memory_budget):
+    """
+    Merge runs into one stream.
+
+    Returns:
+        tuple: (pairs, counts, records): the pair labels in order, the total
+        sample count of every pair and an iterator over the (pair index,
+        latency) records sorted by pair and latency.
+    """
+    tables = [read_pairs(run_path) for run_path in run_paths]
+    pairs = sorted({pair for table in tables for pair, _ in table})
+    pair_ids = {pair: pair_id for pair_id, pair in enumerate(pairs)}
+    counts = [0] * len(pairs)
+    for table in tables:
+        for pair, count in table:
+            counts[pair_ids[pair]] += count
+    buffer_samples = max(memory_budget // (SAMPLE_SIZE * max(len(run_paths), 1)), MIN_READ_SAMPLES)
+    records = heapq.merge(*(_read_run(run_path, table, pair_ids, buffer_samples)
+                            for run_path, table in zip(run_paths, tables)))
+    return pairs, counts, records
+
+
+def _merge_into_run(run_dir, run_paths, memory_budget):
+    """Merge runs into a single new run and remove them."""
+    pairs, counts, records = _merge(run_paths, memory_budget)
+    run_file, run_path = _new_run(run_dir)
+    with run_file:
+        chunk = array("d")
+        for _, latency in records:
+            chunk.append(latency)
+            if len(chunk) >= MIN_READ_SAMPLES:
+                chunk.tofile(run_file)
+                chunk = array("d")
+        chunk.tofile(run_file)
+    _finish_run(run_path, [(pair, count) for pair, count in zip(pairs, counts) if count])
+    for path in run_paths:
+        os.remove(path)
+        os.remove(pairs_path(path))
+    return run_path
+
+
+def pair_statistics(latencies, count):
+    """
+    Statistics of one pair from its `count` samples in ascending order, in one pass.
+
+    Returns:
+        dict: min, max, mean, median (as `statistics.median`), 95th percentile
+        (the sample of rank ceil(0.95 * count) - 1, as `cityMap2`), mode (the
+        smallest of the most frequent values) and count.
+    """
+    median_low, median_high = (count - 1) // 2, count // 2
+    percentile_95 = math.ceil(0.95 * count) - 1
+    minimum = maximum = low = high = p95 = mode = None
+    total = 0.0
+    run_value, run_length, mode_length = None, 0, 0
+    for index, latency in enumerate(latencies):
+        if index == 0:
+            minimum = latency
+        if index == median_low:
+            low = latency
+        if index == median_high:
+            high = latency
+        if index == percentile_95:
+            p95 = latency
+        total += latency
+        if latency == run_value:
+            run_length += 1
+        else:
+            run_value, run_length = latency, 1
+        if run_length > mode_length:
+            mode, mode_length = latency, run_length
+        maximum = latency
+    return {
+        "min_latency": minimum,
+        "max_latency": maximum,
+        "avg_latency": total / count if count else None,
+        "median_latency": low if count % 2 else (low + high) / 2 if count else None,
+        "percentile_95_latency": p95,
+        "mode_latency": mode,
+        "count": count,
+    }
+
+
+def iter_pair_statistics(run_dir, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Merge the runs of a directory and yield (city_a, city_b, statistics) for
+    every pair, in label order; see `pair_statistics`.
+    """
+    run_paths = list_runs(run_dir)
+    merge_pass = 0
+    while len(run_paths) > MAX_MERGE_FAN_IN:
+        merge_pass += 1
+        logging.info(f"Merge pass {merge_pass}: {len(run_paths)} runs")
+        run_paths = [_merge_into_run(run_dir, run_paths[i:i + MAX_MERGE_FAN_IN], memory_budget)
+                     for i in range(0, len(run_paths), MAX_MERGE_FAN_IN)]
+    pairs, counts, records = _merge(run_paths, memory_budget)
+    for pair_id, group in itertools.groupby(records, key=itemgetter(0)):
+        city_a, city_b = pairs[pair_id]
+        yield city_a, city_b, pair_statistics((latency for _, latency in group), counts[pair_id])
+
+
+def write_percentiles_csv(run_dir, csv_path, memory_budget=DEFAULT_MEMORY_BUDGET, extended=False):
+    """
+    Write the exact min, median and 95th percentile latency of every pair in
+    the runs of `run_dir` to a CSV file with the columns of
+    `cityMap2.process_json_to_csv`. `extended` adds the mean, mode and sample count.
+
+    Returns:
+        int: Number of pairs written.
+    """
+    pairs = 0
+    with open(csv_path, "w", newline="", encoding="utf-8") as csv_file:
+        csv_writer = csv.writer(csv_file, quoting=csv.QUOTE_NONNUMERIC)
+        csv_writer.writerow(EXTENDED_CSV_HEADER if extended else CSV_HEADER)
+        for city_a, city_b, stats in iter_pair_statistics(run_dir, memory_budget):
+            row = [city_a, city_b, round(stats["min_latency"], 4), round(stats["median_latency"], 4),
+                   round(stats["percentile_95_latency"], 4)]
+            if extended:
+                row += [round(stats["avg_latency"], 4), round(stats["mode_latency"], 4), stats["count"]]
+            csv_writer.writerow(row)
+            pairs += 1
+    return pairs
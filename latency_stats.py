@@ -0,0 +1,538 @@
+"""
+Per city-pair latency statistics, updated online.
+
+The latency scripts used to recompute the full statistics of a city pair
+(min, max, mean, median and mode) over all of its samples every time a
+sample was appended, which is quadratic in the number of samples of busy
+pairs. A `LatencyAccumulator` updates the count, sum, minimum and maximum
+in O(1) per sample and only appends the sample; the order statistics
+(median, mode) are computed once, when the results are written.
+
+The samples themselves are kept in `LatencySamples`, a growable typed
+array rather than a list of boxed floats (about 32 bytes per float plus
+8 for the list slot). By default the array holds 8-byte doubles, which
+keeps the values exact; the "float32", "fixed32" and "fixed16" encodings
+take 4 or 2 bytes per sample (the fixed-point ones at 0.01 ms resolution).
+
+When keeping every sample costs too much memory, a `LatencySketch` (a
+DDSketch with a configurable relative accuracy) stands in for the list of
+samples: its size is bounded by the range of the latencies rather than by
+their number, and sketches of shards or of different days merge exactly.
+
+`finalize_groups` computes the final statistics of all city pairs at once
+from their samples laid out in one flat array with group offsets: a single
+segmented sort with NumPy and one vectorized pass per statistic, instead
+of sorting every pair in a Python loop.
+"""
+import math
+import statistics
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Sample encodings: array typecode and fixed-point scale (None for floating point)
+SAMPLE_ENCODINGS = {
+    "float64": ("d", None),
+    "float32": ("f", None),
+    "fixed32": ("I", 100),  # 0.01 ms steps, up to about 42,900 s
+    "fixed16": ("H", 100),  # 0.01 ms steps, up to 655.35 ms; larger latencies are stored as 655.35 ms
+}
+DEFAULT_SAMPLE_ENCODING = "float64"
+
+
+class LatencySamples:
+    """
+    The latency samples of one city pair in a typed array, in the order they were added.
+
+    Iterating yields the decoded samples as floats; `append`, `extend` and
+    `len` work like on a list. Fixed-point encodings round to the nearest
+    0.01 ms and saturate at the largest value of their integer type; `append`
+    returns the sample as stored.
+    """
+    __slots__ = ("encoding", "values", "_scale", "_max_code")
+
+    def __init__(self, encoding=DEFAULT_SAMPLE_ENCODING, samples=()):
+        if encoding not in SAMPLE_ENCODINGS:
+            raise ValueError(f"Unknown sample encoding {encoding!r}, expected one of {', '.join(SAMPLE_ENCODINGS)}")
+        typecode, self._scale = SAMPLE_ENCODINGS[encoding]
+        self.encoding = encoding
+        self.values = array(typecode)
+        self._max_code = (1 << (8 * self.values.itemsize)) - 1 if self._scale else None
+        self.extend(samples)
+
+    def append(self, latency):
+        if self._scale:
+            code = min(max(round(latency * self._scale), 0), self._max_code)
+            self.values.append(code)
+            return code / self._scale
+        self.values.append(latency)
+        return self.values[-1]
+
+    def extend(self, samples):
+        if isinstance(samples, LatencySamples) and samples.encoding == self.encoding:
+            self.values.extend(samples.values)
+        else:
+            for latency in samples:
+                self.append(latency)
+
+    merge = extend
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        if self._scale:
+            scale = self._scale
+            return (value / scale for value in self.values)
+        return iter(self.values)
+
+    def tolist(self):
+        """The decoded samples as a list of floats (e.g. for JSON)."""
+        return list(self)
+
+    @property
+    def nbytes(self):
+        return len(self.values) * self.values.itemsize
+
+    def __getstate__(self):
+        return self.encoding, self.values
+
+    def __setstate__(self, state):
+        encoding, values = state
+        self.__init__(encoding)
+        self.values = values
+
+
+class LatencyAccumulator:
+    """
+    Running statistics and samples of the latencies of one city pair.
+
+    Every sample is quantized once, by its encoding, and the sum, minimum and
+    maximum are updated with the stored value, so all statistics describe the
+    same samples.
+
+    Attributes:
+        count (int): Number of samples.
+        total (float): Sum of the samples.
+        minimum (float): Smallest sample, or None.
+        maximum (float): Largest sample, or None.
+        samples (LatencySamples): The samples, in the order they were added.
+    """
+    __slots__ = ("count", "total", "minimum", "maximum", "samples")
+
+    def __init__(self, encoding=DEFAULT_SAMPLE_ENCODING):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.samples = LatencySamples(encoding)
+
+    def add(self, latency):
+        latency = self.samples.append(latency)
+        self.count += 1
+        self.total += latency
+        if self.minimum is None or latency < self.minimum:
+            self.minimum = latency
+        if self.maximum is None or latency > self.maximum:
+            self.maximum = latency
+
+    def merge(self, other):
+        """Add the samples of another accumulator (e.g. from a worker process) after this one's."""
+        if not other.count:
+            return
+        self.count += other.count
+        if self.samples.encoding == DEFAULT_SAMPLE_ENCODING:
+            # Sum the exact samples one by one, so the mean is the same as after adding them sequentially
+            for latency in other.samples:
+                self.total += latency
+        else:
+            self.total += other.total
+        if self.minimum is None or other.minimum < self.minimum:
+            self.minimum = other.minimum
+        if self.maximum is None or other.maximum > self.maximum:
+            self.maximum = other.maximum
+        self.samples.extend(other.samples)
+
+    def __getstate__(self):
+        return self.count, self.total, self.minimum, self.maximum, self.samples
+
+    def __setstate__(self, state):
+        self.count, self.total, self.minimum, self.maximum, self.samples = state
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def statistics(self):
+        """
+        Final statistics of the samples, as written to the latency JSON files:
+        'min_latency', 'max_latency', 'avg_latency', 'median_latency',
+        'mode_latency' and 'count'.
+        """
+        if not self.count:
+            return {
+                "min_latency": None,
+                "max_latency": None,
+                "avg_latency": None,
+                "median_latency": None,
+                "mode_latency": None,
+                "count": 0
+            }
+        try:
+            mode_latency = statistics.mode(self.samples)
+        except statistics.StatisticsError:
+            mode_latency = None
+        return {
+            "min_latency": self.minimum,
+            "max_latency": self.maximum,
+            "avg_latency": self.mean,
+            "median_latency": statistics.median(self.samples),
+            "mode_latency": mode_latency,
+            "count": self.count
+        }
+
+
+# --- Quantile sketches ---
+
+# Relative accuracy of a `LatencySketch` unless configured otherwise (1%)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Latencies at or below this value (in ms) are counted in the zero bin of a sketch
+MIN_SKETCH_LATENCY = 1e-6
+
+
+class LatencySketch:
+    """
+    DDSketch of the latencies of one city pair, used instead of keeping every sample.
+
+    A sample x > 0 is counted in bin ceil(log(x) / log(gamma)), with
+    gamma = (1 + a) / (1 - a) for the relative accuracy a, so every quantile is
+    returned within a relative error of a of the exact sample at its rank. The
+    number of bins only depends on the range of the latencies (e.g. about 800
+    bins from 1 us to 10 s at 1%), not on the number of samples. The count,
+    sum, minimum and maximum are exact.
+
+    Sketches with the same relative accuracy merge exactly, so sketches of
+    shards or of different days can be combined in any order. `to_dict` and
+    `from_dict` convert a sketch to and from a compact JSON object with the
+    counts of the non-empty bins.
+
+    Like a list of samples, a sketch supports `append` and `len`.
+    """
+    __slots__ = ("relative_accuracy", "count", "total", "minimum", "maximum", "zero_count", "bins", "_log_gamma")
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"Relative accuracy must be between 0 and 1, not {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self._log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.zero_count = 0
+        self.bins = {}
+
+    def add(self, latency):
+        self.count += 1
+        self.total += latency
+        if self.minimum is None or latency < self.minimum:
+            self.minimum = latency
+        if self.maximum is None or latency > self.maximum:
+            self.maximum = latency
+        if latency <= MIN_SKETCH_LATENCY:
+            self.zero_count += 1
+        else:
+            key = math.ceil(math.log(latency) / self._log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + 1
+
+    append = add
+
+    def merge(self, other):
+        """Add the samples of another sketch with the same relative accuracy, or of an iterable of samples."""
+        if not isinstance(other, LatencySketch):
+            for latency in other:
+                self.add(latency)
+            return
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f"Cannot merge a sketch with relative accuracy {other.relative_accuracy} "
+                             f"into one with {self.relative_accuracy}")
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        if self.minimum is None or other.minimum < self.minimum:
+            self.minimum = other.minimum
+        if self.maximum is None or other.maximum > self.maximum:
+            self.maximum = other.maximum
+        self.zero_count += other.zero_count
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def _value(self, key):
+        # The point of the bin (gamma^(key-1), gamma^key] with the lowest relative error to both ends
+        return 2 * math.exp(key * self._log_gamma) / (1 + math.exp(self._log_gamma))
+
+    def quantile(self, q):
+        """
+        Approximate q-quantile (0 <= q <= 1): the sample of rank q * (count - 1)
+        within the relative accuracy, clamped to the exact minimum and maximum. None if empty.
+        """
+        if not self.count:
+            return None
+        if q >= 1:
+            return self.maximum
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return self.minimum
+        cumulative = self.zero_count
+        for key in sorted(self.bins):
+            cumulative += self.bins[key]
+            if cumulative > rank:
+                return min(max(self._value(key), self.minimum), self.maximum)
+        return self.maximum
+
+    def mode(self):
+        """Representative value of the most populated bin (the lowest one on a tie). None if empty."""
+        if not self.count:
+            return None
+        key = min(self.bins, key=lambda key: (-self.bins[key], key), default=None)
+        if key is None or self.zero_count >= self.bins[key]:
+            return self.minimum
+        return min(max(self._value(key), self.minimum), self.maximum)
+
+    def statistics(self):
+        """Final statistics, with the keys of `LatencyAccumulator.statistics`; the median and mode are approximate."""
+        return {
+            "min_latency": self.minimum,
+            "max_latency": self.maximum,
+            "avg_latency": self.mean,
+            "median_latency": self.quantile(0.5),
+            "mode_latency": self.mode(),
+            "count": self.count
+        }
+
+    def to_dict(self):
+        """The sketch as a JSON-serializable dict."""
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "count": self.count,
+            "sum": self.total,
+            "min": self.minimum,
+            "max": self.maximum,
+            "zero_count": self.zero_count,
+            "bins": {str(key): count for key, count in sorted(self.bins.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"])
+        sketch.count = data["count"]
+        sketch.total = data["sum"]
+        sketch.minimum = data["min"]
+        sketch.maximum = data["max"]
+        sketch.zero_count = data["zero_count"]
+        sketch.bins = {int(key): count for key, count in data["bins"].items()}
+        return sketch
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        restored = LatencySketch.from_dict(state)
+        for name in LatencySketch.__slots__:
+            setattr(self, name, getattr(restored, name))
+
+
+def load_latencies(latencies):
+    """The latencies of a city pair as read from JSON: a `LatencySketch` for a serialized sketch, otherwise unchanged."""
+    return LatencySketch.from_dict(latencies) if isinstance(latencies, dict) else latencies
+
+
+def encode_latencies(value):
+    """`default` hook for `json.dump` that writes sketches with `LatencySketch.to_dict` and samples as lists."""
+    if isinstance(value, LatencySketch):
+        return value.to_dict()
+    if isinstance(value, LatencySamples):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# --- Grouped finalization ---
+
+DEFAULT_STATISTICS = ("count", "min", "max", "mean", "median", "mode")
+
+
+def percentile_name(q):
+    """Result key of the q-quantile (0 < q <= 1), e.g. "p95" for 0.95."""
+    return f"p{q * 100:g}"
+
+
+def group_offsets(lengths):
+    """Offsets of consecutive groups of the given lengths in a flat array (one more than the groups)."""
+    offsets = [0]
+    for length in lengths:
+        offsets.append(offsets[-1] + length)
+    return offsets
+
+
+def flatten_groups(groups):
+    """
+    Concatenate groups of samples (lists or `LatencySamples`) into one flat
+    float64 array.array and their offsets, the input of `finalize_groups`.
+    """
+    values = array("d")
+    offsets = [0]
+    for group in groups:
+        if isinstance(group, LatencySamples) and group.values.typecode == "d":
+            values.extend(group.values)
+        else:
+            values.extend(group)
+        offsets.append(len(values))
+    return values, offsets
+
+
+def finalize_groups(values, offsets, statistics=DEFAULT_STATISTICS, percentiles=(), mode_bin_width=None):
+    """
+    Statistics of many groups of samples at once, e.g. of every city pair.
+
+    The samples of all groups are given as one flat array, group i being
+    values[offsets[i]:offsets[i + 1]] (see `group_offsets`). With NumPy, one
+    stable segmented sort orders every group in place and each statistic is a
+    single vectorized pass over the groups; without it, the groups are
+    finalized one by one.
+
+    Args:
+        values: Flat sequence of samples (a NumPy array, an array.array or a list).
+        offsets: Group offsets, one more than the number of groups.
+        statistics (tuple): Any of "count", "min", "max", "mean", "median"
+            (as `statistics.median`) and "mode".
+        percentiles (tuple): Quantiles q (0 < q <= 1), each reported as
+            `percentile_name(q)`: the sample of rank ceil(q * n) - 1, the
+            definition `cityMap2` uses for its 95th percentile.
+        mode_bin_width (float, optional): Bin the samples for the mode and
+            report the center of the most populated bin. Without it the mode
+            is the most frequent value, the first one seen on a tie, as
+            `statistics.mode`.
+
+    Returns:
+        dict: Statistic name -> one value per group (NumPy arrays, or lists
+        without NumPy). Empty groups get NaN (None without NumPy) and a count of 0.
+    """
+    if np is None:
+        return _finalize_groups_python(values, offsets, statistics, percentiles, mode_bin_width)
+    values = _as_float_array(values)
+
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    num_groups = len(counts)
+    starts = offsets[:-1]
+    nonempty = counts > 0
+    group_ids = np.repeat(np.arange(num_groups), counts)
+    # Groups stay at their offsets; lexsort is stable, so equal samples keep their order
+    order = np.lexsort((values, group_ids))
+    sorted_values = values[order]
+
+    def at_rank(ranks):
+        result = np.full(num_groups, np.nan)
+        result[nonempty] = sorted_values[starts[nonempty] + ranks[nonempty]]
+        return result
+
+    results = {}
+    if "count" in statistics:
+        results["count"] = counts
+    if "min" in statistics:
+        results["min"] = at_rank(np.zeros(num_groups, dtype=np.int64))
+    if "max" in statistics:
+        results["max"] = at_rank(counts - 1)
+    if "mean" in statistics:
+        means = np.full(num_groups, np.nan)
+        if nonempty.any():
+            means[nonempty] = np.add.reduceat(values, starts[nonempty]) / counts[nonempty]
+        results["mean"] = means
+    if "median" in statistics:
+        # For an odd count both ranks are the middle one, and (x + x) / 2 == x exactly
+        results["median"] = (at_rank((counts - 1) // 2) + at_rank(counts // 2)) / 2
+    for q in percentiles:
+        ranks = np.maximum(np.ceil(q * counts).astype(np.int64) - 1, 0)
+        results[percentile_name(q)] = at_rank(ranks)
+    if "mode" in statistics:
+        results["mode"] = _grouped_mode(values, group_ids, order, num_groups, mode_bin_width)
+    return results
+
+
+def _as_float_array(values):
+    if isinstance(values, array):
+        # Zero-copy view of the buffer
+        return np.frombuffer(values, dtype=values.typecode).astype(np.float64, copy=False)
+    return np.asarray(values, dtype=np.float64)
+
+
+def _grouped_mode(values, group_ids, order, num_groups, mode_bin_width):
+    modes = np.full(num_groups, np.nan)
+    if not len(values):
+        return modes
+    if mode_bin_width:
+        values = np.floor(values / mode_bin_width)
+        order = np.lexsort((values, group_ids))
+    sorted_values = values[order]
+    sorted_groups = group_ids[order]
+    # Runs of equal values within a group; by stability, a run starts at the earliest occurrence of its value
+    run_starts = np.flatnonzero(np.concatenate((
+        [True], (sorted_values[1:] != sorted_values[:-1]) | (sorted_groups[1:] != sorted_groups[:-1]))))
+    run_lengths = np.diff(np.append(run_starts, len(values)))
+    run_groups = sorted_groups[run_starts]
+    run_first = order[run_starts]
+    # Per group: the longest run, the one seen first on a tie
+    best = np.lexsort((run_first, -run_lengths, run_groups))
+    first_of_group = np.concatenate(([True], run_groups[best][1:] != run_groups[best][:-1]))
+    best = best[first_of_group]
+    mode_values = sorted_values[run_starts[best]]
+    if mode_bin_width:
+        mode_values = (mode_values + 0.5) * mode_bin_width
+    modes[run_groups[best]] = mode_values
+    return modes
+
+
+def _finalize_groups_python(values, offsets, names, percentiles, mode_bin_width):
+    results = {name: [] for name in names if name in DEFAULT_STATISTICS}
+    results.update({percentile_name(q): [] for q in percentiles})
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        group = list(values[start:end])
+        count = len(group)
+        ordered = sorted(group)
+        if "count" in results:
+            results["count"].append(count)
+        if "min" in results:
+            results["min"].append(ordered[0] if count else None)
+        if "max" in results:
+            results["max"].append(ordered[-1] if count else None)
+        if "mean" in results:
+            results["mean"].append(sum(group) / count if count else None)
+        if "median" in results:
+            results["median"].append((ordered[(count - 1) // 2] + ordered[count // 2]) / 2 if count else None)
+        for q in percentiles:
+            results[percentile_name(q)].append(ordered[max(math.ceil(q * count) - 1, 0)] if count else None)
+        if "mode" in results:
+            if not count:
+                results["mode"].append(None)
+            elif mode_bin_width:
+                bins = statistics.mode(math.floor(latency / mode_bin_width) for latency in group)
+                results["mode"].append((bins + 0.5) * mode_bin_width)
+            else:
+                results["mode"].append(statistics.mode(group))
+    return results
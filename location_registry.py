@@ -0,0 +1,133 @@
+"""
+Dense integer ids for the cities, subdivisions and countries of an analysis.
+
+The latency maps, country statistics and city graphs used to be keyed on
+"City#Subdivision#Country" strings, which are hashed on every dict access and
+split apart again whenever the country of a city is needed. A
+`LocationRegistry` interns countries, subdivisions and cities into
+consecutive integer ids instead: the analyses key their dicts and graphs on
+the ids and only turn them back into labels (`city_label`, `country_label`)
+when a report is written. The country of a city is a list lookup
+(`city_country`). Like the ids of `location_table.LocationKeys`, ids start at
+1, so they are truthy like the labels they stand for.
+
+A registry is saved as JSON next to the output it belongs to
+(`<output>.registry.json`), so a later stage can load it and use the same
+ids. Worker processes fill their own registries; `merge` adds the entries of
+another registry and returns how its ids map onto this one, and
+`remap_keys` re-keys a partial result with that mapping.
+"""
+import json
+import os
+
+REGISTRY_SUFFIX = ".registry.json"
+
+
+def registry_path(output_path):
+    return output_path + REGISTRY_SUFFIX
+
+
+class _Interner:
+    """Consecutive integer ids (from 1) for hashable values."""
+
+    def __init__(self, values=()):
+        self.values = [None]
+        self._ids = {}
+        for value in values:
+            self.id(value)
+
+    def id(self, value):
+        value_id = self._ids.get(value)
+        if value_id is None:
+            value_id = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+    def __len__(self):
+        return len(self.values) - 1
+
+
+class LocationRegistry:
+    """
+    Integer ids for countries, subdivisions and cities. A city is identified
+    by its name together with the ids of its subdivision and country, so
+    cities of the same name in different places get different ids.
+    """
+
+    def __init__(self):
+        self.countries = _Interner()
+        self.subdivisions = _Interner()
+        self.cities = _Interner()
+
+    def country_id(self, country):
+        return self.countries.id(country)
+
+    def subdivision_id(self, subdivision):
+        return self.subdivisions.id(subdivision)
+
+    def city_id(self, city, subdivision, country):
+        """Id of a city given by its name, subdivision and country label; subdivision may be None."""
+        return self.cities.id((city, self.subdivisions.id(subdivision), self.countries.id(country)))
+
+    def city_id_of_label(self, label):
+        """Id of a city given as a "City#Subdivision#Country" label ("None" for a missing subdivision)."""
+        city, subdivision, country = label.rsplit("#", 2)
+        return self.city_id(city, None if subdivision == "None" else subdivision, country)
+
+    def city_country(self, city_id):
+        """Country id of a city."""
+        return self.cities.values[city_id][2]
+
+    def country_label(self, country_id):
+        return self.countries.values[country_id]
+
+    def city_label(self, city_id):
+        """The "City#Subdivision#Country" label of a city, as written to the reports."""
+        city, subdivision_id, country_id = self.cities.values[city_id]
+        return f"{city}#{self.subdivisions.values[subdivision_id]}#{self.countries.values[country_id]}"
+
+    def merge(self, other):
+        """
+        Add the entries of another registry to this one.
+
+        Returns:
+            tuple: (city ids, country ids), lists mapping every id of `other` to
+            the id of the same city or country in this registry (index 0 maps to 0).
+        """
+        country_ids = [0] + [self.country_id(country) for country in other.countries.values[1:]]
+        subdivision_ids = [0] + [self.subdivision_id(subdivision) for subdivision in other.subdivisions.values[1:]]
+        city_ids = [0] + [self.cities.id((city, subdivision_ids[subdivision_id], country_ids[country_id]))
+                          for city, subdivision_id, country_id in other.cities.values[1:]]
+        return city_ids, country_ids
+
+    def to_state(self):
+        """The registry as plain, JSON-serializable lists."""
+        return {
+            "countries": self.countries.values[1:],
+            "subdivisions": self.subdivisions.values[1:],
+            "cities": [list(city) for city in self.cities.values[1:]],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        registry = cls()
+        registry.countries = _Interner(state["countries"])
+        registry.subdivisions = _Interner(state["subdivisions"])
+        registry.cities = _Interner(tuple(city) for city in state["cities"])
+        return registry
+
+    def save(self, path):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as registry_file:
+            json.dump(self.to_state(), registry_file)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as registry_file:
+            return cls.from_state(json.load(registry_file))
+
+
+def remap_keys(mapping, ids):
+    """A copy of `mapping` with every key replaced by `ids[key]` (see `LocationRegistry.merge`)."""
+    return {ids[key]: value for key, value in mapping.items()}
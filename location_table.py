@@ -0,0 +1,262 @@
+"""
+Two-pass geolocation of a traceroute dump.
+
+The first pass collects the distinct IP addresses of a dump (sources,
+destinations and hop replies) in parallel shards and resolves each of them
+exactly once, also in parallel, into a `LocationTable`. In that table every
+distinct location (city, subdivision, country) has an integer id, and every
+IP address maps to the id of its location. The analyses then do their second
+pass over the dump with integer ids only. `LocationKeys` derives the value an
+analysis groups by (a country label, a city key, ...) from each location once
+and gives it an integer id too. Labels are only turned back into strings when
+results are written or handed to another process.
+
+The table is stored next to the dump (`<dump>.loctab`) and rebuilt when the
+dump or the GeoIP database changes, or when it is loaded for another resolver
+(the database itself or a compiled range table) than it was built with. IP addresses the table does not cover,
+e.g. lines appended to a dump after the table was built, are resolved on
+first use when the table has a `GeoLocator`.
+"""
+import logging
+import os
+import pickle
+from collections import namedtuple
+
+from geolocation import GeoLocator
+from sharding import SHARDS_PER_WORKER, compute_shards, run_shards
+from traceroute_index import file_signature
+from traceroute_reader import is_compressed, read_traceroutes
+
+LOCATION_TABLE_SUFFIX = ".loctab"
+
+# The part of a GeoIP location the analyses group by; missing values are None
+Place = namedtuple("Place", ["city", "subdivision", "country"])
+
+
+def location_table_path(file_path):
+    return file_path + LOCATION_TABLE_SUFFIX
+
+
+def place_of(location):
+    """The `Place` of a `geolocation.Location`, or None for an unknown address."""
+    if location is None:
+        return None
+    return Place(location.city, location.subdivision, location.country)
+
+
+class LocationTable:
+    """
+    Distinct locations of the IP addresses of one dump, with an integer id each.
+
+    Attributes:
+        ip_ids (dict): IP address -> location id, or None if the address is not in the GeoIP database.
+        places (list): Location id -> `Place`.
+        locator (GeoLocator, optional): Resolves addresses that are not in `ip_ids` yet.
+    """
+
+    def __init__(self, ip_ids=None, places=None, locator=None):
+        self.ip_ids = {} if ip_ids is None else ip_ids
+        self.places = [] if places is None else places
+        self.locator = locator
+        self._place_ids = {place: location_id for location_id, place in enumerate(self.places)}
+
+    def __len__(self):
+        return len(self.places)
+
+    def add(self, ip, place):
+        """Record the `Place` of an address (None if unknown) and return its location id."""
+        if place is None:
+            location_id = None
+        else:
+            location_id = self._place_ids.get(place)
+            if location_id is None:
+                location_id = self._place_ids[place] = len(self.places)
+                self.places.append(place)
+        self.ip_ids[ip] = location_id
+        return location_id
+
+    def location_id(self, ip):
+        """Location id of an IP address, or None if its location is unknown."""
+        try:
+            return self.ip_ids[ip]
+        except KeyError:
+            if self.locator is None:
+                return None
+            return self.add(ip, place_of(self.locator.lookup(ip)))
+
+
+class LocationKeys:
+    """
+    Integer ids for a value derived from each location of a `LocationTable`,
+    e.g. its country label. `key(place)` is called once per location; locations
+    for which it returns None have no id. Ids start at 1, so like the labels
+    they stand for they are always truthy.
+    """
+
+    def __init__(self, table, key):
+        self.table = table
+        self.key = key
+        self.values = [None]
+        self._ids = {}
+        self._by_location = []
+
+    def id(self, value):
+        """Integer id of a value, assigning a new one for values not seen before."""
+        key_id = self._ids.get(value)
+        if key_id is None:
+            key_id = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return key_id
+
+    def of_location(self, location_id):
+        by_location = self._by_location
+        if location_id >= len(by_location):
+            # The table grew since the last call; derive the keys of the new locations
+            for place in self.table.places[len(by_location):]:
+                value = self.key(place)
+                by_location.append(None if value is None else self.id(value))
+        return by_location[location_id]
+
+    def of_ip(self, ip):
+        """Key id of the location of an IP address, or None."""
+        location_id = self.table.location_id(ip)
+        return None if location_id is None else self.of_location(location_id)
+
+
+def collect_shard_ips(shard):
+    """Worker entry point: the distinct IP addresses in one (file_path, start, end) byte range."""
+    file_path, start, end = shard
+    ips = set()
+    for data in read_traceroutes(file_path, fields=("src_addr", "dst_addr", "result"), hop_fields=("from",),
+                                 start=start, end=end):
+        ips.add(data.get("src_addr"))
+        ips.add(data.get("dst_addr"))
+        for hop in data.get("result", []):
+            for reply in hop.get("result", []):
+                ips.add(reply.get("from"))
+    ips.discard(None)
+    ips.discard("")
+    return ips
+
+
+def collect_ips(file_path, workers=1):
+    """First pass: the distinct IP addresses of a dump, scanned in `workers` processes."""
+    if workers <= 1 or is_compressed(file_path):
+        return collect_shard_ips((file_path, 0, None))
+    tasks = [(file_path, start, end) for start, end in compute_shards(file_path, workers * SHARDS_PER_WORKER)]
+    ips = set()
+    for shard_ips in run_shards(collect_shard_ips, tasks, workers):
+        ips.update(shard_ips)
+    return ips
+
+
+# GeoLocator of each worker process, reused across chunks so its caches are only loaded once
+_chunk_locators = {}
+
+
+def resolve_chunk(task):
+    """Worker entry point: the `Place` of every address of one (geoip_db_path, ips) chunk."""
+    geoip_db_path, ips = task
+    locator = _chunk_locators.get(geoip_db_path)
+    if locator is None:
+        locator = _chunk_locators[geoip_db_path] = GeoLocator(geoip_db_path)
+    places = [place_of(locator.lookup(ip)) for ip in ips]
+    # Worker processes exit without running atexit handlers
+    locator.flush()
+    return places
+
+
+def resolve_ips(ips, geoip_db_path, workers=1):
+    """
+    Resolve every address once and return them as a `LocationTable`.
+
+    The addresses are sorted first, so the addresses of a network block are
+    resolved by the same worker and all but the first are block cache hits.
+    """
+    ips = sorted(ips)
+    num_chunks = max(1, workers * SHARDS_PER_WORKER)
+    chunk_size = -(-len(ips) // num_chunks) or 1
+    tasks = [(geoip_db_path, ips[i:i + chunk_size]) for i in range(0, len(ips), chunk_size)]
+    if workers <= 1:
+        results = map(resolve_chunk, tasks)
+    else:
+        results = run_shards(resolve_chunk, tasks, workers)
+
+    table = LocationTable()
+    for (_, chunk), places in zip(tasks, results):
+        for ip, place in zip(chunk, places):
+            table.add(ip, place)
+    return table
+
+
+def resolve_ips_with_range_table(ips, range_table):
+    """Resolve every address with one vectorized `range_table.RangeTable` lookup and return them as a `LocationTable`."""
+    ips = sorted(ips)
+    table = LocationTable()
+    for ip, location_id in zip(ips, range_table.lookup(ips).tolist()):
+        table.add(ip, range_table.place(location_id))
+    return table
+
+
+def resolver_signature(geoip_db_path, range_table=None):
+    """Identifies what a table is resolved with: the database, or a compiled range table and its version."""
+    if range_table is not None:
+        return "range_table", os.path.abspath(range_table.table_dir), range_table.signature()
+    return ("mmdb",)
+
+
+def build_location_table(file_path, geoip_db_path, workers=1, range_table=None):
+    """
+    Collect and resolve the distinct IP addresses of a dump and store the table next to it.
+
+    Args:
+        range_table (RangeTable, optional): Resolve with this compiled range table
+            (see range_table.py) instead of the database at `geoip_db_path`. It
+            should be compiled from the same GeoIP release.
+    """
+    ips = collect_ips(file_path, workers)
+    logging.info(f"Resolving {len(ips):,} distinct IP addresses of {file_path}")
+    if range_table is not None:
+        table = resolve_ips_with_range_table(ips, range_table)
+    else:
+        table = resolve_ips(ips, geoip_db_path, workers)
+
+    state = {
+        "signature": file_signature(file_path),
+        "geoip_signature": file_signature(geoip_db_path),
+        "resolver": resolver_signature(geoip_db_path, range_table),
+        "ip_ids": table.ip_ids,
+        "places": table.places,
+    }
+    path = location_table_path(file_path)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as table_file:
+        pickle.dump(state, table_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+    logging.info(f"Built location table for {file_path}: {len(table.ip_ids):,} addresses, {len(table):,} locations")
+    return table
+
+
+def load_location_table(file_path, geoip_db_path, workers=1, locator=None, range_table=None):
+    """
+    Load the location table of a dump, building it first (with `workers`
+    processes) if it is missing, the dump or the GeoIP database changed, or it
+    was built with another resolver (see `resolver_signature`).
+
+    Args:
+        locator (GeoLocator, optional): Resolves addresses the table does not cover.
+        range_table (RangeTable, optional): Used to build the table, see `build_location_table`.
+    """
+    path = location_table_path(file_path)
+    table = None
+    if os.path.exists(path):
+        with open(path, "rb") as table_file:
+            state = pickle.load(table_file)
+        if (state["signature"] == file_signature(file_path)
+                and state["geoip_signature"] == file_signature(geoip_db_path)
+                and state.get("resolver") == resolver_signature(geoip_db_path, range_table)):
+            table = LocationTable(state["ip_ids"], state["places"])
+    if table is None:
+        table = build_location_table(file_path, geoip_db_path, workers, range_table)
+    table.locator = locator
+    return table
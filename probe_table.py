@@ -0,0 +1,102 @@
+"""
+Per-probe cache of source address lookups.
+
+The source of a RIPE Atlas traceroute is always one of a few thousand probes,
+so the same `src_addr` comes back in thousands of measurements. A
+`ProbeTable` resolves the source of each probe once, with whatever lookup
+the analysis uses (a country label, a legal framework, ...), and answers
+every later traceroute of the probe from a dict keyed by (prb_id, af).
+The address an entry was resolved from is kept with it, and a probe whose
+source address changed is resolved again, so the results are the same as
+resolving `src_addr` directly.
+
+A local RIPE Atlas probe archive (the daily JSON snapshots published under
+https://ftp.ripe.net/ripe/atlas/probes/archive/, optionally bzip2-compressed)
+can be loaded as well. Its addresses are resolved up front, so probes whose
+traceroutes are sent from their registered address are hits on first sight,
+and it provides the ASN and registered country of every probe.
+"""
+import logging
+from collections import namedtuple
+
+from traceroute_reader import open_traceroute_file, parse_line
+
+# Probe metadata from a RIPE Atlas probe archive; missing values are None
+ProbeInfo = namedtuple("ProbeInfo", ["address_v4", "address_v6", "asn_v4", "asn_v6", "country"])
+
+
+def read_probe_archive(file_path):
+    """
+    Read a RIPE Atlas probe archive (a JSON list of probes, or an object with
+    the list under "objects") into a dict prb_id -> `ProbeInfo`.
+    """
+    with open_traceroute_file(file_path, workers=1) as archive_file:
+        data = parse_line(archive_file.read())
+    if isinstance(data, dict):
+        data = data.get("objects", [])
+    probes = {}
+    for probe in data:
+        if probe.get("id") is None:
+            continue
+        probes[probe["id"]] = ProbeInfo(probe.get("address_v4"), probe.get("address_v6"), probe.get("asn_v4"),
+                                        probe.get("asn_v6"), probe.get("country_code"))
+    logging.info(f"Read {len(probes):,} probes from {file_path}")
+    return probes
+
+
+class ProbeTable:
+    """
+    Resolved source of every (prb_id, af), built on first sight.
+
+    Attributes:
+        resolve (callable): Maps a source address to the value an analysis needs.
+        probes (dict): prb_id -> `ProbeInfo`, from a probe archive.
+        hits (int): Lookups answered from the table.
+        misses (int): Lookups that called `resolve`.
+    """
+
+    def __init__(self, resolve, archive_path=None):
+        self.resolve = resolve
+        self.probes = {}
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        if archive_path:
+            self.load_archive(archive_path)
+
+    def load_archive(self, archive_path):
+        """Read a probe archive and resolve the registered addresses of its probes."""
+        self.probes.update(read_probe_archive(archive_path))
+        for prb_id, probe in self.probes.items():
+            for af, address in ((4, probe.address_v4), (6, probe.address_v6)):
+                if address:
+                    self._entries[(prb_id, af)] = (address, self.resolve(address))
+
+    def lookup(self, prb_id, af, src_addr):
+        """Resolved value of the source address of a traceroute of probe `prb_id`."""
+        entry = self._entries.get((prb_id, af))
+        if entry is not None and entry[0] == src_addr:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = self.resolve(src_addr)
+        if prb_id is not None:
+            self._entries[(prb_id, af)] = (src_addr, value)
+        return value
+
+    def asn(self, prb_id, af):
+        """ASN of a probe for address family `af` according to the probe archive, or None."""
+        probe = self.probes.get(prb_id)
+        if probe is None:
+            return None
+        return probe.asn_v4 if af == 4 else probe.asn_v6
+
+    def stats(self):
+        """Hit/miss counters, e.g. for logging at the end of a run."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "probes": len(self._entries),
+        }
@@ -0,0 +1,210 @@
+"""
+GeoIP range table: the GeoIP2 City CSV export compiled into sorted NumPy arrays.
+
+`compile_range_table` turns `GeoIP2-City-Blocks-IPv4.csv`,
+`GeoIP2-City-Blocks-IPv6.csv` and `GeoIP2-City-Locations-en.csv` into one
+`.npy` file per array in a directory:
+
+    ipv4_start, ipv4_end   first and last address of every IPv4 network (uint32)
+    ipv6_start, ipv6_end   the same for IPv6, as the upper 64 bits of the address (uint64)
+    ipv4_location, ipv6_location
+                           location id of every network (int32)
+    locations.json         location id -> [city, subdivision, country]
+
+`RangeTable` memory-maps the arrays, so every worker process shares the same
+pages, and geolocates whole arrays of addresses at once with
+`numpy.searchsorted` instead of one `Reader.city` call per address.
+
+IPv6 networks are keyed on their upper 64 bits. GeoIP2 rarely has IPv6
+networks longer than /64; those are widened to their /64 when compiling.
+"""
+import argparse
+import csv
+import ipaddress
+import json
+import logging
+import os
+
+import numpy as np
+
+from location_table import Place
+from traceroute_index import file_signature
+
+# Default input and output paths
+blocks_ipv4_path = 'E:/internet-graph-master/dataset/GeoIP2-City-Blocks-IPv4.csv'
+blocks_ipv6_path = 'E:/internet-graph-master/dataset/GeoIP2-City-Blocks-IPv6.csv'
+locations_path = 'E:/internet-graph-master/dataset/GeoIP2-City-Locations-en.csv'
+range_table_dir = 'E:/internet-graph-master/dataset/GeoIP2-City-ranges'
+
+LOCATIONS_FILE = "locations.json"
+
+# Location id of addresses that are in no network of the table
+UNKNOWN_LOCATION = -1
+
+IPV6_KEY_SHIFT = 64
+
+
+def read_locations(path):
+    """Map every geoname_id of a Locations CSV to its `Place` (most specific subdivision, as in geoip2)."""
+    places = {}
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        for row in csv.DictReader(csv_file):
+            places[row["geoname_id"]] = Place(
+                row.get("city_name") or None,
+                row.get("subdivision_2_name") or row.get("subdivision_1_name") or None,
+                row.get("country_iso_code") or None,
+            )
+    return places
+
+
+def iter_blocks(path, place_of_geoname):
+    """
+    Yield the (network, `Place`) of every row of a Blocks CSV, in file order
+    (MaxMind writes the rows sorted by network).
+    """
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        for row in csv.DictReader(csv_file):
+            # Networks without a geoname_id only have a registered country, which the analyses do not use
+            yield (ipaddress.ip_network(row["network"], strict=False),
+                   place_of_geoname.get(row["geoname_id"], Place(None, None, None)))
+
+
+def read_blocks(path, version, place_of_geoname, location_ids, places):
+    """
+    Read a Blocks CSV into sorted (start, end, location id) arrays.
+
+    Locations are interned into `places` (location id -> `Place`) through
+    `location_ids` (`Place` -> location id) so both address families share them.
+    """
+    starts, ends, locations = [], [], []
+    widened = 0
+    for network, place in iter_blocks(path, place_of_geoname):
+        start, end = int(network.network_address), int(network.broadcast_address)
+        if version == 6:
+            if network.prefixlen > IPV6_KEY_SHIFT:
+                widened += 1
+            start, end = start >> IPV6_KEY_SHIFT, end >> IPV6_KEY_SHIFT
+        location_id = location_ids.get(place)
+        if location_id is None:
+            location_id = location_ids[place] = len(places)
+            places.append(place)
+        starts.append(start)
+        ends.append(end)
+        locations.append(location_id)
+    if widened:
+        logging.warning(f"{widened:,} IPv6 networks longer than /64 in {path} were widened to their /64")
+
+    dtype = np.uint32 if version == 4 else np.uint64
+    starts = np.array(starts, dtype=dtype)
+    order = np.argsort(starts, kind="stable")
+    return starts[order], np.array(ends, dtype=dtype)[order], np.array(locations, dtype=np.int32)[order]
+
+
+def compile_range_table(blocks_ipv4, blocks_ipv6, locations, output_dir):
+    """Compile the GeoIP2 City CSVs into the arrays of a `RangeTable` in `output_dir`."""
+    os.makedirs(output_dir, exist_ok=True)
+    place_of_geoname = read_locations(locations)
+    location_ids, places = {}, []
+    for version, path in ((4, blocks_ipv4), (6, blocks_ipv6)):
+        arrays = read_blocks(path, version, place_of_geoname, location_ids, places)
+        for name, array in zip(("start", "end", "location"), arrays):
+            np.save(os.path.join(output_dir, f"ipv{version}_{name}.npy"), array)
+        logging.info(f"Compiled {len(arrays[0]):,} IPv{version} networks from {path}")
+
+    # Written last: its presence marks a complete table
+    temp_path = os.path.join(output_dir, f"{LOCATIONS_FILE}.{os.getpid()}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as locations_file:
+        json.dump([list(place) for place in places], locations_file)
+    os.replace(temp_path, os.path.join(output_dir, LOCATIONS_FILE))
+    logging.info(f"Range table written to {output_dir}: {len(places):,} locations")
+
+
+def ip_arrays(ips):
+    """
+    Split IP address strings into the integer keys used by a `RangeTable`.
+
+    Returns:
+        tuple: (IPv4 positions, IPv4 keys as uint32, IPv6 positions, IPv6 keys as uint64)
+        where the positions index `ips`. Invalid addresses are left out.
+    """
+    v4_positions, v4_keys, v6_positions, v6_keys = [], [], [], []
+    for position, ip in enumerate(ips):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            continue
+        if address.version == 4:
+            v4_positions.append(position)
+            v4_keys.append(int(address))
+        else:
+            v6_positions.append(position)
+            v6_keys.append(int(address) >> IPV6_KEY_SHIFT)
+    return (np.array(v4_positions, dtype=np.intp), np.array(v4_keys, dtype=np.uint32),
+            np.array(v6_positions, dtype=np.intp), np.array(v6_keys, dtype=np.uint64))
+
+
+class RangeTable:
+    """Memory-mapped range table compiled by `compile_range_table`."""
+
+    def __init__(self, table_dir):
+        self.table_dir = table_dir
+        with open(os.path.join(table_dir, LOCATIONS_FILE), encoding="utf-8") as locations_file:
+            self.places = [Place(*place) for place in json.load(locations_file)]
+        for version in (4, 6):
+            for name in ("start", "end", "location"):
+                array = np.load(os.path.join(table_dir, f"ipv{version}_{name}.npy"), mmap_mode="r")
+                setattr(self, f"ipv{version}_{name}", array)
+
+    @staticmethod
+    def _search(starts, ends, locations, keys):
+        """Location id of every key: the network with the last start <= key, if its end is >= key."""
+        if len(starts) == 0:
+            return np.full(len(keys), UNKNOWN_LOCATION, dtype=np.int32)
+        index = np.searchsorted(starts, keys, side="right") - 1
+        clipped = np.maximum(index, 0)
+        found = (index >= 0) & (keys <= ends[clipped])
+        return np.where(found, locations[clipped], UNKNOWN_LOCATION).astype(np.int32)
+
+    def lookup_ipv4(self, keys):
+        """Location ids of an array of IPv4 addresses given as integers."""
+        keys = np.asarray(keys, dtype=np.uint32)
+        return self._search(self.ipv4_start, self.ipv4_end, self.ipv4_location, keys)
+
+    def lookup_ipv6(self, keys):
+        """Location ids of an array of IPv6 addresses given as their upper 64 bits."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        return self._search(self.ipv6_start, self.ipv6_end, self.ipv6_location, keys)
+
+    def lookup(self, ips):
+        """
+        Location ids of a sequence of IP address strings, as an int32 array
+        aligned with `ips`; `UNKNOWN_LOCATION` for unknown or invalid addresses.
+        """
+        location_ids = np.full(len(ips), UNKNOWN_LOCATION, dtype=np.int32)
+        v4_positions, v4_keys, v6_positions, v6_keys = ip_arrays(ips)
+        location_ids[v4_positions] = self.lookup_ipv4(v4_keys)
+        location_ids[v6_positions] = self.lookup_ipv6(v6_keys)
+        return location_ids
+
+    def signature(self):
+        """(size, mtime in ns) of the locations file, which is rewritten last whenever the table is compiled."""
+        return file_signature(os.path.join(self.table_dir, LOCATIONS_FILE))
+
+    def place(self, location_id):
+        """`Place` of a location id, or None for `UNKNOWN_LOCATION`."""
+        return None if location_id == UNKNOWN_LOCATION else self.places[location_id]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the GeoIP2 City CSVs into a NumPy range table.")
+    parser.add_argument("--blocks-ipv4", default=blocks_ipv4_path, help="GeoIP2-City-Blocks-IPv4.csv")
+    parser.add_argument("--blocks-ipv6", default=blocks_ipv6_path, help="GeoIP2-City-Blocks-IPv6.csv")
+    parser.add_argument("--locations", default=locations_path, help="GeoIP2-City-Locations-en.csv")
+    parser.add_argument("--output-dir", default=range_table_dir, help="Directory for the compiled arrays.")
+    args = parser.parse_args()
+    compile_range_table(args.blocks_ipv4, args.blocks_ipv6, args.locations, args.output_dir)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,216 @@
+"""
+Run one traceroute day across several machines that share a filesystem.
+
+    manifest  split the traceroute file into newline-aligned shards and write a manifest
+    worker    process one or more shards of a manifest into serialized partial aggregates
+    reduce    merge all partials (in shard order) into the usual output files
+    local     run the whole pipeline on this machine, with worker processes standing in for nodes
+
+Supported analyses are the latency dictionary (latency_dictionary.py) and the
+path/destination country counts (count_countries_in_path.py). The modules are
+only imported by the commands that need them, since importing them opens the
+GeoIP database.
+"""
+import argparse
+import json
+import logging
+import os
+import pickle
+import subprocess
+import sys
+
+from latency_stats import SAMPLE_ENCODINGS
+from sharding import compute_shards, merge_nested
+from traceroute_reader import offset_after_records
+
+ANALYSES = ("latency", "country-counts")
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+
+def write_manifest(manifest_path, analysis, file_path, num_shards, max_lines=0, sketch_accuracy=None,
+                   sample_encoding=None):
+    """
+    Split `file_path` into `num_shards` shards and write the manifest as JSON.
+    `sketch_accuracy` and `sample_encoding` set the latency storage of the
+    latency analysis (see `latency_dictionary.use_sketches` and
+    `latency_dictionary.use_sample_encoding`) in every worker and in the reducer.
+
+    Returns:
+        dict: The manifest that was written.
+    """
+    end = offset_after_records(file_path, max_lines) if max_lines else None
+    shards = compute_shards(file_path, num_shards, end)
+    manifest = {
+        "analysis": analysis,
+        "file": os.path.abspath(file_path),
+        "sketch_accuracy": sketch_accuracy,
+        "sample_encoding": sample_encoding,
+        "shards": [
+            {"shard_id": shard_id, "file": os.path.abspath(file_path), "start": start, "end": end}
+            for shard_id, (start, end) in enumerate(shards)
+        ],
+    }
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+    logging.info(f"Wrote {len(shards)} shards to {manifest_path}")
+    return manifest
+
+
+def load_manifest(manifest_path):
+    with open(manifest_path, "r") as manifest_file:
+        return json.load(manifest_file)
+
+
+def partial_path(partials_dir, shard_id):
+    """Path of the serialized partial aggregate of one shard."""
+    return os.path.join(partials_dir, f"shard-{shard_id:05d}.partial")
+
+
+def use_latency_storage(manifest):
+    """Set up the latency storage of the latency analysis from the manifest."""
+    import latency_dictionary
+    latency_dictionary.use_sketches(manifest.get("sketch_accuracy"))
+    latency_dictionary.use_sample_encoding(manifest.get("sample_encoding") or latency_dictionary.DEFAULT_SAMPLE_ENCODING)
+
+
+def process_shard(analysis, shard):
+    """Process one manifest shard and return its partial aggregate as plain Python objects."""
+    if analysis == "latency":
+        import latency_dictionary
+        return latency_dictionary.process_shard((shard["file"], shard["start"], shard["end"]))
+    if analysis == "country-counts":
+        import count_countries_in_path
+        return count_countries_in_path.count_shard(
+            (shard["file"], shard["start"], shard["end"], count_countries_in_path.source_countries))
+    raise ValueError(f"Unknown analysis: {analysis}")
+
+
+def run_worker(manifest_path, shard_ids, partials_dir, force=False):
+    """
+    Process the given shards of a manifest. Each partial is written to a temporary
+    file and renamed into place, so a crashed worker never leaves a truncated partial
+    behind and a rerun skips the shards that are already done.
+    """
+    manifest = load_manifest(manifest_path)
+    shards = {shard["shard_id"]: shard for shard in manifest["shards"]}
+    if manifest["analysis"] == "latency":
+        use_latency_storage(manifest)
+    os.makedirs(partials_dir, exist_ok=True)
+
+    for shard_id in shard_ids:
+        output_path = partial_path(partials_dir, shard_id)
+        if os.path.exists(output_path) and not force:
+            logging.info(f"Shard {shard_id} already processed, skipping.")
+            continue
+        state = process_shard(manifest["analysis"], shards[shard_id])
+        temp_path = f"{output_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as partial_file:
+            pickle.dump(state, partial_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, output_path)
+        logging.info(f"Shard {shard_id} written to {output_path}")
+
+
+def iter_partials(manifest, partials_dir):
+    """Yield the partial aggregates in shard order; fails if any shard is missing."""
+    missing = [shard["shard_id"] for shard in manifest["shards"]
+               if not os.path.exists(partial_path(partials_dir, shard["shard_id"]))]
+    if missing:
+        raise FileNotFoundError(f"Missing partials for shards: {missing}")
+    for shard in manifest["shards"]:
+        with open(partial_path(partials_dir, shard["shard_id"]), "rb") as partial_file:
+            yield pickle.load(partial_file)
+
+
+def run_reduce(manifest_path, partials_dir):
+    """Merge all partials of a manifest and write the analysis outputs."""
+    manifest = load_manifest(manifest_path)
+    partials = iter_partials(manifest, partials_dir)
+
+    if manifest["analysis"] == "latency":
+        import latency_dictionary
+        use_latency_storage(manifest)
+        aggregator = latency_dictionary.LatencyAggregator()
+        for state in partials:
+            aggregator.merge(state)
+        aggregator.write_statistics(latency_dictionary.statistics_file)
+        aggregator.write_latency_json(latency_dictionary.latency_json_file)
+    elif manifest["analysis"] == "country-counts":
+        import count_countries_in_path
+        country_counts = count_countries_in_path.new_country_counts(count_countries_in_path.source_countries)
+        for state in partials:
+            merge_nested(country_counts, state)
+        count_countries_in_path.write_country_counts(country_counts, count_countries_in_path.output_txt_path)
+    else:
+        raise ValueError(f"Unknown analysis: {manifest['analysis']}")
+    logging.info("Reduce completed.")
+
+
+def run_local(manifest_path, partials_dir, workers):
+    """
+    Stand-in for a multi-node run: start `workers` separate worker processes, each
+    taking every `workers`-th shard, wait for them and reduce.
+    """
+    manifest = load_manifest(manifest_path)
+    shard_ids = [shard["shard_id"] for shard in manifest["shards"]]
+    processes = []
+    for worker_index in range(workers):
+        assigned = shard_ids[worker_index::workers]
+        if not assigned:
+            continue
+        command = [sys.executable, os.path.abspath(__file__), "worker",
+                   "--manifest", manifest_path, "--partials-dir", partials_dir,
+                   "--shard-id", *map(str, assigned)]
+        processes.append(subprocess.Popen(command))
+    failed = [process.args for process in processes if process.wait() != 0]
+    if failed:
+        raise RuntimeError(f"{len(failed)} worker(s) failed")
+    run_reduce(manifest_path, partials_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-node shard manifest, worker and reducer commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    manifest_parser = commands.add_parser("manifest", help="Write a shard manifest for a traceroute file.")
+    manifest_parser.add_argument("--analysis", choices=ANALYSES, required=True)
+    manifest_parser.add_argument("--input", required=True, help="Traceroute file (on the shared filesystem).")
+    manifest_parser.add_argument("--shards", type=int, required=True, help="Number of shards.")
+    manifest_parser.add_argument("--max-lines", type=int, default=0,
+                                 help="Only shard the first N traceroutes (default: 0, the whole file).")
+    manifest_parser.add_argument("--manifest", required=True, help="Manifest file to write.")
+    manifest_parser.add_argument("--sketch-accuracy", type=float, metavar="ALPHA",
+                                 help="Latency analysis: keep a DDSketch with relative accuracy ALPHA per city pair "
+                                      "instead of every sample.")
+    manifest_parser.add_argument("--sample-encoding", choices=list(SAMPLE_ENCODINGS),
+                                 help="Latency analysis: storage of the kept latency samples (default: float64).")
+
+    worker_parser = commands.add_parser("worker", help="Process shards into partial aggregates.")
+    worker_parser.add_argument("--manifest", required=True)
+    worker_parser.add_argument("--partials-dir", required=True)
+    worker_parser.add_argument("--shard-id", type=int, nargs="+", required=True)
+    worker_parser.add_argument("--force", action="store_true", help="Reprocess shards that already have a partial.")
+
+    reduce_parser = commands.add_parser("reduce", help="Merge all partial aggregates and write the outputs.")
+    reduce_parser.add_argument("--manifest", required=True)
+    reduce_parser.add_argument("--partials-dir", required=True)
+
+    local_parser = commands.add_parser("local", help="Run all shards with local worker processes, then reduce.")
+    local_parser.add_argument("--manifest", required=True)
+    local_parser.add_argument("--partials-dir", required=True)
+    local_parser.add_argument("--workers", type=int, default=os.cpu_count())
+
+    args = parser.parse_args()
+    if args.command == "manifest":
+        write_manifest(args.manifest, args.analysis, args.input, args.shards, args.max_lines, args.sketch_accuracy,
+                       args.sample_encoding)
+    elif args.command == "worker":
+        run_worker(args.manifest, args.shard_id, args.partials_dir, args.force)
+    elif args.command == "reduce":
+        run_reduce(args.manifest, args.partials_dir)
+    elif args.command == "local":
+        run_local(args.manifest, args.partials_dir, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Helpers for running a per-line analysis over newline-aligned byte ranges
+("shards") of a traceroute dump in a process pool, and for merging the
+partial aggregates the workers send back.
+"""
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from traceroute_reader import is_compressed
+
+# Each worker gets several shards so that a slow shard does not leave the
+# other workers idle at the end of the run.
+SHARDS_PER_WORKER = 4
+
+
+def compute_shards(file_path, num_shards, end=None):
+    """
+    Split a file into `num_shards` contiguous byte ranges that start and end
+    on line boundaries.
+
+    Args:
+        file_path (str): Path to the (uncompressed) traceroute dump.
+        num_shards (int): Requested number of shards.
+        end (int, optional): Only split the first `end` bytes of the file.
+
+    Returns:
+        list: (start, end) byte offsets; empty ranges are dropped.
+
+    Raises:
+        ValueError: If the file is compressed, since it cannot be split by byte offset.
+    """
+    if is_compressed(file_path):
+        raise ValueError(f"Compressed dumps cannot be split into shards, run sequentially instead: {file_path}")
+    file_size = os.path.getsize(file_path)
+    if end is not None:
+        file_size = min(end, file_size)
+    num_shards = max(1, min(num_shards, file_size))
+    boundaries = [0]
+    with open(file_path, "rb") as file:
+        for i in range(1, num_shards):
+            target = max(file_size * i // num_shards, boundaries[-1])
+            file.seek(target)
+            if target > 0:
+                # Move to the start of the next line
+                file.seek(target - 1)
+                if file.read(1) != b"\n":
+                    file.readline()
+            boundaries.append(min(file.tell(), file_size))
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+def run_shards(worker, tasks, processes, initializer=None, initargs=()):
+    """
+    Run `worker(task)` for every task in a process pool and yield the results
+    in task order, so that merging them reproduces a sequential run.
+
+    Args:
+        worker (callable): Picklable module-level function.
+        tasks (list): Arguments passed one at a time to `worker`.
+        processes (int): Number of worker processes.
+        initializer (callable, optional): Called once in every worker process.
+        initargs (tuple): Arguments for `initializer`.
+    """
+    with ProcessPoolExecutor(max_workers=processes, initializer=initializer, initargs=initargs) as executor:
+        for result in executor.map(worker, tasks):
+            yield result
+
+
+def to_plain(value):
+    """Recursively convert (default)dicts into plain dicts so they can be pickled."""
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    return value
+
+
+def merge_nested(target, source):
+    """
+    Merge a partial aggregate into `target` in place.
+
+    Numbers are added, sets are unioned, lists are extended, dicts are merged
+    recursively and other values are only copied when `target` has none.
+    Keys are visited in `source` order, so merging partials in shard order
+    keeps the first-seen key order of a sequential run.
+    """
+    for key, value in source.items():
+        if key not in target and not isinstance(target, defaultdict):
+            target[key] = value
+            continue
+        current = target[key]
+        if isinstance(current, dict):
+            merge_nested(current, value)
+        elif isinstance(current, set):
+            current.update(value)
+        elif isinstance(current, list):
+            current.extend(value)
+        elif hasattr(current, "merge"):
+            current.merge(value)
+        elif isinstance(current, bool) or current is None or isinstance(current, str):
+            if not current:
+                target[key] = value
+        elif isinstance(current, (int, float)):
+            target[key] = current + value
+        else:
+            target[key] = value
+    return target
@@ -0,0 +1,89 @@
+import csv
+import json
+import os
+import random
+import sys
+
+import pytest
+
+# The scripts are plain modules at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (network, city, subdivision, country) of the networks of the `range_table_dir` table
+RANGE_TABLE_NETWORKS = [
+    ("8.0.0.0/8", None, None, "US"),
+    ("45.0.0.0/11", "Berlin", "Berlin", "DE"),
+    ("45.32.0.0/11", "Paris", "Ile-de-France", "FR"),
+    ("77.0.0.0/8", "Tokyo", "Tokyo", "JP"),
+    ("103.0.0.0/8", "Sydney", "New South Wales", "AU"),
+    ("203.0.0.0/8", "Jakarta", "Jakarta", "ID"),
+    ("2001::/16", "Perth", "Western Australia", "AU"),
+]
+
+
+def random_ip(rng):
+    """An address from the networks above, a private one, or one in no network (151.0.0.0/8)."""
+    draw = rng.random()
+    if draw < 0.1:
+        return f"192.168.{rng.randint(0, 3)}.{rng.randint(1, 9)}"
+    if draw < 0.2:
+        return f"2001:{rng.randint(1, 30):x}:{rng.randint(1, 3):x}::{rng.randint(1, 9):x}"
+    return f"{rng.choice((8, 45, 77, 103, 151, 203))}.{rng.randint(0, 40)}.{rng.randint(0, 5)}.{rng.randint(1, 50)}"
+
+
+def traceroute_record(rng):
+    hops = []
+    for hop in range(rng.randint(1, 8)):
+        hop_ip = random_ip(rng)
+        replies = []
+        for _ in range(3):
+            draw = rng.random()
+            if draw < 0.15:
+                replies.append({"x": "*"})
+            else:
+                ip = random_ip(rng) if draw < 0.25 else hop_ip
+                replies.append({"from": ip, "rtt": round(rng.uniform(0.1, 300), 3), "ttl": 60, "size": 28})
+        hops.append({"hop": hop + 1, "result": replies})
+    return {"af": 4, "prb_id": rng.randint(1, 60), "msm_id": 5001, "src_addr": random_ip(rng),
+            "dst_addr": random_ip(rng), "from": random_ip(rng), "result": hops, "proto": "ICMP"}
+
+
+def write_dump(path, lines=300, seed=1):
+    """Write a synthetic RIPE Atlas traceroute dump, one JSON record per line, with a few malformed lines."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="\n") as dump_file:
+        for _ in range(lines):
+            if rng.random() < 0.02:
+                dump_file.write("{broken\n")
+            else:
+                dump_file.write(json.dumps(traceroute_record(rng)) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def traceroute_dump(tmp_path):
+    return write_dump(tmp_path / "traceroute.json")
+
+
+@pytest.fixture
+def range_table_dir(tmp_path):
+    """A range table compiled from GeoIP2 City CSVs of the `RANGE_TABLE_NETWORKS`."""
+    range_table = pytest.importorskip("range_table")
+    csv_dir = tmp_path / "csv"
+    csv_dir.mkdir()
+    with open(csv_dir / "Locations-en.csv", "w", newline="", encoding="utf-8") as locations_file:
+        writer = csv.writer(locations_file)
+        writer.writerow(["geoname_id", "city_name", "subdivision_1_name", "subdivision_2_name", "country_iso_code"])
+        for geoname_id, (_, city, subdivision, country) in enumerate(RANGE_TABLE_NETWORKS, 1):
+            writer.writerow([geoname_id, city or "", subdivision or "", "", country])
+    for version in (4, 6):
+        with open(csv_dir / f"Blocks-IPv{version}.csv", "w", newline="", encoding="utf-8") as blocks_file:
+            writer = csv.writer(blocks_file)
+            writer.writerow(["network", "geoname_id"])
+            for geoname_id, (network, *_) in enumerate(RANGE_TABLE_NETWORKS, 1):
+                if (":" in network) == (version == 6):
+                    writer.writerow([network, geoname_id])
+    table_dir = str(tmp_path / "ranges")
+    range_table.compile_range_table(str(csv_dir / "Blocks-IPv4.csv"), str(csv_dir / "Blocks-IPv6.csv"),
+                                    str(csv_dir / "Locations-en.csv"), table_dir)
+    return table_dir
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from checkpoint import CheckpointLog
+
+
+class Aggregator:
+    def __init__(self):
+        self.states = []
+
+    def merge(self, state):
+        self.states.append(state)
+
+
+@pytest.fixture
+def dump(tmp_path):
+    path = tmp_path / "dump.json"
+    path.write_bytes(b'{"prb_id": 1}\n' * 100)
+    return str(path)
+
+
+def write_log(tmp_path, dump, count):
+    log = CheckpointLog(str(tmp_path / "run.ckpt"), dump)
+    for index in range(count):
+        log.append(offset=100 * (index + 1), lines=index + 1, state={"delta": index})
+    return log
+
+
+def test_restore(tmp_path, dump):
+    log = write_log(tmp_path, dump, 3)
+    aggregator = Aggregator()
+    assert log.restore(aggregator) == (300, 3)
+    assert aggregator.states == [{"delta": 0}, {"delta": 1}, {"delta": 2}]
+
+
+@pytest.mark.parametrize("torn_length", [3, 8, 20])
+def test_torn_record_is_dropped(tmp_path, dump, torn_length):
+    log = write_log(tmp_path, dump, 3)
+    valid_size = os.path.getsize(log.path)
+    log.append(offset=400, lines=4, state={"delta": 3})
+    with open(log.path, "r+b") as log_file:
+        log_file.truncate(valid_size + torn_length)
+
+    aggregator = Aggregator()
+    assert log.restore(aggregator) == (300, 3)
+    assert len(aggregator.states) == 3
+    assert os.path.getsize(log.path) == valid_size
+
+    # Appends after the recovery start on a clean record boundary
+    log.append(offset=400, lines=4, state={"delta": 3})
+    aggregator = Aggregator()
+    assert log.restore(aggregator) == (400, 4)
+    assert aggregator.states[-1] == {"delta": 3}
+
+
+def test_corrupt_record_is_dropped(tmp_path, dump):
+    log = write_log(tmp_path, dump, 2)
+    with open(log.path, "r+b") as log_file:
+        log_file.seek(-1, os.SEEK_END)
+        last = log_file.read(1)
+        log_file.seek(-1, os.SEEK_END)
+        log_file.write(bytes([last[0] ^ 0xFF]))
+    assert CheckpointLog(log.path, dump).restore(Aggregator()) == (100, 1)
+
+
+def test_corrupt_frame_is_dropped(tmp_path, dump):
+    log = write_log(tmp_path, dump, 2)
+    valid_size = os.path.getsize(log.path)
+    log.append(offset=300, lines=3, state={"delta": 2})
+    # Flip the stored CRC of the last record
+    with open(log.path, "r+b") as log_file:
+        log_file.seek(valid_size + 4)
+        crc = log_file.read(1)
+        log_file.seek(valid_size + 4)
+        log_file.write(bytes([crc[0] ^ 0xFF]))
+    assert log.restore(Aggregator()) == (200, 2)
+    assert os.path.getsize(log.path) == valid_size
+
+
+def test_rewritten_dump_is_rejected(tmp_path, dump):
+    log = write_log(tmp_path, dump, 1)
+    stat = os.stat(dump)
+    os.utime(dump, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    with pytest.raises(ValueError, match="another version"):
+        log.restore(Aggregator())
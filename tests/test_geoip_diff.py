@@ -0,0 +1,108 @@
+import csv
+import random
+from ipaddress import IPv4Address
+
+import pytest
+
+# Needs maxminddb and numpy
+geoip_diff = pytest.importorskip("geoip_diff")
+
+from geoip_diff import EXPORT_HEADER, compare_datasets, compare_ranges, sweep  # noqa: E402
+from location_table import Place  # noqa: E402
+
+BERLIN = Place("Berlin", "Berlin", "DE")
+HAMBURG = Place("Hamburg", "Hamburg", "DE")
+PARIS = Place("Paris", "Ile-de-France", "FR")
+GERMANY = Place(None, None, "DE")
+
+
+def random_ranges(rng, size=200):
+    """Sorted, disjoint (start, end, place) ranges in [0, size)."""
+    ranges, start = [], rng.randint(0, 5)
+    while start < size:
+        end = min(size - 1, start + rng.randint(0, 15))
+        ranges.append((start, end, rng.choice((BERLIN, HAMBURG, PARIS, GERMANY))))
+        start = end + 1 + rng.choice((0, 0, rng.randint(1, 10)))
+    return ranges
+
+
+def place_at(ranges, value):
+    return next((place for start, end, place in ranges if start <= value <= end), None)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_sweep_matches_address_scan(seed):
+    rng = random.Random(seed)
+    ranges_a, ranges_b = random_ranges(rng), random_ranges(rng)
+    segments = list(sweep(iter(ranges_a), iter(ranges_b)))
+    # Sorted and disjoint, and every address is covered by the segment of its places
+    assert all(end < following[0] for (_, end, _, _), following in zip(segments, segments[1:]))
+    covered = {}
+    for start, end, place_a, place_b in segments:
+        assert place_a is not None or place_b is not None
+        for value in range(start, end + 1):
+            covered[value] = (place_a, place_b)
+    expected = {value: (place_at(ranges_a, value), place_at(ranges_b, value)) for value in range(200)}
+    assert covered == {value: places for value, places in expected.items() if places != (None, None)}
+
+
+def test_unsorted_ranges_are_rejected():
+    with pytest.raises(ValueError, match="not sorted"):
+        list(sweep([(0, 10, BERLIN), (5, 20, PARIS)], []))
+
+
+def test_compare_ranges_counts_and_export():
+    ranges_a = [(0, 9, BERLIN), (10, 17, BERLIN), (18, 19, BERLIN), (20, 29, GERMANY), (40, 49, PARIS)]
+    ranges_b = [(0, 14, BERLIN), (15, 24, HAMBURG), (25, 34, HAMBURG), (50, 59, PARIS)]
+    rows = []
+
+    class Writer:
+        writerow = rows.append
+
+    counts = compare_ranges(iter(ranges_a), iter(ranges_b), 4, Writer())
+    assert (counts["both"], counts["only_a"], counts["only_b"]) == (30, 10, 15)
+    assert counts["country"] == {"same": 30, "different": 0, "missing": 0}
+    assert counts["city"] == {"same": 15, "different": 5, "missing": 10}
+    # The adjacent Berlin/Hamburg segments 15-17 and 18-19 are exported as one range
+    assert rows == [[IPv4Address("0.0.0.15"), IPv4Address("0.0.0.19"), 5, "subdivision", *BERLIN, *HAMBURG]]
+    assert geoip_diff.agreement(counts) == {"country": 1.0, "subdivision": 0.5, "city": 0.5}
+
+
+def write_export(directory, networks):
+    """A CSV export directory of (network, Place) networks."""
+    directory.mkdir()
+    places = sorted({place for _, place in networks})
+    with open(directory / "GeoIP2-City-Locations-en.csv", "w", newline="", encoding="utf-8") as locations_file:
+        writer = csv.writer(locations_file)
+        writer.writerow(["geoname_id", "city_name", "subdivision_1_name", "subdivision_2_name", "country_iso_code"])
+        for geoname_id, place in enumerate(places, 1):
+            writer.writerow([geoname_id, place.city or "", place.subdivision or "", "", place.country])
+    for version in (4, 6):
+        with open(directory / f"GeoIP2-City-Blocks-IPv{version}.csv", "w", newline="", encoding="utf-8") as blocks_file:
+            writer = csv.writer(blocks_file)
+            writer.writerow(["network", "geoname_id"])
+            for network, place in networks:
+                if (":" in network) == (version == 6):
+                    writer.writerow([network, places.index(place) + 1])
+    return str(directory)
+
+
+def test_compare_csv_exports(tmp_path):
+    geoip2 = write_export(tmp_path / "geoip2", [("45.0.0.0/24", BERLIN), ("45.0.1.0/24", BERLIN),
+                                                 ("2001:db8::/32", PARIS)])
+    geolite2 = write_export(tmp_path / "geolite2", [("45.0.0.0/25", BERLIN), ("45.0.0.128/25", HAMBURG),
+                                                    ("2001:db8::/33", PARIS)])
+    export_path = tmp_path / "differences.csv"
+    results = compare_datasets(geoip2, geolite2, str(export_path))
+
+    ipv4 = results["IPv4"]
+    assert (ipv4["both"], ipv4["only_a"], ipv4["only_b"]) == (256, 256, 0)
+    assert ipv4["city"] == {"same": 128, "different": 128, "missing": 0}
+    assert ipv4["agreement"]["country"] == 1.0 and ipv4["agreement"]["city"] == 0.5
+    ipv6 = results["IPv6"]
+    assert ipv6["both"] == ipv6["only_a"] == 2 ** 95
+    assert ipv6["agreement"] == {"country": 1.0, "subdivision": 1.0, "city": 1.0}
+
+    with open(export_path, newline="", encoding="utf-8") as export_file:
+        rows = list(csv.reader(export_file))
+    assert rows == [EXPORT_HEADER, ["45.0.0.128", "45.0.0.255", "128", "subdivision", *BERLIN, *HAMBURG]]
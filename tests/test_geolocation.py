@@ -0,0 +1,135 @@
+import ipaddress
+import os
+from types import SimpleNamespace
+
+import pytest
+
+geolocation = pytest.importorskip("geolocation")
+
+from geolocation import GeoLocator, Location  # noqa: E402
+
+# (network, record) of the fake database; 45.1.2.0/25 is smaller than a /24 block
+NETWORKS = [
+    ("45.1.2.0/25", {"city": {"names": {"en": "Berlin"}}, "country": {"iso_code": "DE"}}),
+    ("77.0.0.0/8", {"city": {"names": {"en": "Tokyo"}}, "subdivisions": [{"names": {"en": "Tokyo"}}],
+                    "country": {"iso_code": "JP"}, "location": {"latitude": 35.7, "longitude": 139.7,
+                                                                "accuracy_radius": 20},
+                    "traits": {"autonomous_system_number": 2516}}),
+    ("2001:db8::/32", {"country": {"iso_code": "AU"}}),
+]
+
+
+class FakeReader:
+    """Stands in for a `maxminddb.Reader` over the `NETWORKS`; lookups are counted."""
+
+    def __init__(self, build_epoch):
+        self.build_epoch = build_epoch
+        self.lookups = 0
+
+    def get_with_prefix_len(self, ip):
+        self.lookups += 1
+        address = ipaddress.ip_address(ip)
+        for network, record in NETWORKS:
+            network = ipaddress.ip_network(network)
+            if address in network:
+                return record, network.prefixlen
+        # Addresses outside the networks are in an empty /16 (IPv4) or /32 (IPv6)
+        return None, 16 if address.version == 4 else 32
+
+    def metadata(self):
+        return SimpleNamespace(database_type="GeoIP2-City", build_epoch=self.build_epoch)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Path of the fake database; `database.build_epoch` is the build that opening it returns."""
+    path = tmp_path / "GeoIP2-City.mmdb"
+    path.write_bytes(b"")
+    state = SimpleNamespace(path=str(path), build_epoch=1, readers=[])
+
+    def open_database(db_path, mode):
+        state.readers.append(FakeReader(state.build_epoch))
+        return state.readers[-1]
+
+    monkeypatch.setattr(geolocation.maxminddb, "open_database", open_database)
+    return state
+
+
+def test_location_from_record():
+    assert geolocation.location_from_record(NETWORKS[1][1]) == Location(
+        "Tokyo", "Tokyo", "JP", 35.7, 139.7, 20, 2516)
+    assert geolocation.location_from_record({}) == Location(None, None, None, None, None, None, None)
+
+
+def test_block_cache(database):
+    locator = GeoLocator(database.path, persistent=False)
+    reader = database.readers[-1]
+    tokyo = locator.lookup("77.1.2.3")
+    assert tokyo.city == "Tokyo"
+    # The /8 covers the whole /24 of the address: the block is answered from the cache
+    assert locator.lookup("77.1.2.200") == tokyo and reader.lookups == 1
+    assert locator.lookup("77.1.3.1") == tokyo and reader.lookups == 2
+
+    # A /25 is smaller than the block: its addresses are cached one by one
+    assert locator.country("45.1.2.1") == "DE"
+    assert locator.lookup("45.1.2.1").city == "Berlin" and reader.lookups == 3
+    assert locator.lookup("45.1.2.2").city == "Berlin" and reader.lookups == 4
+
+    # Unknown addresses are cached too
+    assert locator.lookup("151.0.0.1") is None and locator.lookup("151.0.0.2") is None
+    assert locator.lookup("2001:db8:1::1").country == "AU" and locator.lookup("2001:db8:1::2").country == "AU"
+    assert reader.lookups == 6
+    assert locator.stats()["hits"] == 4 and locator.stats()["misses"] == 6
+
+
+def test_invalid_addresses(database):
+    locator = GeoLocator(database.path, persistent=False)
+    assert locator.lookup("77.1.2.3").country == "JP"
+    # Not answered from the cached 77.1.2.0/24 block
+    assert locator.lookup("77.1.2.999") is None
+    assert locator.lookup("not an address") is None
+    assert locator.lookup("") is None
+    assert database.readers[-1].lookups == 1
+
+
+def test_persistent_cache(database):
+    locator = GeoLocator(database.path)
+    expected = {ip: locator.lookup(ip) for ip in ("77.1.2.3", "45.1.2.1", "151.0.0.1", "2001:db8:1::1")}
+    locator.close()
+    assert os.path.exists(database.path + geolocation.CACHE_SUFFIX)
+
+    # A rerun answers the same addresses, and the rest of their blocks, without the database
+    rerun = GeoLocator(database.path)
+    assert rerun.loaded == 4
+    assert {ip: rerun.lookup(ip) for ip in expected} == expected
+    assert rerun.lookup("77.1.2.99") == expected["77.1.2.3"]
+    assert database.readers[-1].lookups == 0
+    # 45.1.2.1 is cached as an address, not as its block
+    assert rerun.lookup("45.1.2.2").city == "Berlin" and database.readers[-1].lookups == 1
+    rerun.close()
+    assert GeoLocator(database.path).loaded == 5
+
+
+def test_persistent_cache_is_emptied_for_another_build(database):
+    with GeoLocator(database.path) as locator:
+        locator.lookup("77.1.2.3")
+    database.build_epoch = 2
+    with GeoLocator(database.path) as locator:
+        assert locator.loaded == 0
+        assert locator.lookup("77.1.2.3").city == "Tokyo"
+        assert database.readers[-1].lookups == 1
+    with GeoLocator(database.path) as locator:
+        assert locator.loaded == 1
+
+
+def test_unusable_persistent_cache(database, tmp_path):
+    cache_path = tmp_path / "cache.sqlite"
+    cache_path.write_bytes(b"not a database" * 100)
+    with GeoLocator(database.path, cache_path=str(cache_path)) as locator:
+        # The locator works without the cache
+        assert locator.cache_path is None
+        assert locator.lookup("77.1.2.3").city == "Tokyo"
+    assert cache_path.read_bytes() == b"not a database" * 100
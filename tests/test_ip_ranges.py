@@ -0,0 +1,152 @@
+import ipaddress
+import random
+import sys
+
+import pytest
+
+import ip_ranges
+from ip_ranges import (CGNAT, IPV4_MAPPED_NETWORK, NON_PUBLIC, PRIVATE, PUBLIC, SPECIAL_PURPOSE, IntervalMap, IntervalSet,
+                       classify_int, classify_ip, classify_many, load_interval_set)
+
+CGNAT_NETWORK = ipaddress.ip_network("100.64.0.0/10")
+
+
+def is_private_or_cgnat(ip):
+    """The check the latency scripts used before `classify_ip`."""
+    address = ipaddress.ip_address(ip)
+    return address.is_private or address in CGNAT_NETWORK
+
+
+def sample_addresses(count=3000, seed=1):
+    rng = random.Random(seed)
+    addresses = []
+    for _ in range(count):
+        ipv4 = str(ipaddress.IPv4Address(rng.getrandbits(32)))
+        addresses += [ipv4, f"::ffff:{ipv4}", str(ipaddress.IPv6Address(rng.getrandbits(128)))]
+    # Both ends of every special-purpose interval (including the IPv4-mapped ones) and the addresses just outside
+    for version, interval_map in SPECIAL_PURPOSE.items():
+        address = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+        limit = 2 ** (32 if version == 4 else 128)
+        for start, end in zip(interval_map.starts, interval_map.ends):
+            addresses += [str(address(value)) for value in (start - 1, start, end, end + 1) if 0 <= value < limit]
+    return addresses
+
+
+# classify_ip reproduces the is_private networks of Python 3.11; other versions list slightly different ones
+@pytest.mark.skipif(sys.version_info[:2] != (3, 11), reason="is_private differs between Python versions")
+def test_classify_ip_matches_is_private():
+    mismatches = [ip for ip in sample_addresses() if (classify_ip(ip) in NON_PUBLIC) != is_private_or_cgnat(ip)]
+    assert mismatches == []
+
+
+@pytest.mark.parametrize("ip, non_public", [
+    ("::ffff:8.8.8.8", False),
+    ("::ffff:10.1.2.3", True),
+    ("::ffff:127.0.0.1", True),
+    ("::ffff:100.64.0.1", False),
+    ("100.64.0.1", True),
+])
+def test_ipv4_mapped_addresses(ip, non_public):
+    assert (classify_ip(ip) in NON_PUBLIC) == non_public
+
+
+def test_integer_lookups_agree_with_classify_ip():
+    addresses = [ip for ip in sample_addresses(300) if ":" in ip]
+    assert any(ipaddress.IPv6Address(ip) in IPV4_MAPPED_NETWORK for ip in addresses)
+    values = [int(ipaddress.IPv6Address(ip)) for ip in addresses]
+    expected = [classify_ip(ip) for ip in addresses]
+    assert [classify_int(value, 6) for value in values] == expected
+    assert list(classify_many(values, 6)) == expected
+
+
+def test_invalid_address():
+    assert classify_ip("1.2.3.999") is None
+
+
+def test_interval_map_from_layers():
+    # The range listed last wins where ranges overlap, so the default one leaves a gap; adjacent ranges with the
+    # same value are merged
+    interval_map = IntervalMap.from_layers([(0, 99, "a"), (10, 19, "b"), (15, 29, "c"), (30, 39, "c"), (50, 59, "x")],
+                                           default="x")
+    assert (interval_map.starts, interval_map.ends, interval_map.values) == (
+        [0, 10, 15, 40, 60], [9, 14, 39, 49, 99], ["a", "b", "c", "a", "a"])
+    assert [interval_map.get(value) for value in (0, 9, 10, 15, 39, 40, 55, 99, 100)] == [
+        "a", "a", "b", "c", "c", "a", "x", "a", "x"]
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_classify_many_ipv4(numpy, monkeypatch):
+    if not numpy:
+        monkeypatch.setattr(ip_ranges, "np", None)
+    elif ip_ranges.np is None:
+        pytest.skip("NumPy is not installed")
+    addresses = [ip for ip in sample_addresses(300) if ":" not in ip]
+    values = [int(ipaddress.IPv4Address(ip)) for ip in addresses]
+    assert list(classify_many(values, 4)) == [classify_ip(ip) for ip in addresses]
+    assert list(classify_many([], 4)) == []
+    assert [classify_int(int(ipaddress.IPv4Address(ip)), 4) for ip in ("8.8.8.8", "10.0.0.1", "100.64.0.1")] == [
+        PUBLIC, PRIVATE, CGNAT]
+
+
+def test_interval_set_merges_ranges():
+    interval_set = IntervalSet.from_ranges([(20, 30), (5, 10), (11, 12), (25, 40), (50, 50)])
+    assert (interval_set.starts, interval_set.ends) == ([5, 20, 50], [12, 40, 50])
+    assert len(interval_set) == 3
+    assert [value in interval_set for value in (4, 5, 12, 13, 19, 40, 41, 50, 51)] == [
+        False, True, True, False, False, True, False, True, False]
+    assert 0 not in IntervalSet()
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_contains_many_matches_network_scan(numpy, monkeypatch):
+    if not numpy:
+        monkeypatch.setattr(ip_ranges, "np", None)
+    elif ip_ranges.np is None:
+        pytest.skip("NumPy is not installed")
+    rng = random.Random(2)
+    networks = [ipaddress.IPv4Network((rng.getrandbits(32), rng.randint(8, 28)), strict=False) for _ in range(300)]
+    interval_set = IntervalSet.from_networks(networks)
+    assert len(interval_set) < len(networks)
+    values = [rng.getrandbits(32) for _ in range(3000)]
+    values += [int(network.network_address) + offset for network in networks for offset in (-1, 0)]
+    values += [int(network.broadcast_address) + offset for network in networks for offset in (0, 1)]
+    values = [value % 2 ** 32 for value in values]
+    expected = [any(ipaddress.IPv4Address(value) in network for network in networks) for value in values]
+    assert [bool(found) for found in interval_set.contains_many(values)] == expected
+    assert [value in interval_set for value in values] == expected
+    assert len(IntervalSet().contains_many(values)) == len(values) and not any(IntervalSet().contains_many(values))
+
+
+def test_ipv6_contains_many():
+    interval_set = IntervalSet.from_networks([ipaddress.ip_network("2001:db8::/32"), ipaddress.ip_network("fc00::/7")])
+    values = [int(ipaddress.IPv6Address(ip)) for ip in ("2001:db8::1", "2001:db9::", "fd00::1", "::1")]
+    assert list(interval_set.contains_many(values)) == [True, False, True, False]
+
+
+def test_load_interval_set(tmp_path, caplog):
+    path = tmp_path / "fullbogons-ipv4.txt"
+    path.write_text("# fullbogons\n\n10.0.0.0/8\n10.128.0.0/9\n11.0.0.0/8\nnot a network\n192.0.2.0/24\n")
+    interval_set = load_interval_set(str(path))
+    assert "not a network" in caplog.text
+    assert (interval_set.starts, interval_set.ends) == (
+        [int(ipaddress.IPv4Address("10.0.0.0")), int(ipaddress.IPv4Address("192.0.2.0"))],
+        [int(ipaddress.IPv4Address("11.255.255.255")), int(ipaddress.IPv4Address("192.0.2.255"))])
+    assert (tmp_path / ("fullbogons-ipv4.txt" + ip_ranges.INTERVALS_SUFFIX)).exists()
+
+    # The compiled intervals are used while the file is unchanged
+    caplog.clear()
+    cached = load_interval_set(str(path))
+    assert (cached.starts, cached.ends) == (interval_set.starts, interval_set.ends)
+    assert "not a network" not in caplog.text
+
+    path.write_text("172.16.0.0/12\n")
+    assert int(ipaddress.IPv4Address("172.20.0.1")) in load_interval_set(str(path))
+    assert int(ipaddress.IPv4Address("10.0.0.1")) not in load_interval_set(str(path))
+
+
+def test_unreadable_interval_cache_is_rebuilt(tmp_path):
+    path = tmp_path / "fullbogons-ipv4.txt"
+    path.write_text("10.0.0.0/8\n")
+    (tmp_path / ("fullbogons-ipv4.txt" + ip_ranges.INTERVALS_SUFFIX)).write_bytes(b"garbage")
+    assert int(ipaddress.IPv4Address("10.1.2.3")) in load_interval_set(str(path))
+    assert load_interval_set(str(path)).starts == [int(ipaddress.IPv4Address("10.0.0.0"))]
@@ -0,0 +1,131 @@
+import json
+import multiprocessing
+
+import pytest
+
+try:
+    import latency_dictionary as ld
+except (ImportError, OSError) as error:
+    # Needs maxminddb and tqdm, and opens the GeoIP database at its configured path on import
+    pytest.skip(f"latency_dictionary cannot be loaded: {error}", allow_module_level=True)
+
+import location_table
+from sharding import compute_shards
+from traceroute_index import file_signature
+
+MODULE_STATE = ("location_table", "city_ids", "country_ids", "sketch_accuracy", "sample_encoding", "spill_dir",
+                "spill_budget", "spill_samples", "geoip_db_path", "checkpoint_file")
+
+
+@pytest.fixture(autouse=True)
+def module_state(tmp_path, monkeypatch):
+    """Restore the module-level configuration of `latency_dictionary` after every test."""
+    for name in MODULE_STATE:
+        monkeypatch.setattr(ld, name, getattr(ld, name))
+    geoip_db = tmp_path / "GeoIP2-City.mmdb"
+    geoip_db.write_bytes(b"")
+    monkeypatch.setattr(ld, "geoip_db_path", str(geoip_db))
+    monkeypatch.setattr(ld, "checkpoint_file", str(tmp_path / "checkpoint.bin"))
+
+
+def test_worker_loads_range_table_location_table(traceroute_dump, range_table_dir, monkeypatch):
+    from range_table import RangeTable
+
+    ld.use_location_table(traceroute_dump, 1, RangeTable(range_table_dir))
+    path = location_table.location_table_path(traceroute_dump)
+    signature = file_signature(path)
+
+    def rebuild(*args, **kwargs):
+        raise AssertionError("The worker rebuilt the location table")
+
+    monkeypatch.setattr(location_table, "build_location_table", rebuild)
+    ld.init_worker(traceroute_dump, range_table_dir=range_table_dir)
+    assert file_signature(path) == signature
+    # The addresses of the dump are resolved with the range table, not the GeoIP database
+    table = ld.location_table
+    ip = next(ip for ip in table.ip_ids if ip.startswith("77."))
+    assert table.places[table.location_id(ip)] == location_table.Place("Tokyo", "Tokyo", "JP")
+
+
+def write_outputs(aggregator, directory):
+    """The statistics file and latency JSON of an aggregator, as bytes."""
+    directory.mkdir()
+    aggregator.write_statistics(str(directory / "statistics.txt"))
+    aggregator.write_latency_json(str(directory / "latency.json"))
+    return (directory / "statistics.txt").read_bytes(), (directory / "latency.json").read_bytes()
+
+
+def test_merged_shards_match_sequential_run(traceroute_dump, range_table_dir, tmp_path):
+    from range_table import RangeTable
+
+    ld.use_location_table(traceroute_dump, 1, RangeTable(range_table_dir))
+    sequential = write_outputs(ld.run_sequential(traceroute_dump, checkpoint_interval=0), tmp_path / "sequential")
+
+    # Every shard is processed as in a fresh worker, with its own city and country ids
+    states = []
+    for start, end in compute_shards(traceroute_dump, 5):
+        ld.init_worker(traceroute_dump, range_table_dir=range_table_dir)
+        states.append(ld.process_shard((traceroute_dump, start, end)))
+    ld.use_location_table(traceroute_dump, 1, RangeTable(range_table_dir))
+    aggregator = ld.LatencyAggregator()
+    for state in states:
+        aggregator.merge(state)
+    assert write_outputs(aggregator, tmp_path / "sharded") == sequential
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                    reason="The workers must inherit the test configuration of the module")
+def test_parallel_run_matches_sequential_run(traceroute_dump, range_table_dir, tmp_path):
+    from range_table import RangeTable
+
+    ld.use_location_table(traceroute_dump, 1, RangeTable(range_table_dir))
+    sequential = write_outputs(ld.run_sequential(traceroute_dump, checkpoint_interval=0), tmp_path / "sequential")
+    parallel = write_outputs(ld.run_parallel(traceroute_dump, 2, range_table_dir), tmp_path / "parallel")
+    assert parallel == sequential
+
+
+def test_follow_and_resume_match_sequential_run(traceroute_dump, tmp_path, monkeypatch):
+    sequential = write_outputs(ld.run_sequential(traceroute_dump, checkpoint_interval=0), tmp_path / "sequential")
+
+    with open(traceroute_dump, "rb") as dump_file:
+        data = dump_file.read()
+    growing = tmp_path / "growing.json"
+    middle = data.index(b"\n", len(data) // 2) + 1
+    # The first run also sees the start of an incomplete line, which it must hold back
+    growing.write_bytes(data[:middle + 10])
+    snapshots = tmp_path / "snapshots"
+    snapshots.mkdir()
+    monkeypatch.setattr(ld, "statistics_file", str(snapshots / "statistics.txt"))
+    monkeypatch.setattr(ld, "latency_json_file", str(snapshots / "latency.json"))
+    ld.run_follow(str(growing), snapshot_interval=3600, poll_interval=0.01, idle_timeout=0.05)
+
+    with open(growing, "ab") as dump_file:
+        dump_file.write(data[middle + 10:])
+    followed = ld.run_follow(str(growing), snapshot_interval=3600, poll_interval=0.01, resume=True, idle_timeout=0.05)
+    assert write_outputs(followed, tmp_path / "followed") == sequential
+    assert (snapshots / "statistics.txt").read_bytes() == sequential[0]
+
+
+def test_one_latency_sample_per_reply(tmp_path, range_table_dir):
+    from range_table import RangeTable
+
+    record = {"af": 4, "prb_id": 1, "src_addr": "45.1.0.1", "dst_addr": "192.168.0.1", "result": [
+        {"hop": 1, "result": [{"from": "77.1.0.1", "rtt": 10.0}, {"from": "103.1.0.1", "rtt": 20.0},
+                              {"from": "77.1.0.1", "rtt": 30.0}]},
+    ]}
+    dump = tmp_path / "one.json"
+    dump.write_text(json.dumps(record) + "\n")
+    ld.use_location_table(str(dump), 1, RangeTable(range_table_dir))
+    aggregator = ld.LatencyAggregator()
+    aggregator.process_raw_line(dump.read_bytes().rstrip())
+
+    latencies = {(city_a, city_b): list(pair["latencies"])
+                 for city_a, destinations in aggregator.labelled_latency_data().items()
+                 for city_b, pair in destinations.items()}
+    # The replies are followed in order, one sample each, even though the hop has only two distinct IPs
+    assert latencies == {
+        ("Berlin#Berlin#GDPR", "Tokyo#Tokyo#JP"): [5.0],
+        ("Tokyo#Tokyo#JP", "Sydney#New South Wales#AU"): [10.0],
+        ("Sydney#New South Wales#AU", "Tokyo#Tokyo#JP"): [15.0],
+    }
+    assert aggregator.total_latencies == 3
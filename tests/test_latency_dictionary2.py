@@ -0,0 +1,48 @@
+import pytest
+
+try:
+    import latency_dictionary2 as ld2
+except (ImportError, OSError) as error:
+    # Needs maxminddb and tqdm, and opens the GeoIP database at its configured path on import
+    pytest.skip(f"latency_dictionary2 cannot be loaded: {error}", allow_module_level=True)
+
+from sharding import compute_shards
+from traceroute_reader import read_traceroutes
+
+
+def write_outputs(aggregator, directory, monkeypatch):
+    """The statistics file and latency JSON of an aggregator, as bytes."""
+    directory.mkdir()
+    monkeypatch.setattr(ld2, "statistics_file", str(directory / "statistics.txt"))
+    monkeypatch.setattr(ld2, "latency_json_file", str(directory / "latency.json"))
+    aggregator.write_statistics_to_file()
+    aggregator.write_latency_data_to_json()
+    return (directory / "statistics.txt").read_bytes(), (directory / "latency.json").read_bytes()
+
+
+def test_merged_shards_match_sequential_run(traceroute_dump, tmp_path, monkeypatch):
+    aggregator = ld2.LatencyAggregator()
+    for line, data in read_traceroutes(traceroute_dump, with_line=True):
+        aggregator.process_traceroute_line(line, data)
+    sequential = write_outputs(aggregator, tmp_path / "sequential", monkeypatch)
+
+    aggregator = ld2.LatencyAggregator()
+    for start, end in compute_shards(traceroute_dump, 5):
+        aggregator.merge(ld2.process_shard((traceroute_dump, start, end)))
+    assert write_outputs(aggregator, tmp_path / "sharded", monkeypatch) == sequential
+
+
+def test_bogon_sets(tmp_path, monkeypatch):
+    ipv4_path, ipv6_path = tmp_path / "fullbogons-ipv4.txt", tmp_path / "fullbogons-ipv6.txt"
+    ipv4_path.write_text("0.0.0.0/8\n10.0.0.0/8\n100.64.0.0/10\n")
+    ipv6_path.write_text("2001:db8::/32\n")
+    monkeypatch.setattr(ld2, "bogon_ipv4_set", ld2.bogon_ipv4_set)
+    monkeypatch.setattr(ld2, "bogon_ipv6_set", ld2.bogon_ipv6_set)
+    ld2.load_bogon_sets(str(ipv4_path), str(ipv6_path))
+    ipv4_set, ipv6_set = ld2.get_bogon_sets()
+    assert [ld2.is_bogon_ip(ip, ipv4_set) for ip in ("10.1.2.3", "100.127.255.255", "100.128.0.0", "8.8.8.8")] == [
+        True, True, False, False]
+    assert ld2.is_bogon_ip("2001:db8::1", ipv6_set) and not ld2.is_bogon_ip("2001:db9::1", ipv6_set)
+    assert not ld2.is_bogon_ip("10.1.2.999", ipv4_set)
+    # A missing file leaves the set empty
+    assert len(ld2.load_bogon_ips(str(tmp_path / "missing.txt"))) == 0
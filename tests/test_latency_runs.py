@@ -0,0 +1,54 @@
+import math
+import random
+import statistics
+
+import latency_runs
+from latency_runs import iter_pair_statistics, list_runs, write_run
+
+
+def write_runs(run_dir, num_runs, seed=1):
+    """Write `num_runs` runs of random pairs and return all samples by pair."""
+    rng = random.Random(seed)
+    cities = ["Berlin#Berlin#DE", "Paris#IDF#FR", "Tokyo#TK#JP", "Sydney#NSW#AU"]
+    expected = {}
+    for _ in range(num_runs):
+        samples_by_pair = {}
+        for _ in range(rng.randint(1, 5)):
+            pair = tuple(rng.sample(cities, 2))
+            samples_by_pair.setdefault(pair, []).extend(
+                round(rng.uniform(1, 200), 2) for _ in range(rng.randint(1, 30)))
+        write_run(str(run_dir), samples_by_pair)
+        for pair, samples in samples_by_pair.items():
+            expected.setdefault(pair, []).extend(samples)
+    return expected
+
+
+def check_statistics(run_dir, expected):
+    results = list(iter_pair_statistics(str(run_dir), memory_budget=1 << 16))
+    assert [(city_a, city_b) for city_a, city_b, _ in results] == sorted(expected)
+    for city_a, city_b, stats in results:
+        samples = sorted(expected[(city_a, city_b)])
+        assert stats["count"] == len(samples)
+        assert stats["min_latency"] == samples[0]
+        assert stats["max_latency"] == samples[-1]
+        assert stats["median_latency"] == statistics.median(samples)
+        assert stats["percentile_95_latency"] == samples[math.ceil(0.95 * len(samples)) - 1]
+        assert stats["mode_latency"] == min(statistics.multimode(samples))
+
+
+def test_iter_pair_statistics(tmp_path):
+    expected = write_runs(tmp_path, 5)
+    check_statistics(tmp_path, expected)
+
+
+def test_iter_pair_statistics_merges_in_passes(tmp_path, monkeypatch):
+    monkeypatch.setattr(latency_runs, "MAX_MERGE_FAN_IN", 3)
+    expected = write_runs(tmp_path, 20)
+    check_statistics(tmp_path, expected)
+    assert len(list_runs(str(tmp_path))) <= 3
+
+
+def test_incomplete_runs_are_ignored(tmp_path):
+    expected = write_runs(tmp_path, 2)
+    (tmp_path / ("run-torn" + latency_runs.RUN_SUFFIX)).write_bytes(b"\0" * 64)
+    check_statistics(tmp_path, expected)
@@ -0,0 +1,146 @@
+import json
+import math
+import pickle
+import random
+import statistics
+
+import pytest
+
+import latency_stats
+from latency_stats import (SAMPLE_ENCODINGS, LatencyAccumulator, LatencySamples, LatencySketch, finalize_groups,
+                           flatten_groups, load_latencies, percentile_name)
+
+
+def sample_groups(seed=1):
+    """Groups of every small size, with ties, plus an empty group and a large one."""
+    rng = random.Random(seed)
+    groups = [[round(rng.uniform(0, 300), 1) for _ in range(size)] for size in range(1, 40)]
+    groups.append([])
+    groups.append([rng.choice((10.0, 20.0, 30.0)) for _ in range(500)])
+    groups.append([rng.expovariate(0.01) for _ in range(1001)])
+    rng.shuffle(groups)
+    return groups
+
+
+def nearest_rank(samples, q):
+    return sorted(samples)[math.ceil(q * len(samples)) - 1]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        if latency_stats.np is None:
+            pytest.skip("NumPy is not installed")
+    else:
+        monkeypatch.setattr(latency_stats, "np", None)
+    return request.param
+
+
+@pytest.mark.parametrize("encoding", SAMPLE_ENCODINGS)
+def test_accumulator_statistics_describe_stored_samples(encoding):
+    accumulator = LatencyAccumulator(encoding)
+    for latency in (12.3456, 0.004, 700.0, 12.3456, 5.55555):
+        accumulator.add(latency)
+    samples = list(accumulator.samples)
+    assert accumulator.minimum == min(samples)
+    assert accumulator.maximum == max(samples)
+    assert accumulator.total == pytest.approx(sum(samples))
+
+
+def test_fixed_point_samples_round_and_saturate():
+    samples = LatencySamples("fixed16", [12.346, 0.004, -1.0, 700.0])
+    assert samples.tolist() == [12.35, 0.0, 0.0, 655.35]
+    assert samples.nbytes == 8
+
+
+@pytest.mark.parametrize("encoding", SAMPLE_ENCODINGS)
+def test_samples_pickle(encoding):
+    samples = LatencySamples(encoding, [1.5, 2.25, 30.0])
+    restored = pickle.loads(pickle.dumps(samples))
+    assert restored.encoding == encoding
+    assert restored.tolist() == samples.tolist()
+
+
+def test_finalize_groups_matches_statistics(backend):
+    groups = sample_groups()
+    values, offsets = flatten_groups(groups)
+    results = finalize_groups(values, offsets, percentiles=(0.95,))
+    for index, group in enumerate(groups):
+        assert results["count"][index] == len(group)
+        if not group:
+            assert results["median"][index] is None or math.isnan(results["median"][index])
+            continue
+        assert results["min"][index] == min(group)
+        assert results["max"][index] == max(group)
+        assert results["mean"][index] == pytest.approx(statistics.fmean(group))
+        assert results["median"][index] == statistics.median(group)
+        assert results["mode"][index] == statistics.mode(group)
+        assert results[percentile_name(0.95)][index] == nearest_rank(group, 0.95)
+
+
+def test_finalize_groups_binned_mode(backend):
+    values, offsets = flatten_groups([[10.1, 10.4, 10.6, 20.2, 20.3], [5.0]])
+    modes = finalize_groups(values, offsets, statistics=("mode",), mode_bin_width=1.0)["mode"]
+    assert list(modes) == [10.5, 5.5]
+
+
+@pytest.mark.parametrize("encoding", SAMPLE_ENCODINGS)
+def test_merged_accumulators_match_sequential_run(encoding):
+    rng = random.Random(3)
+    latencies = [round(rng.uniform(0.1, 300), 3) for _ in range(1000)] + [42.0] * 30
+    rng.shuffle(latencies)
+    sequential = LatencyAccumulator(encoding)
+    for latency in latencies:
+        sequential.add(latency)
+
+    # As in a sharded run: one accumulator per shard, some of them empty, merged in shard order
+    merged = LatencyAccumulator(encoding)
+    for start, end in [(0, 0), (0, 300), (300, 301), (301, 301), (301, 1030)]:
+        shard = LatencyAccumulator(encoding)
+        for latency in latencies[start:end]:
+            shard.add(latency)
+        merged.merge(pickle.loads(pickle.dumps(shard)))
+
+    assert merged.samples.tolist() == sequential.samples.tolist()
+    expected = sequential.statistics()
+    result = merged.statistics()
+    if encoding == latency_stats.DEFAULT_SAMPLE_ENCODING:
+        assert result == expected
+    else:
+        assert result.pop("avg_latency") == pytest.approx(expected.pop("avg_latency"))
+        assert result == expected
+    assert result["mode_latency"] == 42.0 and result["count"] == 1030
+
+
+def test_sketch_quantiles_within_relative_accuracy():
+    rng = random.Random(4)
+    latencies = [rng.lognormvariate(3, 1.5) for _ in range(5000)] + [0.0] * 10
+    sketch = LatencySketch(0.01)
+    for latency in latencies:
+        sketch.add(latency)
+    ordered = sorted(latencies)
+    for q in (0.0, 0.01, 0.25, 0.5, 0.9, 0.99):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.01, abs=1e-6)
+    assert sketch.quantile(1.0) == max(latencies) and sketch.minimum == 0.0
+    assert sketch.mean == pytest.approx(statistics.fmean(latencies))
+    assert LatencySketch().quantile(0.5) is None and LatencySketch().statistics()["count"] == 0
+
+
+def test_sketch_merge_and_serialization():
+    rng = random.Random(5)
+    latencies = [rng.uniform(0.5, 400) for _ in range(2000)]
+    sequential = LatencySketch()
+    for latency in latencies:
+        sequential.add(latency)
+    merged = LatencySketch()
+    for start in range(0, len(latencies), 700):
+        shard = LatencySketch()
+        shard.merge(latencies[start:start + 700])
+        merged.merge(LatencySketch.from_dict(json.loads(json.dumps(shard.to_dict()))))
+    assert merged.bins == sequential.bins and merged.count == sequential.count
+    assert merged.statistics()["median_latency"] == sequential.statistics()["median_latency"]
+    assert pickle.loads(pickle.dumps(merged)).to_dict() == merged.to_dict()
+    assert load_latencies(merged.to_dict()).to_dict() == merged.to_dict()
+    with pytest.raises(ValueError, match="relative accuracy"):
+        merged.merge(LatencySketch(0.02))
@@ -0,0 +1,58 @@
+from location_registry import LocationRegistry, registry_path, remap_keys
+
+
+def test_ids_and_labels():
+    registry = LocationRegistry()
+    berlin = registry.city_id("Berlin", "Berlin", "GDPR")
+    tokyo = registry.city_id("Tokyo", "Tokyo", "JP")
+    assert (berlin, tokyo) == (1, 2)
+    assert registry.city_id("Berlin", "Berlin", "GDPR") == berlin
+    # A city is identified by its subdivision and country too
+    assert registry.city_id("Berlin", "New Hampshire", "US") == 3
+    assert registry.city_label(berlin) == "Berlin#Berlin#GDPR"
+    assert registry.country_label(registry.city_country(tokyo)) == "JP"
+    assert registry.country_id("JP") == registry.city_country(tokyo)
+
+
+def test_labels_round_trip():
+    registry = LocationRegistry()
+    for label in ("Paris#Ile-de-France#GDPR", "None#None#US", "Perth#None#AU", "A#B#C#D"):
+        assert registry.city_label(registry.city_id_of_label(label)) == label
+    assert registry.city_id_of_label("Perth#None#AU") == registry.city_id("Perth", None, "AU")
+    assert registry.country_label(registry.city_country(registry.city_id_of_label("A#B#C#D"))) == "D"
+
+
+def test_merge_and_remap():
+    registry = LocationRegistry()
+    registry.city_id("Berlin", "Berlin", "GDPR")
+    registry.city_id("Tokyo", "Tokyo", "JP")
+
+    # A worker interns the same cities in another order, and a new one
+    worker = LocationRegistry()
+    sydney = worker.city_id("Sydney", "New South Wales", "AU")
+    tokyo = worker.city_id("Tokyo", "Tokyo", "JP")
+    partial = {sydney: [1.0], tokyo: [2.0]}
+
+    city_ids, country_ids = registry.merge(worker)
+    assert city_ids[0] == 0 and country_ids[0] == 0
+    merged = remap_keys(partial, city_ids)
+    assert {registry.city_label(city_id): value for city_id, value in merged.items()} == {
+        "Sydney#New South Wales#AU": [1.0], "Tokyo#Tokyo#JP": [2.0]}
+    assert registry.country_label(country_ids[worker.country_id("AU")]) == "AU"
+    assert len(registry.cities) == 3 and len(registry.countries) == 3
+
+
+def test_save_and_load(tmp_path):
+    registry = LocationRegistry()
+    for label in ("Berlin#Berlin#GDPR", "Perth#None#AU", "Sydney#New South Wales#AU"):
+        registry.city_id_of_label(label)
+    path = registry_path(str(tmp_path / "latency.json"))
+    assert path.endswith("latency.json.registry.json")
+    registry.save(path)
+    loaded = LocationRegistry.load(path)
+    assert loaded.to_state() == registry.to_state()
+    assert [loaded.city_label(city_id) for city_id in range(1, 4)] == [
+        registry.city_label(city_id) for city_id in range(1, 4)]
+    # Loaded registries keep assigning new ids after the saved ones
+    assert loaded.city_id("Sydney", "New South Wales", "AU") == 3
+    assert loaded.city_id("Jakarta", "Jakarta", "ID") == 4
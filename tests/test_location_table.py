@@ -0,0 +1,146 @@
+import os
+
+import pytest
+
+# Needs maxminddb, through geolocation
+location_table = pytest.importorskip("location_table")
+
+from geolocation import Location  # noqa: E402
+from location_table import (LocationKeys, LocationTable, Place, collect_ips, load_location_table,  # noqa: E402
+                            location_table_path, resolver_signature)
+from traceroute_reader import read_traceroutes  # noqa: E402
+
+BERLIN = Place("Berlin", "Berlin", "DE")
+PARIS = Place("Paris", "Ile-de-France", "FR")
+TOKYO = Place("Tokyo", "Tokyo", "JP")
+
+
+class FakeLocator:
+    """Stands in for `GeoLocator`: every address is in Paris, and lookups are recorded."""
+
+    lookups = []
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def lookup(self, ip):
+        self.lookups.append(ip)
+        return Location(*PARIS, latitude=None, longitude=None, accuracy_radius=None, asn=None)
+
+    def flush(self):
+        pass
+
+
+@pytest.fixture
+def geoip_db(tmp_path, monkeypatch):
+    path = tmp_path / "GeoIP2-City.mmdb"
+    path.write_bytes(b"database")
+    monkeypatch.setattr(location_table, "GeoLocator", FakeLocator)
+    monkeypatch.setattr(location_table, "_chunk_locators", {})
+    monkeypatch.setattr(FakeLocator, "lookups", [])
+    return str(path)
+
+
+@pytest.fixture
+def range_table(range_table_dir):
+    from range_table import RangeTable
+    return RangeTable(range_table_dir)
+
+
+def test_location_ids():
+    table = LocationTable()
+    assert table.add("45.0.0.1", BERLIN) == 0
+    assert table.add("77.0.0.1", TOKYO) == 1
+    assert table.add("45.0.0.2", BERLIN) == 0
+    assert table.add("151.0.0.1", None) is None
+    assert len(table) == 2 and table.places == [BERLIN, TOKYO]
+    assert table.location_id("45.0.0.2") == 0
+    assert table.location_id("151.0.0.1") is None
+    # Without a locator, addresses the table does not cover are unknown
+    assert table.location_id("8.8.8.8") is None
+
+    table.locator = FakeLocator("unused")
+    assert table.location_id("8.8.8.8") == 2 and table.places[2] == PARIS
+
+
+def test_location_keys():
+    table = LocationTable()
+    for ip, place in [("45.0.0.1", BERLIN), ("77.0.0.1", TOKYO), ("8.0.0.1", Place(None, None, "US"))]:
+        table.add(ip, place)
+    keys = LocationKeys(table, lambda place: place.city)
+    # Ids are assigned in location order, from 1
+    assert keys.of_ip("77.0.0.1") == 2 and keys.of_ip("45.0.0.1") == 1
+    assert keys.values[1:] == ["Berlin", "Tokyo"]
+    # Locations without a key and unknown addresses have no id
+    assert keys.of_ip("8.0.0.1") is None
+    assert keys.of_ip("151.0.0.1") is None
+    # Locations added after the first lookup get their keys on first use
+    table.add("45.32.0.1", PARIS)
+    assert keys.of_ip("45.32.0.1") == 3
+    assert keys.id("Tokyo") == 2
+
+
+def test_collect_ips(traceroute_dump):
+    expected = set()
+    for data in read_traceroutes(traceroute_dump):
+        expected.update((data["src_addr"], data["dst_addr"]))
+        expected.update(reply["from"] for hop in data["result"] for reply in hop["result"] if "from" in reply)
+    assert collect_ips(traceroute_dump) == expected
+
+
+def test_range_table_resolution(traceroute_dump, geoip_db, range_table):
+    table = load_location_table(traceroute_dump, geoip_db, range_table=range_table)
+    assert table.ip_ids.keys() == collect_ips(traceroute_dump)
+    assert not FakeLocator.lookups
+    for ip, location_id in table.ip_ids.items():
+        expected = range_table.place(range_table.lookup([ip]).tolist()[0])
+        assert (None if location_id is None else table.places[location_id]) == expected
+    assert table.places[table.location_id(next(ip for ip in table.ip_ids if ip.startswith("77.")))] == TOKYO
+
+
+def test_table_is_reused(traceroute_dump, geoip_db, range_table, monkeypatch):
+    built = load_location_table(traceroute_dump, geoip_db, range_table=range_table)
+
+    def rebuild(*args, **kwargs):
+        raise AssertionError("The location table was rebuilt")
+
+    monkeypatch.setattr(location_table, "build_location_table", rebuild)
+    locator = FakeLocator(geoip_db)
+    loaded = load_location_table(traceroute_dump, geoip_db, locator=locator, range_table=range_table)
+    assert loaded.ip_ids == built.ip_ids and loaded.places == built.places
+    assert loaded.locator is locator
+    assert os.path.exists(location_table_path(traceroute_dump))
+
+
+def test_table_is_rebuilt_when_the_dump_changes(traceroute_dump, geoip_db, range_table):
+    load_location_table(traceroute_dump, geoip_db, range_table=range_table)
+    with open(traceroute_dump, "a") as dump_file:
+        dump_file.write('{"af": 4, "prb_id": 1, "src_addr": "203.9.9.9", "dst_addr": "77.9.9.9", "result": []}\n')
+    table = load_location_table(traceroute_dump, geoip_db, range_table=range_table)
+    assert table.places[table.location_id("203.9.9.9")] == Place("Jakarta", "Jakarta", "ID")
+
+
+def test_table_is_rebuilt_for_another_resolver(traceroute_dump, geoip_db, range_table):
+    by_range_table = load_location_table(traceroute_dump, geoip_db, range_table=range_table)
+    assert resolver_signature(geoip_db, range_table) != resolver_signature(geoip_db)
+
+    # The same dump and database, resolved with the database itself
+    by_database = load_location_table(traceroute_dump, geoip_db)
+    assert sorted(FakeLocator.lookups) == sorted(by_range_table.ip_ids)
+    assert by_database.places == [PARIS]
+
+    FakeLocator.lookups.clear()
+    by_range_table = load_location_table(traceroute_dump, geoip_db, range_table=range_table)
+    assert TOKYO in by_range_table.places and not FakeLocator.lookups
+
+
+def test_table_is_rebuilt_when_the_database_changes(traceroute_dump, geoip_db):
+    load_location_table(traceroute_dump, geoip_db)
+    looked_up = len(FakeLocator.lookups)
+    load_location_table(traceroute_dump, geoip_db)
+    assert len(FakeLocator.lookups) == looked_up
+
+    with open(geoip_db, "ab") as geoip_file:
+        geoip_file.write(b" update")
+    load_location_table(traceroute_dump, geoip_db)
+    assert len(FakeLocator.lookups) == 2 * looked_up
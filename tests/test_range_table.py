@@ -0,0 +1,48 @@
+import ipaddress
+import random
+
+import pytest
+
+# Needs numpy, and maxminddb through location_table
+range_table = pytest.importorskip("range_table")
+
+from conftest import RANGE_TABLE_NETWORKS  # noqa: E402
+from location_table import Place  # noqa: E402
+from range_table import UNKNOWN_LOCATION, RangeTable  # noqa: E402
+
+
+def expected_place(ip):
+    """The place of an address by a scan over the networks of the table."""
+    address = ipaddress.ip_address(ip)
+    for network, city, subdivision, country in RANGE_TABLE_NETWORKS:
+        network = ipaddress.ip_network(network)
+        if address.version == network.version and address in network:
+            return Place(city, subdivision, country)
+    return None
+
+
+def test_lookup_matches_network_scan(range_table_dir):
+    table = RangeTable(range_table_dir)
+    rng = random.Random(1)
+    ips = []
+    for network, *_ in RANGE_TABLE_NETWORKS:
+        network = ipaddress.ip_network(network)
+        # Both ends of every network and the addresses just outside
+        for value in (int(network.network_address) - 1, int(network.network_address),
+                      int(network.broadcast_address), int(network.broadcast_address) + 1):
+            ips.append(str(type(network.network_address)(value)))
+    ips += [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(2000)]
+    ips += [f"2001:{rng.getrandbits(16):x}::{rng.getrandbits(16):x}" for _ in range(200)]
+    ips += [str(ipaddress.IPv6Address(rng.getrandbits(128))) for _ in range(200)]
+
+    location_ids = table.lookup(ips).tolist()
+    assert [table.place(location_id) for location_id in location_ids] == [expected_place(ip) for ip in ips]
+    assert table.place(table.lookup(["45.31.255.255"])[0]) == Place("Berlin", "Berlin", "DE")
+    assert table.place(table.lookup(["45.32.0.0"])[0]) == Place("Paris", "Ile-de-France", "FR")
+
+
+def test_invalid_and_empty_lookups(range_table_dir):
+    table = RangeTable(range_table_dir)
+    assert table.lookup(["77.1.2.999", "", "not an address", "77.1.2.3"]).tolist()[:3] == [UNKNOWN_LOCATION] * 3
+    assert table.place(UNKNOWN_LOCATION) is None
+    assert len(table.lookup([])) == 0
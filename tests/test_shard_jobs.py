@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+import shard_jobs
+from shard_jobs import iter_partials, load_manifest, partial_path, run_reduce, run_worker, write_manifest
+from traceroute_reader import iter_raw_lines
+
+
+def count_lines(analysis, shard):
+    """Stand-in analysis: the number of lines of a shard."""
+    return {"lines": sum(1 for _ in iter_raw_lines(shard["file"], shard["start"], shard["end"]))}
+
+
+def test_manifest_shards(traceroute_dump, tmp_path):
+    manifest_path = str(tmp_path / "manifest.json")
+    manifest = write_manifest(manifest_path, "latency", traceroute_dump, 4, sample_encoding="fixed32")
+    assert load_manifest(manifest_path) == manifest
+    assert manifest["sample_encoding"] == "fixed32"
+    shards = manifest["shards"]
+    assert [shard["shard_id"] for shard in shards] == [0, 1, 2, 3]
+    assert shards[0]["start"] == 0 and shards[-1]["end"] == os.path.getsize(traceroute_dump)
+    assert all(shard["end"] == following["start"] for shard, following in zip(shards, shards[1:]))
+
+
+def test_manifest_max_lines(tmp_path):
+    dump = tmp_path / "dump.json"
+    dump.write_bytes(b'{"prb_id": 1}\n{broken\n' + b'{"prb_id": 2}\n' * 10)
+    manifest = write_manifest(str(tmp_path / "manifest.json"), "latency", str(dump), 3, max_lines=3)
+    # The malformed line does not count towards the limit
+    assert manifest["shards"][-1]["end"] == len(b'{"prb_id": 1}\n{broken\n' + b'{"prb_id": 2}\n' * 2)
+
+
+def test_worker_skips_finished_shards(traceroute_dump, tmp_path, monkeypatch):
+    calls = []
+
+    def process_shard(analysis, shard):
+        calls.append(shard["shard_id"])
+        return count_lines(analysis, shard)
+
+    monkeypatch.setattr(shard_jobs, "process_shard", process_shard)
+    manifest_path = str(tmp_path / "manifest.json")
+    manifest = write_manifest(manifest_path, "country-counts", traceroute_dump, 3)
+    partials_dir = str(tmp_path / "partials")
+
+    run_worker(manifest_path, [0, 2], partials_dir)
+    with pytest.raises(FileNotFoundError, match=r"\[1\]"):
+        list(iter_partials(manifest, partials_dir))
+    run_worker(manifest_path, [1, 2], partials_dir)
+    run_worker(manifest_path, [2], partials_dir, force=True)
+    assert calls == [0, 2, 1, 2]
+    assert not [name for name in os.listdir(partials_dir) if name.endswith(".tmp")]
+
+    partials = list(iter_partials(manifest, partials_dir))
+    assert sum(partial["lines"] for partial in partials) == sum(1 for _ in iter_raw_lines(traceroute_dump))
+    assert os.path.exists(partial_path(partials_dir, 2))
+
+
+def test_latency_reduce_matches_sequential_run(traceroute_dump, tmp_path, monkeypatch):
+    try:
+        import latency_dictionary
+    except (ImportError, OSError) as error:
+        pytest.skip(f"latency_dictionary cannot be loaded: {error}")
+    for name in ("location_table", "city_ids", "country_ids", "sketch_accuracy", "sample_encoding"):
+        monkeypatch.setattr(latency_dictionary, name, getattr(latency_dictionary, name))
+    monkeypatch.setattr(latency_dictionary, "checkpoint_file", str(tmp_path / "checkpoint.bin"))
+
+    aggregator = latency_dictionary.run_sequential(traceroute_dump, checkpoint_interval=0)
+    aggregator.write_statistics(str(tmp_path / "sequential.txt"))
+    aggregator.write_latency_json(str(tmp_path / "sequential.json"))
+
+    manifest_path = str(tmp_path / "manifest.json")
+    write_manifest(manifest_path, "latency", traceroute_dump, 4)
+    run_worker(manifest_path, [3, 1], str(tmp_path / "partials"))
+    run_worker(manifest_path, [0, 2], str(tmp_path / "partials"))
+    monkeypatch.setattr(latency_dictionary, "statistics_file", str(tmp_path / "reduced.txt"))
+    monkeypatch.setattr(latency_dictionary, "latency_json_file", str(tmp_path / "reduced.json"))
+    run_reduce(manifest_path, str(tmp_path / "partials"))
+    assert (tmp_path / "reduced.txt").read_bytes() == (tmp_path / "sequential.txt").read_bytes()
+    assert (tmp_path / "reduced.json").read_bytes() == (tmp_path / "sequential.json").read_bytes()
@@ -0,0 +1,122 @@
+from collections import defaultdict
+
+import pytest
+
+from sharding import compute_shards, merge_nested, to_plain
+from traceroute_reader import iter_raw_lines
+
+
+def write_lines(path, lines, newline="\n", trailing=True):
+    data = newline.join(lines) + (newline if trailing else "")
+    path.write_bytes(data.encode())
+    return str(path)
+
+
+def shard_lines(file_path, shards):
+    return [line for start, end in shards for line in iter_raw_lines(file_path, start, end)]
+
+
+@pytest.mark.parametrize("num_shards", [1, 2, 3, 7, 50])
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_shards_cover_every_line_once(tmp_path, num_shards, newline):
+    lines = [f'{{"prb_id": {i}, "pad": "{"x" * (i % 13)}"}}' for i in range(40)]
+    path = write_lines(tmp_path / "dump.json", lines, newline)
+    with open(path, "rb") as dump_file:
+        data = dump_file.read()
+    shards = compute_shards(path, num_shards)
+    assert shards[0][0] == 0 and shards[-1][1] == len(data)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(shards, shards[1:]))
+    # Every shard starts at the beginning of a line
+    assert all(start == 0 or data[start - 1:start] == b"\n" for start, _ in shards)
+    assert [line.rstrip(b"\r") for line in shard_lines(path, shards)] == [line.encode() for line in lines]
+
+
+def test_boundary_on_newline(tmp_path):
+    # Two lines of 10 bytes: the middle of the file is exactly the start of the second line
+    path = write_lines(tmp_path / "dump.json", ["a" * 9, "b" * 9])
+    assert compute_shards(path, 2) == [(0, 10), (10, 20)]
+
+
+def test_file_smaller_than_shard_count(tmp_path):
+    path = write_lines(tmp_path / "dump.json", ["1", "2", "3"])
+    shards = compute_shards(path, 100)
+    assert len(shards) == 3
+    assert shard_lines(path, shards) == [b"1", b"2", b"3"]
+
+
+def test_long_line_spans_shards(tmp_path):
+    path = write_lines(tmp_path / "dump.json", ["x" * 1000, "y"], trailing=False)
+    shards = compute_shards(path, 4)
+    assert shard_lines(path, shards) == [b"x" * 1000, b"y"]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "dump.json"
+    path.write_bytes(b"")
+    assert compute_shards(str(path), 4) == []
+
+
+def test_end_limits_the_shards(tmp_path):
+    lines = [f"line {i}" for i in range(20)]
+    path = write_lines(tmp_path / "dump.json", lines)
+    end = 8 * 7 + 3  # inside "line 8"; the first ten lines are 7 bytes long
+    shards = compute_shards(path, 3, end=end)
+    assert shards[-1][1] == end
+    # The line that starts before `end` is read to its end
+    assert shard_lines(path, shards) == [line.encode() for line in lines[:9]]
+
+
+def test_compressed_dump_is_rejected(tmp_path):
+    path = tmp_path / "dump.json.bz2"
+    path.write_bytes(b"")
+    with pytest.raises(ValueError, match="Compressed"):
+        compute_shards(str(path), 2)
+
+
+def test_merge_nested_adds_and_unions():
+    target = {"count": 1, "ips": {"a"}, "samples": [1.0], "nested": {"x": 1}, "name": None}
+    merge_nested(target, {"count": 2, "ips": {"b"}, "samples": [2.0], "nested": {"x": 1, "y": 5}, "name": "n"})
+    assert target == {"count": 3, "ips": {"a", "b"}, "samples": [1.0, 2.0], "nested": {"x": 2, "y": 5}, "name": "n"}
+
+
+def test_merge_nested_keeps_first_seen_key_order():
+    target = {}
+    for partial in ({"b": 1, "a": 1}, {"c": 1, "a": 1}, {"d": 1, "b": 1}):
+        merge_nested(target, partial)
+    assert list(target) == ["b", "a", "c", "d"]
+    assert target == {"b": 2, "a": 2, "c": 1, "d": 1}
+
+
+def test_merge_nested_into_defaultdict():
+    def new_stats():
+        return defaultdict(lambda: {"total": 0, "per_traceroute": defaultdict(int)})
+
+    target = new_stats()
+    target["DE"]["total"] += 1
+    target["DE"]["per_traceroute"][7] += 1
+    partial = new_stats()
+    partial["FR"]["total"] += 2
+    partial["DE"]["per_traceroute"][7] += 3
+    merge_nested(target, to_plain(partial))
+    assert to_plain(target) == {"DE": {"total": 1, "per_traceroute": {7: 4}},
+                                "FR": {"total": 2, "per_traceroute": {}}}
+    # New keys of a defaultdict target get fresh defaults that the partial is merged into
+    assert isinstance(target["FR"]["per_traceroute"], defaultdict)
+
+
+def test_merge_nested_partials_match_sequential():
+    lines = list(zip(["a", "b", "a", "c", "d", "b"], ["DE", "FR", "DE", "DE", "JP", "FR"]))
+
+    def aggregate(records):
+        stats = {"total": 0, "countries": defaultdict(lambda: {"count": 0, "ips": set()})}
+        for ip, country in records:
+            stats["total"] += 1
+            stats["countries"][country]["count"] += 1
+            stats["countries"][country]["ips"].add(ip)
+        return to_plain(stats)
+
+    merged = {"total": 0, "countries": defaultdict(lambda: {"count": 0, "ips": set()})}
+    for start in range(0, len(lines), 2):
+        merge_nested(merged, aggregate(lines[start:start + 2]))
+    assert to_plain(merged) == aggregate(lines)
+    assert list(merged["countries"]) == ["DE", "FR", "JP"]
@@ -0,0 +1,129 @@
+import bz2
+import os
+
+import pytest
+
+from traceroute_index import (build_index, count_lines, index_path, load_index, load_source_index,
+                              read_source_traceroutes, sample_lines)
+from traceroute_reader import iter_raw_lines, parse_line, read_traceroutes
+
+
+def write_lines(path, lines):
+    path.write_bytes(b"".join(line + b"\n" for line in lines))
+    return str(path)
+
+
+@pytest.fixture
+def lines():
+    return [b'{"prb_id": %d}' % number for number in range(100)]
+
+
+def test_index_offsets(tmp_path, lines):
+    dump = tmp_path / "dump.json"
+    dump.write_bytes(b"\n".join(lines[:3]) + b"\r\n\n" + b"\n".join(lines[3:]))
+    index = load_index(str(dump))
+    assert len(index) == count_lines(str(dump)) == len(lines)
+    assert os.path.exists(index_path(str(dump)))
+    # CRLF line endings are stripped; blank lines are not indexed
+    assert [index.line(number) for number in range(len(lines))] == lines
+    assert list(index.iter_lines([5, 1, 5])) == [lines[5], lines[1], lines[5]]
+
+
+def test_stale_index_is_rebuilt(tmp_path, lines):
+    dump = write_lines(tmp_path / "dump.json", lines)
+    build_index(dump)
+    assert len(load_index(dump, build=False)) == len(lines)
+
+    with open(dump, "ab") as dump_file:
+        dump_file.write(b'{"prb_id": 100}\n')
+    with pytest.raises(FileNotFoundError):
+        load_index(dump, build=False)
+    assert count_lines(dump) == len(lines) + 1
+    assert load_index(dump, build=False).line(len(lines)) == b'{"prb_id": 100}'
+
+
+def test_rewritten_dump_of_same_size(tmp_path, lines):
+    dump = write_lines(tmp_path / "dump.json", lines)
+    build_index(dump)
+    stat = os.stat(dump)
+    write_lines(tmp_path / "dump.json", list(reversed(lines)))
+    os.utime(dump, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert load_index(dump).line(0) == lines[-1]
+
+
+def test_sample_lines(tmp_path, lines):
+    dump = write_lines(tmp_path / "dump.json", lines)
+    sample = list(sample_lines(dump, 10, seed=3))
+    assert len(sample) == 10
+    # In file order, without repetitions, and the same for the same seed
+    assert sample == sorted(set(sample), key=lines.index)
+    assert list(sample_lines(dump, 10, seed=3)) == sample
+    assert list(sample_lines(dump, 10, seed=4)) != sample
+    assert list(sample_lines(dump, 0)) == lines
+    assert list(sample_lines(dump, 1000)) == lines
+
+
+def test_compressed_dump_uses_the_first_lines(tmp_path, lines):
+    dump = tmp_path / "dump.json.bz2"
+    dump.write_bytes(bz2.compress(b"".join(line + b"\n" for line in lines)))
+    assert list(sample_lines(str(dump), 5, seed=1)) == lines[:5]
+    assert count_lines(str(dump)) == len(lines)
+    with pytest.raises(ValueError, match="Compressed"):
+        build_index(str(dump))
+
+
+def country_of_first_octet(ip):
+    return {"45": "DE", "77": "JP", "103": "AU"}.get(ip.split(".")[0])
+
+
+@pytest.fixture
+def geoip_db(tmp_path):
+    path = tmp_path / "GeoIP2-City.mmdb"
+    path.write_bytes(b"database")
+    return str(path)
+
+
+def test_source_index_lines(traceroute_dump, geoip_db):
+    index = load_source_index(traceroute_dump, country_of_first_octet, geoip_db)
+    # Line numbers count every line of the dump, including the malformed ones
+    records = {number: parse_line(line) for number, line in enumerate(iter_raw_lines(traceroute_dump))
+               if not line.startswith(b"{broken")}
+    assert len(index.line_index) == 300 > len(records)
+
+    def matching(predicate, max_lines=0):
+        return [number for number, data in records.items() if predicate(data) and (not max_lines or number < max_lines)]
+
+    assert index.lines(countries=["DE", "AU"]) == matching(
+        lambda data: country_of_first_octet(data["src_addr"]) in ("DE", "AU"))
+    assert index.lines(countries=["JP"], prb_ids=range(1, 20), max_lines=150) == matching(
+        lambda data: country_of_first_octet(data["src_addr"]) == "JP" and data["prb_id"] < 20, 150)
+    assert index.lines(af=6) == []
+    assert index.lines() == list(range(len(index.line_index)))
+
+
+def test_read_source_traceroutes(traceroute_dump, geoip_db):
+    selected = list(read_source_traceroutes(traceroute_dump, ["JP"], country_of_first_octet, geoip_db,
+                                            fields=("src_addr", "prb_id")))
+    expected = [{"src_addr": data["src_addr"], "prb_id": data["prb_id"]}
+                for data in read_traceroutes(traceroute_dump, fields=("src_addr", "prb_id"))
+                if country_of_first_octet(data["src_addr"]) == "JP"]
+    assert selected and selected == expected
+
+
+def test_source_index_rebuilt_when_geoip_changes(traceroute_dump, geoip_db):
+    calls = []
+
+    def country_of(ip):
+        calls.append(ip)
+        return country_of_first_octet(ip)
+
+    load_source_index(traceroute_dump, country_of, geoip_db)
+    built_calls = len(calls)
+    assert built_calls
+    load_source_index(traceroute_dump, country_of, geoip_db)
+    assert len(calls) == built_calls
+
+    with open(geoip_db, "ab") as geoip_file:
+        geoip_file.write(b" update")
+    load_source_index(traceroute_dump, country_of, geoip_db)
+    assert len(calls) == 2 * built_calls
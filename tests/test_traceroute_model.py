@@ -0,0 +1,48 @@
+import pytest
+
+from traceroute_model import Hop, Traceroute
+
+HOP = {"hop": 3, "result": [
+    {"from": "45.1.2.3", "rtt": 1.0, "ttl": 60},
+    {"x": "*"},
+    {"from": "77.1.2.3", "rtt": 5.0},
+    {"from": "45.1.2.3", "rtt": 4.0},
+    {"from": "45.1.2.3"},
+    {"from": "45.1.2.3", "rtt": 2.5},
+]}
+
+
+def test_hop_collapses_replies_by_ip():
+    hop = Hop.from_record(HOP)
+    assert hop.index == 3
+    assert hop.ips == ("45.1.2.3", "77.1.2.3")
+    assert hop.counts == (4, 1)
+    assert hop.rtt_counts == (3, 1)
+    assert hop.min_rtts == (1.0, 5.0)
+    assert hop.median_rtts == (2.5, 5.0)
+    assert hop.attempts == 6
+    assert hop.rtt_sum == 12.5
+    assert hop.average_rtt() == pytest.approx(12.5 / 6)
+
+
+def test_hop_keeps_replies_in_order():
+    # One (ip, rtt) per reply with both, so the analyses can still record one sample per reply
+    assert Hop.from_record(HOP).replies == (("45.1.2.3", 1.0), ("77.1.2.3", 5.0), ("45.1.2.3", 4.0),
+                                            ("45.1.2.3", 2.5))
+
+
+def test_hop_without_replies():
+    hop = Hop.from_record({"hop": 1, "error": "network unreachable"})
+    assert (hop.ips, hop.counts, hop.replies, hop.attempts) == ((), (), (), 0)
+    assert hop.average_rtt() == 0
+    timeouts = Hop.from_record({"hop": 2, "result": [{"x": "*"}] * 3})
+    assert timeouts.ips == () and timeouts.attempts == 3
+
+
+def test_traceroute_from_projected_record():
+    traceroute = Traceroute.from_record({"src_addr": "45.0.0.1", "dst_addr": "77.0.0.1", "af": 4, "prb_id": 9,
+                                         "result": [{"hop": 1, "result": [{"from": "45.0.0.2", "rtt": 0.5}]}, HOP]})
+    assert (traceroute.src_addr, traceroute.dst_addr, traceroute.af, traceroute.prb_id) == (
+        "45.0.0.1", "77.0.0.1", 4, 9)
+    assert [hop.index for hop in traceroute.hops] == [1, 3]
+    assert Traceroute.from_record({}).hops == []
@@ -0,0 +1,172 @@
+import bz2
+import functools
+import json
+from itertools import islice
+
+import pytest
+
+import traceroute_reader
+from traceroute_reader import (follow_raw_lines, iter_raw_lines, iter_raw_lines_with_offsets, offset_after_records,
+                               open_traceroute_file, parse_traceroutes, peek_field, project_record, read_traceroutes)
+
+SEGMENT_SIZE = 20000
+
+
+def sample_lines(count=20000):
+    return [b'{"prb_id": %d, "pad": "%s"}' % (i, (b"%x" % (i * 2654435761 % 2 ** 64)) * (i % 7))
+            for i in range(count)]
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    """Segments of about 20 kB, so a small file is split over several workers."""
+    monkeypatch.setattr(traceroute_reader, "_bz2_segments",
+                        functools.partial(traceroute_reader._bz2_segments, segment_size=SEGMENT_SIZE))
+    monkeypatch.setattr(traceroute_reader, "BZ2_MAX_SEGMENT_SIZE", 4 * SEGMENT_SIZE)
+    monkeypatch.setattr(traceroute_reader, "BZ2_MAX_BYTES_IN_FLIGHT", 5 * SEGMENT_SIZE)
+
+
+def write_bz2(path, data, stream_size=None):
+    """Compress `data` into one stream, or into streams of `stream_size` bytes that split lines anywhere."""
+    if stream_size is None:
+        path.write_bytes(bz2.compress(data))
+    else:
+        path.write_bytes(b"".join(bz2.compress(data[i:i + stream_size]) for i in range(0, len(data), stream_size)))
+    return str(path)
+
+
+@pytest.mark.parametrize("stream_size", [30001, None], ids=["multi-stream", "single-stream"])
+def test_parallel_bz2_lines(tmp_path, small_segments, stream_size):
+    lines = sample_lines()
+    data = b"\n".join(lines) + b"\n"
+    path = write_bz2(tmp_path / "dump.json.bz2", data, stream_size)
+    with open_traceroute_file(path, workers=3) as file:
+        assert list(file) == [line + b"\n" for line in lines]
+
+
+def test_parallel_bz2_raw_lines(tmp_path, small_segments, monkeypatch):
+    monkeypatch.setattr(traceroute_reader.os, "cpu_count", lambda: 3)
+    lines = sample_lines()
+    # No trailing newline: the last line ends with the last stream
+    path = write_bz2(tmp_path / "dump.json.bz2", b"\n".join(lines), 12345)
+    assert list(iter_raw_lines(path, block_size=4096)) == lines
+
+
+TRACEROUTE = {
+    "af": 4, "prb_id": 7, "msm_id": 5001, "src_addr": "45.1.2.3", "dst_addr": "77.1.2.3", "from": "45.1.2.3",
+    "result": [
+        {"hop": 1, "result": [{"from": "45.1.2.1", "rtt": 1.5, "ttl": 64, "size": 28}, {"x": "*"}]},
+        {"hop": 2, "error": "network unreachable"},
+    ],
+}
+
+
+def write_bytes(tmp_path, data):
+    path = tmp_path / "dump.json"
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 7, 64, 4096])
+def test_lines_split_across_blocks(tmp_path, block_size):
+    lines = sample_lines(50)
+    path = write_bytes(tmp_path, b"\n".join(lines) + b"\n")
+    assert list(iter_raw_lines(path, block_size=block_size)) == lines
+
+
+@pytest.mark.parametrize("block_size", [1, 5, 4096])
+def test_trailing_line_without_newline(tmp_path, block_size):
+    path = write_bytes(tmp_path, b"first\nsecond\nlast")
+    assert list(iter_raw_lines(path, block_size=block_size)) == [b"first", b"second", b"last"]
+
+
+def test_blank_lines_and_crlf(tmp_path):
+    record = json.dumps(TRACEROUTE).encode()
+    path = write_bytes(tmp_path, b"\n\n" + record + b"\r\n\n" + record + b"\r\n\r\n")
+    # Empty lines are skipped; CRLF lines keep their carriage return, which JSON decoding ignores
+    assert list(iter_raw_lines(path, block_size=16)) == [record + b"\r", record + b"\r", b"\r"]
+    assert list(read_traceroutes(path, fields=None)) == [TRACEROUTE, TRACEROUTE]
+
+
+def test_byte_ranges_partition_lines(tmp_path):
+    lines = sample_lines(30)
+    data = b"\n".join(lines) + b"\n"
+    path = write_bytes(tmp_path, data)
+    offsets = [offset for offset, _ in iter_raw_lines_with_offsets(path)]
+    assert all(data[offset:].startswith(line) for offset, line in zip(offsets, lines))
+    # Whatever the split point, every line is read by exactly one of the two ranges
+    for split in range(len(data) + 1):
+        head = list(iter_raw_lines(path, 0, split, block_size=32))
+        tail = list(iter_raw_lines(path, split, block_size=32))
+        assert head + tail == lines
+        assert len(head) == sum(1 for offset in offsets if offset < split)
+
+
+def test_malformed_lines_are_skipped(tmp_path):
+    record = json.dumps(TRACEROUTE).encode()
+    path = write_bytes(tmp_path, b"{broken\n" + record + b"\nnot json\n" + record + b'\n{"prb_id": 1\n')
+    assert len(list(read_traceroutes(path))) == 2
+    assert offset_after_records(path, 1) == len(b"{broken\n" + record + b"\n")
+
+
+def test_field_projection():
+    record = project_record(TRACEROUTE)
+    assert record == {
+        "src_addr": "45.1.2.3", "dst_addr": "77.1.2.3", "af": 4, "prb_id": 7,
+        "result": [{"hop": 1, "result": [{"from": "45.1.2.1", "rtt": 1.5}, {}]}, {"hop": 2}],
+    }
+    assert project_record(TRACEROUTE, fields=("src_addr", "msm_id", "missing")) == {"src_addr": "45.1.2.3",
+                                                                                    "msm_id": 5001}
+    assert project_record(TRACEROUTE, hop_fields=("ttl",))["result"][0]["result"] == [{"ttl": 64}, {}]
+
+
+def test_parse_traceroutes_with_line_and_filter():
+    lines = [json.dumps(dict(TRACEROUTE, prb_id=prb_id)).encode() for prb_id in range(5)]
+    parsed = list(parse_traceroutes(lines, fields=("prb_id",), with_line=True,
+                                    line_filter=lambda line: b'"prb_id": 3' not in line))
+    assert parsed == [(line, {"prb_id": prb_id}) for prb_id, line in enumerate(lines) if prb_id != 3]
+
+
+def test_peek_field():
+    line = json.dumps(TRACEROUTE).encode()
+    assert peek_field(line, "src_addr") == "45.1.2.3"
+    assert peek_field(line, "prb_id") == 7
+    assert peek_field(line, "af") == 4
+    assert peek_field(line, "missing") is None
+    assert peek_field(b'{"prb_id": null, "src_addr": ["45.1.2.3"]}', "prb_id") is None
+    assert peek_field(b'{"src_addr": ["45.1.2.3"]}', "src_addr") is None
+    assert peek_field(b'{"src_addr" :  "45.1.2.3", "dst_addr":"77.1.2.3"}', "dst_addr") == "77.1.2.3"
+    assert peek_field(b'{"src_addr": "a\\"b"}', "src_addr") is None
+    assert peek_field(b'{"prb_id": -12}', "prb_id") == -12
+
+
+def test_peek_field_filter_matches_parsed_filter(traceroute_dump):
+    def source_in_45_0_0_0_8(line):
+        return (peek_field(line, "src_addr") or "").startswith("45.")
+
+    filtered = list(read_traceroutes(traceroute_dump, line_filter=source_in_45_0_0_0_8))
+    expected = [data for data in read_traceroutes(traceroute_dump) if data["src_addr"].startswith("45.")]
+    assert filtered and filtered == expected
+
+
+def test_follow_raw_lines(tmp_path):
+    path = write_bytes(tmp_path, b"a\nb")
+    lines = follow_raw_lines(path, poll_interval=0)
+    # The incomplete last line is held back until its newline is written
+    assert next(lines) == (0, b"a")
+    assert next(lines) is None
+    with open(path, "ab") as dump_file:
+        dump_file.write(b"c\n\nd\n")
+    assert [next(lines) for _ in range(3)] == [(2, b"bc"), (6, b"d"), None]
+    lines.close()
+
+    assert list(islice(follow_raw_lines(path, start=2, poll_interval=0), 2)) == [(2, b"bc"), (6, b"d")]
+
+
+def test_follow_raw_lines_truncated(tmp_path):
+    path = write_bytes(tmp_path, b"a\nb\n")
+    lines = follow_raw_lines(path, poll_interval=0)
+    assert [next(lines) for _ in range(3)] == [(0, b"a"), (2, b"b"), None]
+    write_bytes(tmp_path, b"a\n")
+    with pytest.raises(RuntimeError, match="truncated"):
+        next(lines)
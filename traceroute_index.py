@@ -0,0 +1,313 @@
+"""
+Sidecar line-offset index for traceroute dumps.
+
+The index stores the byte offset of every non-blank line of a dump in a file
+next to it (`<dump>.idx`). It is built with one sequential scan and rebuilt
+automatically when the dump's size or modification time changes. With it, the
+number of traceroutes is known without reading the dump, any line can be read
+with a single seek, and uniform random subsets can replace the
+"first N lines" limits of the analysis scripts.
+
+Index file layout: a header (magic, dump size, dump mtime in ns, line count)
+followed by the offsets as unsigned 64-bit integers in native byte order.
+
+A second, pickled sidecar (`<dump>.srcidx`) maps the source country, probe ID
+and address family of every traceroute to its line numbers, so analyses of a
+single source country only read and parse the matching traceroutes.
+"""
+import logging
+import os
+import pickle
+import random
+import struct
+from array import array
+
+from traceroute_reader import (HOP_FIELDS, TRACEROUTE_FIELDS, JSONDecodeError, is_compressed, iter_raw_lines,
+                               iter_raw_lines_with_offsets, parse_line, parse_traceroutes)
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"TRIDX001"
+_HEADER = struct.Struct("<8sQQQ")
+
+
+def index_path(file_path):
+    return file_path + INDEX_SUFFIX
+
+
+def file_signature(file_path):
+    """(size, mtime in ns) of a file, used to detect that a sidecar file is stale."""
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _read_header(path):
+    with open(path, "rb") as index_file:
+        header = index_file.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        return None
+    magic, size, mtime_ns, count = _HEADER.unpack(header)
+    if magic != INDEX_MAGIC:
+        return None
+    return size, mtime_ns, count
+
+
+def _is_fresh(file_path):
+    path = index_path(file_path)
+    if not os.path.exists(path):
+        return False
+    header = _read_header(path)
+    return header is not None and header[:2] == file_signature(file_path)
+
+
+class LineIndex:
+    """Byte offsets of the lines of one traceroute dump, with random access to them."""
+
+    def __init__(self, file_path, offsets):
+        self.file_path = file_path
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def line(self, line_number):
+        """Return one raw line (bytes, without the newline) by its position in the dump."""
+        return next(self.iter_lines([line_number]))
+
+    def iter_lines(self, line_numbers):
+        """Yield the raw lines at the given positions, in the order given."""
+        with open(self.file_path, "rb") as file:
+            for line_number in line_numbers:
+                file.seek(self.offsets[line_number])
+                yield file.readline().rstrip(b"\r\n")
+
+    def sample(self, size, seed=None):
+        """
+        Pick `size` line numbers uniformly at random without replacement.
+        They are returned in file order so the dump is read front to back.
+        """
+        size = min(size, len(self))
+        return sorted(random.Random(seed).sample(range(len(self)), size))
+
+    def read_traceroutes(self, line_numbers, fields=TRACEROUTE_FIELDS, hop_fields=HOP_FIELDS, with_line=False,
+                         line_filter=None):
+        """Like `traceroute_reader.read_traceroutes`, but only for the given lines."""
+        return parse_traceroutes(self.iter_lines(line_numbers), fields, hop_fields, with_line, line_filter)
+
+
+def build_index(file_path):
+    """
+    Scan a dump once, write its sidecar index and return it.
+
+    Raises:
+        ValueError: If the dump is compressed, since it cannot be read by offset.
+    """
+    if is_compressed(file_path):
+        raise ValueError(f"Compressed dumps cannot be indexed, decompress them first: {file_path}")
+    size, mtime_ns = file_signature(file_path)
+    offsets = array("Q", (offset for offset, _ in iter_raw_lines_with_offsets(file_path)))
+
+    path = index_path(file_path)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as index_file:
+        index_file.write(_HEADER.pack(INDEX_MAGIC, size, mtime_ns, len(offsets)))
+        offsets.tofile(index_file)
+    os.replace(temp_path, path)
+    logging.info(f"Indexed {len(offsets):,} lines of {file_path}")
+    return LineIndex(file_path, offsets)
+
+
+def load_index(file_path, build=True):
+    """
+    Load the sidecar index of a dump, building it first if it is missing or
+    stale and `build` is True.
+
+    Raises:
+        FileNotFoundError: If there is no up-to-date index and `build` is False.
+    """
+    if not _is_fresh(file_path):
+        if not build:
+            raise FileNotFoundError(f"No up-to-date index for {file_path}")
+        return build_index(file_path)
+    path = index_path(file_path)
+    offsets = array("Q")
+    with open(path, "rb") as index_file:
+        _, _, _, count = _HEADER.unpack(index_file.read(_HEADER.size))
+        offsets.fromfile(index_file, count)
+    return LineIndex(file_path, offsets)
+
+
+def count_lines(file_path):
+    """
+    Number of non-blank lines in a dump. Only the index header is read when the
+    index is up to date; otherwise the index is built first.
+    """
+    if is_compressed(file_path):
+        return sum(1 for _ in iter_raw_lines(file_path))
+    if _is_fresh(file_path):
+        return _read_header(index_path(file_path))[2]
+    return len(build_index(file_path))
+
+
+def sample_lines(file_path, max_lines, seed=None):
+    """
+    Yield a uniform random sample of `max_lines` raw lines of a dump, in file
+    order. The whole dump is read when `max_lines` is 0 or not smaller than
+    the number of lines. Compressed dumps cannot be indexed, so for them the
+    first `max_lines` lines are used instead.
+    """
+    if is_compressed(file_path):
+        if max_lines:
+            logging.warning(f"{file_path} is compressed; using the first {max_lines:,} lines instead of a random sample.")
+        for line_number, line in enumerate(iter_raw_lines(file_path)):
+            if max_lines and line_number >= max_lines:
+                return
+            yield line
+        return
+    index = load_index(file_path)
+    if not max_lines or max_lines >= len(index):
+        yield from iter_raw_lines(file_path)
+    else:
+        yield from index.iter_lines(index.sample(max_lines, seed))
+
+
+def sample_traceroutes(file_path, max_lines, seed=None, fields=TRACEROUTE_FIELDS, hop_fields=HOP_FIELDS,
+                       with_line=False):
+    """`sample_lines`, parsed and projected like `traceroute_reader.read_traceroutes`."""
+    return parse_traceroutes(sample_lines(file_path, max_lines, seed), fields, hop_fields, with_line)
+
+
+# --- Source index ---
+
+SOURCE_INDEX_SUFFIX = ".srcidx"
+
+
+def source_index_path(file_path):
+    return file_path + SOURCE_INDEX_SUFFIX
+
+
+class SourceIndex:
+    """
+    Line numbers of the traceroutes of one dump, grouped by the country of the
+    source address, the probe ID and the address family.
+    """
+
+    def __init__(self, line_index, by_country, by_probe, by_af):
+        self.line_index = line_index
+        self.by_country = by_country
+        self.by_probe = by_probe
+        self.by_af = by_af
+
+    def lines(self, countries=None, prb_ids=None, af=None, max_lines=0):
+        """
+        Return the sorted line numbers of the traceroutes that match every given
+        criterion (any of the listed countries / probes, and the address family).
+
+        Args:
+            countries (iterable, optional): ISO country codes of the source address.
+            prb_ids (iterable, optional): RIPE Atlas probe IDs.
+            af (int, optional): Address family, 4 or 6.
+            max_lines (int): Only consider the first `max_lines` lines of the dump; 0 = all.
+        """
+        selected = None
+        for index, keys in ((self.by_country, countries), (self.by_probe, prb_ids),
+                            (self.by_af, None if af is None else [af])):
+            if keys is None:
+                continue
+            matches = set()
+            for key in keys:
+                matches.update(index.get(key, ()))
+            selected = matches if selected is None else selected & matches
+        if selected is None:
+            selected = range(len(self.line_index))
+        return sorted(line for line in selected if not max_lines or line < max_lines)
+
+    def read_traceroutes(self, line_numbers, fields=TRACEROUTE_FIELDS, hop_fields=HOP_FIELDS, with_line=False,
+                         line_filter=None):
+        return self.line_index.read_traceroutes(line_numbers, fields, hop_fields, with_line, line_filter)
+
+
+def build_source_index(file_path, country_of, geoip_db_path):
+    """
+    Scan a dump once, resolving the country of every source address with
+    `country_of`, and write its source index next to it.
+
+    Args:
+        file_path (str): Path to the (uncompressed) traceroute dump.
+        country_of (callable): Maps an IP address to an ISO country code or None.
+        geoip_db_path (str): Database behind `country_of`; the index is rebuilt when it changes.
+    """
+    line_index = load_index(file_path)
+    by_country, by_probe, by_af = {}, {}, {}
+    source_countries = {}
+    # Line numbers match the line index: both count the non-blank lines of the dump
+    for line_number, line in enumerate(iter_raw_lines(file_path)):
+        try:
+            data = parse_line(line)
+        except JSONDecodeError:
+            continue
+        src_addr = data.get("src_addr")
+        if src_addr:
+            if src_addr not in source_countries:
+                source_countries[src_addr] = country_of(src_addr)
+            country = source_countries[src_addr]
+            if country:
+                by_country.setdefault(country, array("I")).append(line_number)
+        if data.get("prb_id") is not None:
+            by_probe.setdefault(data["prb_id"], array("I")).append(line_number)
+        if data.get("af") is not None:
+            by_af.setdefault(data["af"], array("I")).append(line_number)
+
+    state = {
+        "signature": file_signature(file_path),
+        "geoip_signature": file_signature(geoip_db_path),
+        "by_country": by_country,
+        "by_probe": by_probe,
+        "by_af": by_af,
+    }
+    path = source_index_path(file_path)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as index_file:
+        pickle.dump(state, index_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+    logging.info(f"Built source index for {file_path}: {len(by_country)} countries, {len(by_probe)} probes")
+    return SourceIndex(line_index, by_country, by_probe, by_af)
+
+
+def load_source_index(file_path, country_of, geoip_db_path):
+    """
+    Load the source index of a dump, rebuilding it if the dump or the GeoIP
+    database changed since it was built.
+    """
+    path = source_index_path(file_path)
+    if os.path.exists(path):
+        with open(path, "rb") as index_file:
+            state = pickle.load(index_file)
+        if (state["signature"] == file_signature(file_path)
+                and state["geoip_signature"] == file_signature(geoip_db_path)):
+            return SourceIndex(load_index(file_path), state["by_country"], state["by_probe"], state["by_af"])
+    return build_source_index(file_path, country_of, geoip_db_path)
+
+
+def read_source_traceroutes(file_path, countries, country_of, geoip_db_path, fields=TRACEROUTE_FIELDS,
+                            hop_fields=HOP_FIELDS, max_lines=0, sample=False, seed=None, line_filter=None):
+    """
+    Yield only the traceroutes whose source address is in one of `countries`,
+    using the source index. Callers should still check the source themselves:
+    for compressed dumps, which cannot be indexed, every traceroute is yielded.
+
+    Args:
+        max_lines (int): Only consider `max_lines` lines of the dump; 0 = all.
+        sample (bool): Take the `max_lines` lines as a uniform random sample
+            (see `sample_lines`) instead of the first `max_lines` lines.
+        seed (int, optional): Seed for the sample.
+        line_filter (callable, optional): Raw-line pre-filter, see `traceroute_reader.read_traceroutes`.
+    """
+    if is_compressed(file_path):
+        return parse_traceroutes(sample_lines(file_path, max_lines, seed), fields, hop_fields, line_filter=line_filter)
+    index = load_source_index(file_path, country_of, geoip_db_path)
+    if sample and max_lines and max_lines < len(index.line_index):
+        sampled = set(index.line_index.sample(max_lines, seed))
+        line_numbers = [line for line in index.lines(countries=countries) if line in sampled]
+    else:
+        line_numbers = index.lines(countries=countries, max_lines=max_lines)
+    return index.read_traceroutes(line_numbers, fields, hop_fields, line_filter=line_filter)
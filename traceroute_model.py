@@ -0,0 +1,105 @@
+"""
+Compact, normalized representation of a RIPE Atlas traceroute.
+
+A RIPE hop lists every reply separately, usually three replies from the same
+router. The analyses only need each distinct responding IP once per hop, with
+how often it answered and its RTTs, so a `Hop` collapses the replies by IP.
+GeoIP lookups and counter updates can then be done once per IP and weighted
+by its reply count instead of once per reply. The replies themselves are
+kept in order for the analyses that record one sample per reply.
+"""
+from statistics import median
+
+
+class Hop:
+    """
+    One hop of a traceroute, with its replies collapsed by responding IP.
+
+    Attributes:
+        index (int): Hop number ("hop" in the RIPE record), or None.
+        ips (tuple): Distinct responding IPs, in the order they first replied.
+        counts (tuple): Number of replies from each IP.
+        rtt_counts (tuple): Number of replies with an RTT from each IP.
+        min_rtts (tuple): Minimum RTT per IP, or None if it sent no RTT.
+        median_rtts (tuple): Median RTT per IP, or None if it sent no RTT.
+        attempts (int): Number of probes sent for the hop (replies and timeouts).
+        rtt_sum (float): Sum of all RTTs of the hop.
+        replies (tuple): (ip, rtt) of every reply with both, in reply order.
+    """
+    __slots__ = ("index", "ips", "counts", "rtt_counts", "min_rtts", "median_rtts", "attempts", "rtt_sum", "replies")
+
+    def __init__(self, index, ips, counts, rtt_counts, min_rtts, median_rtts, attempts, rtt_sum, replies=()):
+        self.index = index
+        self.ips = ips
+        self.counts = counts
+        self.rtt_counts = rtt_counts
+        self.min_rtts = min_rtts
+        self.median_rtts = median_rtts
+        self.attempts = attempts
+        self.rtt_sum = rtt_sum
+        self.replies = replies
+
+    @classmethod
+    def from_record(cls, hop):
+        """Build a hop from one entry of a RIPE "result" list."""
+        replies = hop.get("result", [])
+        counts = {}
+        rtts = {}
+        rtt_sum = 0
+        ip_rtts = []
+        for reply in replies:
+            ip = reply.get("from")
+            rtt = reply.get("rtt")
+            if rtt is not None:
+                rtt_sum += rtt
+            if not ip:
+                continue
+            counts[ip] = counts.get(ip, 0) + 1
+            if rtt is not None:
+                rtts.setdefault(ip, []).append(rtt)
+                ip_rtts.append((ip, rtt))
+        ips = tuple(counts)
+        return cls(
+            hop.get("hop"),
+            ips,
+            tuple(counts.values()),
+            tuple(len(rtts.get(ip, ())) for ip in ips),
+            tuple(min(rtts[ip]) if ip in rtts else None for ip in ips),
+            tuple(median(rtts[ip]) if ip in rtts else None for ip in ips),
+            len(replies),
+            rtt_sum,
+            tuple(ip_rtts),
+        )
+
+    def average_rtt(self):
+        """Sum of the RTTs divided by the number of attempts (timeouts count as attempts)."""
+        return self.rtt_sum / max(self.attempts, 1)
+
+    def __repr__(self):
+        return f"Hop({self.index}, {list(zip(self.ips, self.counts, self.min_rtts))})"
+
+
+class Traceroute:
+    """The fields of a traceroute used by the analyses, with its hops as `Hop` objects."""
+    __slots__ = ("src_addr", "dst_addr", "af", "prb_id", "hops")
+
+    def __init__(self, src_addr, dst_addr, af, prb_id, hops):
+        self.src_addr = src_addr
+        self.dst_addr = dst_addr
+        self.af = af
+        self.prb_id = prb_id
+        self.hops = hops
+
+    @classmethod
+    def from_record(cls, data):
+        """Build a traceroute from a (possibly projected) RIPE record."""
+        return cls(
+            data.get("src_addr"),
+            data.get("dst_addr"),
+            data.get("af"),
+            data.get("prb_id"),
+            [Hop.from_record(hop) for hop in data.get("result", [])],
+        )
+
+    def __repr__(self):
+        return f"Traceroute({self.src_addr} -> {self.dst_addr}, {len(self.hops)} hops)"
@@ -0,0 +1,429 @@
+"""
+Shared high-throughput reader for RIPE Atlas traceroute dumps.
+
+The dump is read in large binary blocks and split into lines without decoding
+to str. Each line is parsed with orjson when it is installed (falling back to
+the standard json module) and projected down to the fields an analysis needs.
+
+Dumps compressed with bzip2 (as published by RIPE), gzip or zstandard are
+decompressed on the fly, based on the file extension. Multi-stream bzip2 files
+(as written by pbzip2/lbzip2) are decoded in a process pool.
+"""
+import bz2
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+    _loads = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+except ImportError:  # orjson is optional; json.loads accepts bytes as well
+    _loads = json.loads
+    JSONDecodeError = json.JSONDecodeError
+
+try:
+    import zstandard
+except ImportError:  # only needed for .zst dumps
+    zstandard = None
+
+# Read size for each block of the dump
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Fields used by most of the analysis scripts
+TRACEROUTE_FIELDS = ("src_addr", "dst_addr", "af", "prb_id", "result")
+HOP_FIELDS = ("from", "rtt")
+
+# Compiled byte patterns used by `peek_field`, by field name
+_FIELD_PATTERNS = {}
+
+COMPRESSED_EXTENSIONS = (".bz2", ".gz", ".zst")
+
+# Start of every bzip2 stream: "BZh", the block size digit and the block header magic
+BZ2_STREAM_HEADER = re.compile(rb"BZh[1-9]\x31\x41\x59\x26\x53\x59")
+# Consecutive bzip2 streams are grouped into segments of at least this many
+# compressed bytes before they are handed to a decompression worker.
+BZ2_SEGMENT_SIZE = 2 * 1024 * 1024
+# Segments larger than this (a single large stream, e.g. plain `bzip2` output)
+# are not decoded in memory; the file is read sequentially from there instead.
+BZ2_MAX_SEGMENT_SIZE = 4 * BZ2_SEGMENT_SIZE
+# Decompressed bytes decoded ahead of the reader, estimated from the
+# compression ratio of the segments decoded so far.
+BZ2_MAX_BYTES_IN_FLIGHT = 256 * 1024 * 1024
+# Compression ratio assumed until the first segment has been decoded
+BZ2_INITIAL_RATIO = 10
+
+
+def is_compressed(file_path):
+    """True if the dump is compressed and therefore cannot be read by byte range."""
+    return file_path.endswith(COMPRESSED_EXTENSIONS)
+
+
+def open_traceroute_file(file_path, workers=None):
+    """
+    Open a traceroute dump for binary reading, decompressing it on the fly if
+    its name ends in .bz2, .gz or .zst.
+
+    Args:
+        file_path (str): Path to the traceroute dump.
+        workers (int, optional): Processes used to decode multi-stream bzip2
+            files; defaults to the number of CPUs. 1 disables the pool.
+    """
+    if file_path.endswith(".bz2"):
+        workers = workers or os.cpu_count() or 1
+        if workers > 1:
+            return io.BufferedReader(ParallelBZ2Reader(file_path, workers), buffer_size=DEFAULT_BLOCK_SIZE)
+        return bz2.open(file_path, "rb")
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, "rb")
+    if file_path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("Reading .zst dumps requires the zstandard package (pip install zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, "rb"), read_across_frames=True, closefd=True)
+    return open(file_path, "rb")
+
+
+def _bz2_segments(file_path, segment_size=BZ2_SEGMENT_SIZE, chunk_size=DEFAULT_BLOCK_SIZE):
+    """
+    Yield (start, end) byte ranges of a bzip2 file that each begin at a stream
+    header, scanning the compressed file once.
+
+    The header pattern can also occur inside compressed data, so a range is
+    not guaranteed to hold whole streams; `ParallelBZ2Reader` checks this.
+    """
+    file_size = os.path.getsize(file_path)
+    segment_start = 0
+    overlap = 9  # length of the header pattern minus one
+    with open(file_path, "rb") as file:
+        offset = 0
+        tail = b""
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            data = tail + chunk
+            base = offset - len(tail)
+            for match in BZ2_STREAM_HEADER.finditer(data):
+                stream_start = base + match.start()
+                if stream_start - segment_start >= segment_size:
+                    yield segment_start, stream_start
+                    segment_start = stream_start
+            offset += len(chunk)
+            tail = data[-overlap:]
+    if file_size > segment_start:
+        yield segment_start, file_size
+
+
+def _decompress_segment(segment):
+    """Worker entry point: decompress the bzip2 streams in one (file_path, start, end) range."""
+    file_path, start, end = segment
+    with open(file_path, "rb") as file:
+        file.seek(start)
+        return bz2.decompress(file.read(end - start))
+
+
+class ParallelBZ2Reader(io.RawIOBase):
+    """
+    Read-only stream over a bzip2 file whose streams are decoded in a process
+    pool. Segments are decoded ahead of the reader but returned in file order.
+
+    Segments are submitted while the estimated decompressed size of the
+    segments in flight stays below `BZ2_MAX_BYTES_IN_FLIGHT` (and at most two
+    per worker), so whatever the number of workers, the reader holds about
+    that much decoded data plus the segment being consumed: a few hundred MiB
+    for the RIPE dumps. With many workers this budget, not the CPU count, can
+    limit the decoding speed.
+
+    Single-stream files (plain `bzip2` output) and segments larger than
+    `BZ2_MAX_SEGMENT_SIZE` are decoded sequentially from the start of that
+    segment, at single-core speed. So is the rest of the file if a segment
+    fails to decode, because a header match was a false positive.
+    """
+
+    def __init__(self, file_path, workers):
+        self.file_path = file_path
+        self.workers = workers
+        self._chunks = self._iter_chunks()
+        self._chunk = memoryview(b"")
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._position >= len(self._chunk):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._chunk, self._position = memoryview(chunk), 0
+        size = min(len(buffer), len(self._chunk) - self._position)
+        buffer[:size] = self._chunk[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def close(self):
+        self._chunks.close()
+        super().close()
+
+    def _iter_chunks(self):
+        segments = _bz2_segments(self.file_path)
+        compressed = decompressed = 0
+        sequential_start = None
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            while True:
+                ratio = decompressed / compressed if compressed else BZ2_INITIAL_RATIO
+                in_flight = sum(size for _, size, _ in pending) * ratio
+                while sequential_start is None and len(pending) < 2 * self.workers and (
+                        not pending or in_flight < BZ2_MAX_BYTES_IN_FLIGHT):
+                    segment = next(segments, None)
+                    if segment is None:
+                        break
+                    start, end = segment
+                    if end - start > BZ2_MAX_SEGMENT_SIZE:
+                        sequential_start = start
+                        break
+                    pending.append((start, end - start, executor.submit(_decompress_segment, (self.file_path, start, end))))
+                    in_flight += (end - start) * ratio
+                if not pending:
+                    if sequential_start is None:
+                        return
+                    start = sequential_start
+                    logging.info(f"Decoding the bzip2 stream at byte {start} sequentially.")
+                    break
+                start, size, future = pending.popleft()
+                try:
+                    data = future.result()
+                except (OSError, EOFError, ValueError):
+                    for _, _, other in pending:
+                        other.cancel()
+                    logging.warning(f"Parallel bzip2 decoding failed at byte {start}, continuing sequentially.")
+                    break
+                compressed += size
+                decompressed += len(data)
+                yield data
+
+        with open(self.file_path, "rb") as file:
+            file.seek(start)
+            with bz2.BZ2File(file) as stream:
+                while True:
+                    block = stream.read(DEFAULT_BLOCK_SIZE)
+                    if not block:
+                        return
+                    yield block
+
+
+def iter_raw_lines(file_path, start=0, end=None, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Yield the raw lines (bytes, without the trailing newline) of a traceroute dump.
+
+    Only lines that begin inside the byte range [start, end) are returned, so
+    adjacent ranges never share or lose a line. Blank lines are skipped.
+
+    Args:
+        file_path (str): Path to the traceroute dump.
+        start (int): Byte offset at which to start reading.
+        end (int, optional): Byte offset at which to stop; None reads to EOF.
+        block_size (int): Number of bytes read per block.
+    """
+    for _, line in iter_raw_lines_with_offsets(file_path, start, end, block_size):
+        yield line
+
+
+def iter_raw_lines_with_offsets(file_path, start=0, end=None, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Same as `iter_raw_lines`, but yields (offset, line) tuples where offset is
+    the byte position of the first character of the line. For compressed
+    dumps the offsets refer to the decompressed data, and only `end` is
+    supported since the stream cannot be seeked.
+    """
+    if start > 0 and is_compressed(file_path):
+        raise ValueError(f"Cannot start reading a compressed dump at byte {start}: {file_path}")
+    with open_traceroute_file(file_path) as file:
+        position = start
+        if start > 0:
+            # A line belongs to the range in which it starts; if `start` falls
+            # inside a line, skip forward to the next one.
+            file.seek(start - 1)
+            if file.read(1) != b"\n":
+                position = start + len(file.readline())
+
+        pending = b""
+        while end is None or position < end:
+            block = file.read(block_size)
+            if not block:
+                break
+            lines = (pending + block).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if end is not None and position >= end:
+                    return
+                line_start = position
+                position += len(line) + 1
+                if line:
+                    yield line_start, line
+        if pending and (end is None or position < end):
+            yield position, pending
+
+
+def follow_raw_lines(file_path, start=0, poll_interval=1.0, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Yield (offset, line) tuples for the lines of a dump that is still being
+    appended to, like `tail -f`. Runs until the caller stops iterating.
+
+    Only complete lines are returned: a trailing line without its newline is
+    held back until the rest of it has been written. Whenever no new data is
+    available the generator yields None and then sleeps `poll_interval`
+    seconds, so the caller gets a chance to do periodic work.
+
+    Args:
+        file_path (str): Path to the (uncompressed) traceroute dump.
+        start (int): Byte offset of the first line to read; must be a line start.
+        poll_interval (float): Seconds to wait for new data.
+        block_size (int): Number of bytes read per block.
+    """
+    if is_compressed(file_path):
+        raise ValueError(f"Cannot follow a compressed dump: {file_path}")
+    with open(file_path, "rb") as file:
+        file.seek(start)
+        position = start
+        pending = b""
+        while True:
+            block = file.read(block_size)
+            if not block:
+                if os.path.getsize(file_path) < position + len(pending):
+                    raise RuntimeError(f"{file_path} was truncated while following it")
+                yield None
+                time.sleep(poll_interval)
+                continue
+            lines = (pending + block).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                line_start = position
+                position += len(line) + 1
+                if line:
+                    yield line_start, line
+
+
+def _field_pattern(field):
+    pattern = _FIELD_PATTERNS.get(field)
+    if pattern is None:
+        pattern = re.compile(rb'"' + re.escape(field.encode()) + rb'"\s*:\s*(?:"([^"\\]*)"|(-?\d+))')
+        _FIELD_PATTERNS[field] = pattern
+    return pattern
+
+
+def peek_field(line, field):
+    """
+    Extract a top-level string or integer field (e.g. "src_addr", "dst_addr",
+    "af", "prb_id") from a raw line without parsing the JSON.
+
+    This is a cheap pre-filter: it returns the first occurrence of the key, so
+    it should only be used for keys that do not also appear inside the hops.
+    Returns None if the field is missing or not a plain string/integer.
+    """
+    match = _field_pattern(field).search(line)
+    if match is None:
+        return None
+    if match.group(1) is not None:
+        return match.group(1).decode()
+    return int(match.group(2))
+
+
+def parse_line(line):
+    """Decode one JSON line (bytes or str) into a dict."""
+    return _loads(line)
+
+
+def project_record(data, fields=TRACEROUTE_FIELDS, hop_fields=HOP_FIELDS):
+    """
+    Keep only the requested fields of a parsed traceroute.
+
+    The shape of the original record is preserved, including absent keys, so
+    code written against `json.loads(line)` keeps working. When "result" is
+    requested, every hop is reduced to its own "result" list, and each reply
+    to `hop_fields`.
+    """
+    record = {field: data[field] for field in fields if field in data}
+    if "result" in record:
+        hops = []
+        for hop in record["result"]:
+            projected = {"hop": hop["hop"]} if "hop" in hop else {}
+            if "result" in hop:
+                projected["result"] = [
+                    {key: reply[key] for key in hop_fields if key in reply}
+                    for reply in hop["result"]
+                ]
+            hops.append(projected)
+        record["result"] = hops
+    return record
+
+
+def read_traceroutes(file_path, fields=TRACEROUTE_FIELDS, hop_fields=HOP_FIELDS,
+                     start=0, end=None, with_line=False, line_filter=None):
+    """
+    Yield traceroute records from a RIPE Atlas dump, reduced to `fields`.
+
+    Lines that are not valid JSON are logged at debug level and skipped.
+
+    Args:
+        file_path (str): Path to the traceroute dump.
+        fields (tuple): Top-level fields to keep; None keeps the full record.
+        hop_fields (tuple): Reply fields to keep inside each hop.
+        start (int): Byte offset at which to start reading.
+        end (int, optional): Byte offset at which to stop.
+        with_line (bool): If True, yield (raw_line, record) tuples.
+        line_filter (callable, optional): Called with each raw line before it is
+            parsed; lines for which it returns False are skipped without decoding
+            them (see `peek_field`).
+    """
+    return parse_traceroutes(iter_raw_lines(file_path, start, end), fields, hop_fields, with_line, line_filter)
+
+
+def parse_traceroutes(lines, fields=TRACEROUTE_FIELDS, hop_fields=HOP_FIELDS, with_line=False, line_filter=None):
+    """
+    Parse raw traceroute lines as `read_traceroutes` does, for lines that come
+    from somewhere other than a sequential scan (e.g. a line index).
+    """
+    for line in lines:
+        if line_filter is not None and not line_filter(line):
+            continue
+        try:
+            data = _loads(line)
+        except JSONDecodeError:
+            logging.debug("Skipping line that is not valid JSON.")
+            continue
+        record = project_record(data, fields, hop_fields) if fields is not None else data
+        if with_line:
+            yield line, record
+        else:
+            yield record
+
+
+def offset_after_records(file_path, max_records):
+    """
+    Return the byte offset just past the first `max_records` valid JSON lines,
+    or the file size if the file has fewer. Used to apply a record limit to a
+    byte range before it is split into shards.
+    """
+    count = 0
+    position = 0
+    for offset, line in iter_raw_lines_with_offsets(file_path):
+        if count >= max_records:
+            return offset
+        position = offset + len(line) + 1
+        try:
+            _loads(line)
+        except JSONDecodeError:
+            continue
+        count += 1
+    if is_compressed(file_path):
+        return position
+    with open(file_path, "rb") as file:
+        return file.seek(0, 2)